@@ -1,57 +1,83 @@
 import os
+import json
 import logging
+import time
+import uuid
 from datetime import datetime
-from flask import Flask, Blueprint, render_template, request, flash, redirect, url_for, jsonify
+from flask import Flask, Blueprint, Request, render_template, request, flash, redirect, url_for, jsonify
 from werkzeug.utils import secure_filename
-import fitz  # PyMuPDF
-from transformers import pipeline
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
 import re
 import nltk
 from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize, sent_tokenize
 from nltk.stem import WordNetLemmatizer
+from nltk.tokenize import sent_tokenize
 from textstat import flesch_kincaid_grade, flesch_reading_ease, automated_readability_index
-import spacy
-from collections import Counter
 import matplotlib
 matplotlib.use('Agg')  # Use non-interactive Agg backend
-import matplotlib.pyplot as plt
-import seaborn as sns
 import io
-import base64
-from wordcloud import WordCloud
+import tempfile
 from flask_cors import CORS
+from document import ParsedDocument
+from embedding_store import EmbeddingStore
+from instrumentation import Metrics, timings_block
+from jobs import JobQueue
+from model_registry import ModelRegistry
+from near_duplicates import NearDuplicateIndex
+from openvino_backend import (INFERENCE_BACKEND, INFERENCE_BACKENDS, export_path, load_sentence_encoder,
+                              load_sequence_classifier)
+from pdf_text import PdfPages
+from plots import chart_data, render_chart
+from preflight import DATA_DIR, HF_MODELS, hf_weights_bytes, model_versions, preflight, spacy_model_path
+from quantization import QUANTIZABLE_MODELS, approved_int8_path, directory_bytes, load_int8
+from result_cache import ResultCache, result_key
+from semantic_index import SemanticIndex
+from sentiment import classify_chunks, classify_documents
+from similarity import criteria_similarity
 
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Download required NLTK data
-print("Initializing NLTK data...")
-try:
-    nltk.download('punkt', quiet=True)
-    nltk.download('punkt_tab', quiet=True)
-    nltk.download('stopwords', quiet=True)
-    nltk.download('wordnet', quiet=True)
-    nltk.download('averaged_perceptron_tagger', quiet=True)
-    nltk.download('vader_lexicon', quiet=True)
-    nltk.download('brown', quiet=True)
-    logger.info("NLTK data downloaded successfully")
-except Exception as e:
-    logger.error(f"Failed to download NLTK data: {e}")
-    try:
-        nltk.download(['punkt', 'punkt_tab', 'stopwords', 'wordnet', 'averaged_perceptron_tagger', 'vader_lexicon', 'brown'])
-        logger.info("Successfully downloaded missing NLTK resources")
-    except Exception as e2:
-        logger.error(f"Failed to download NLTK resources after retry: {e2}")
-        raise Exception("Critical NLTK resources missing. Please run `nltk.download(['punkt', 'punkt_tab', 'stopwords', 'wordnet', 'averaged_perceptron_tagger', 'vader_lexicon', 'brown'])` manually.")
+# Check NLTK data and model snapshots in the local data directory (no network access)
+resources = preflight()
+
+if INFERENCE_BACKEND not in INFERENCE_BACKENDS:
+    raise RuntimeError(f"INFERENCE_BACKEND must be one of {', '.join(INFERENCE_BACKENDS)}, not {INFERENCE_BACKEND!r}")
+# Model snapshots and backend in use; part of every cache key so results never outlive the models
+MODEL_VERSIONS = {**model_versions(), 'inference_backend': INFERENCE_BACKEND}
+
+# INT8 models to use instead of FP32; each is used only once quantization.py has approved it for this snapshot
+QUANTIZED_MODELS = {}
+for name in (name.strip() for name in os.environ.get('QUANTIZED_MODELS', '').split(',') if name.strip()):
+    if name not in QUANTIZABLE_MODELS:
+        raise RuntimeError(f"QUANTIZED_MODELS may only list {', '.join(QUANTIZABLE_MODELS)}, not {name!r}")
+    path = approved_int8_path(name, MODEL_VERSIONS[name])
+    if path is None:
+        logger.warning(f"No approved INT8 model for {name}; using FP32 (run quantization.py --quantize)")
+    else:
+        QUANTIZED_MODELS[name] = path
+MODEL_VERSIONS['quantized'] = ','.join(sorted(QUANTIZED_MODELS))
+
+# Uploads up to this size stay in memory; larger ones spill to a uniquely named temp file in UPLOAD_FOLDER
+UPLOAD_SPILL_BYTES = int(os.environ.get('UPLOAD_SPILL_BYTES', 8 * 1024 * 1024))
+
+class UploadRequest(Request):
+    """Request that buffers file uploads in memory unless the request body is larger than UPLOAD_SPILL_BYTES"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length <= UPLOAD_SPILL_BYTES:
+            return io.BytesIO()
+        # Closed, and so deleted, when the request ends
+        suffix = os.path.splitext(secure_filename(filename or ''))[1]
+        if total_content_length is not None:
+            return tempfile.NamedTemporaryFile('w+b', dir=app.config['UPLOAD_FOLDER'], suffix=suffix)
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPILL_BYTES, mode='w+b', dir=app.config['UPLOAD_FOLDER'])
 
 # Initialize Flask app
 app = Flask(__name__)
+app.request_class = UploadRequest
 CORS(app)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
 app.config['UPLOAD_FOLDER'] = 'uploads'
@@ -62,94 +88,214 @@ app.config['ALLOWED_EXTENSIONS'] = {'pdf', 'txt', 'docx'}
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs('static/plots', exist_ok=True)
 
-# Global variables for models
-models = {
-    'sentence_transformer': None,
-    'sentiment_analyzer': None,
-    'text_classifier': None,
-    'question_answering': None,
-    'summarizer': None,
-    'nlp': None,
-    'lemmatizer': None,
-    'stopwords': None
-}
+# Models are loaded on first use; these are warmed in the background at startup.
+# The summarizer and question answering pipelines are registered but no route uses them yet.
+WARM_MODELS = [name.strip() for name in os.environ.get(
+    'WARM_MODELS', 'stopwords,lemmatizer,nlp,sentence_transformer,sentiment_analyzer'
+).split(',') if name.strip()]
+
+def load_sentence_transformer():
+    if INFERENCE_BACKEND == 'openvino':
+        return load_sentence_encoder(HF_MODELS['sentence_transformer'],
+                                     export_path('sentence_transformer', MODEL_VERSIONS['sentence_transformer']))
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(HF_MODELS['sentence_transformer'])
+
+def pipeline_loader(task, model, **kwargs):
+    """Loader for a transformers pipeline; transformers itself is only imported on first load"""
+    def load():
+        from transformers import pipeline
+        return pipeline(task, model=model, **kwargs)
+    return load
+
+def load_spacy():
+    import spacy
+    path = spacy_model_path()
+    if path is None:
+        raise RuntimeError("spaCy model not found locally")
+    return spacy.load(path)
+
+# Loaded models are evicted least recently used first to stay within this budget (0 = unlimited)
+MODEL_MEMORY_BUDGET_MB = int(os.environ.get('MODEL_MEMORY_BUDGET_MB', 0))
+# A model that failed to load is retried after this long, doubling per failure up to an hour
+MODEL_RETRY_SECONDS = float(os.environ.get('MODEL_RETRY_SECONDS', 60))
+
+def weights_size(name):
+    return lambda: hf_weights_bytes(HF_MODELS[name])
 
 class AssignmentAnalyzer:
     def __init__(self):
-        self.models = models
-        self.load_models()
-        
-    def load_models(self):
-        """Load all required models"""
-        print("Loading AI models...")
-        try:
-            self.models['sentence_transformer'] = SentenceTransformer('all-MiniLM-L6-v2')
-            logger.info("Sentence transformer loaded")
-            
-            self.models['sentiment_analyzer'] = pipeline(
+        self.models = ModelRegistry(memory_budget=MODEL_MEMORY_BUDGET_MB * 1024 * 1024,
+                                    retry_seconds=MODEL_RETRY_SECONDS)
+        self.register_models()
+
+    def register_models(self):
+        """Register all models with the registry without loading them"""
+        self.models.register('sentence_transformer', load_sentence_transformer,
+                             size_hint=weights_size('sentence_transformer'))
+        if INFERENCE_BACKEND == 'openvino':
+            sentiment_loader = lambda: load_sequence_classifier(
                 "sentiment-analysis",
-                model="cardiffnlp/twitter-roberta-base-sentiment-latest",
-                tokenizer="cardiffnlp/twitter-roberta-base-sentiment-latest",
-                model_kwargs={"use_safetensors": False}
-            )
-            logger.info("Sentiment analyzer loaded")
-            
-            self.models['text_classifier'] = pipeline(
-                "text-classification",
-                model="distilbert-base-uncased-finetuned-sst-2-english"
-            )
-            logger.info("Text classifier loaded")
-            
-            self.models['question_answering'] = pipeline(
-                "question-answering",
-                model="distilbert-base-cased-distilled-squad"
+                HF_MODELS['sentiment_analyzer'],
+                export_path('sentiment_analyzer', MODEL_VERSIONS['sentiment_analyzer'])
             )
-            logger.info("Question answering model loaded")
-            
-            self.models['summarizer'] = pipeline(
-                "summarization",
-                model="facebook/bart-large-cnn"
+        else:
+            sentiment_loader = pipeline_loader(
+                "sentiment-analysis",
+                HF_MODELS['sentiment_analyzer'],
+                tokenizer=HF_MODELS['sentiment_analyzer'],
+                model_kwargs={"use_safetensors": False}
             )
-            logger.info("Summarizer loaded")
-            
-            try:
-                self.models['nlp'] = spacy.load("en_core_web_sm")
-                logger.info("spaCy model loaded")
-            except Exception as e:
-                logger.warning(f"spaCy model not available: {e}")
-                self.models['nlp'] = None
-            
-            self.models['lemmatizer'] = WordNetLemmatizer()
-            self.models['stopwords'] = set(stopwords.words('english'))
-            
-        except Exception as e:
-            logger.error(f"Error loading models: {e}")
-            print(f"Error loading models: {e}")
+        self.models.register('sentiment_analyzer', sentiment_loader, size_hint=weights_size('sentiment_analyzer'))
+        self.models.register('text_classifier', pipeline_loader("text-classification", HF_MODELS['text_classifier']),
+                             size_hint=weights_size('text_classifier'))
+        self.models.register('question_answering', pipeline_loader("question-answering", HF_MODELS['question_answering']),
+                             size_hint=weights_size('question_answering'))
+        self.models.register('summarizer', pipeline_loader("summarization", HF_MODELS['summarizer']),
+                             size_hint=weights_size('summarizer'))
+        self.models.register('nlp', load_spacy)
+        # Small and used by every request; not worth evicting
+        self.models.register('lemmatizer', WordNetLemmatizer, pinned=True)
+        self.models.register('stopwords', lambda: set(stopwords.words('english')), pinned=True)
+        for name, path in QUANTIZED_MODELS.items():
+            self.models.register(name, lambda name=name, path=path: load_int8(name, path),
+                                 size_hint=lambda path=path: directory_bytes(path))
 
 analyzer = AssignmentAnalyzer()
 
+# Per-stage latency histograms and counts and model inference counts, served at /metrics
+metrics = Metrics()
+
+# Upper bound on submissions per /api/grade/batch request
+MAX_BATCH_SUBMISSIONS = int(os.environ.get('MAX_BATCH_SUBMISSIONS', 500))
+
+# Sentence and criteria embeddings persist across requests and worker processes
+embedding_store = EmbeddingStore(
+    os.environ.get('EMBEDDING_STORE_DIR', os.path.join(DATA_DIR, 'embeddings')),
+    max_entries=int(os.environ.get('EMBEDDING_STORE_MAX_ENTRIES', 200000))
+)
+
+# Grading jobs are queued in SQLite and run by a bounded pool of worker threads per process
+JOB_DB_PATH = os.environ.get('JOB_DB_PATH', os.path.join(DATA_DIR, 'jobs.sqlite'))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', 60))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+MAX_JOB_WAIT_SECONDS = 30
+
+# Graded responses are reused for repeated identical requests (retries, re-runs)
+result_cache = ResultCache(
+    max_entries=int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 1000)),
+    max_bytes=int(os.environ.get('RESULT_CACHE_MAX_BYTES', 256 * 1024 * 1024)),
+    directory=os.environ.get('RESULT_CACHE_DIR') or None,
+    max_disk_bytes=int(os.environ.get('RESULT_CACHE_MAX_DISK_BYTES', 1024 * 1024 * 1024))
+)
+# Chart data of /grade results, and each chart's PNG once it has been requested. It is kept
+# on disk by default: the plot URLs in a report may be served by a different worker process.
+plot_cache = ResultCache(
+    max_entries=int(os.environ.get('PLOT_CACHE_MAX_ENTRIES', 2000)),
+    max_bytes=int(os.environ.get('PLOT_CACHE_MAX_BYTES', 128 * 1024 * 1024)),
+    directory=os.environ.get('PLOT_CACHE_DIR', os.path.join(DATA_DIR, 'plots')),
+    max_disk_bytes=int(os.environ.get('PLOT_CACHE_MAX_DISK_BYTES', 512 * 1024 * 1024))
+)
+
+# Embeddings from another backend differ slightly, so they are stored separately
+EMBEDDING_MODEL_ID = HF_MODELS['sentence_transformer'] + ('' if INFERENCE_BACKEND == 'pytorch' else f"@{INFERENCE_BACKEND}")
+if 'sentence_transformer' in QUANTIZED_MODELS:
+    EMBEDDING_MODEL_ID = HF_MODELS['sentence_transformer'] + '@int8'
+
+# MinHash/LSH index of each assignment's submissions, for flagging copies (see near_duplicates.py)
+near_duplicates = NearDuplicateIndex(
+    os.environ.get('NEAR_DUPLICATE_DB_PATH', os.path.join(DATA_DIR, 'near_duplicates.sqlite')),
+    min_similarity=float(os.environ.get('NEAR_DUPLICATE_MIN_SIMILARITY', 0.5))
+)
+
+def timings_requested(data):
+    """Whether a request asked for a `timings` block, with "timings": true in its body or ?timings=1"""
+    return bool(data and data.get('timings')) or request.args.get('timings', '').lower() in ('1', 'true')
+
+def submission_ids(data):
+    """(assignment id, submission id) named by a request, or None; a submission without an id is given one"""
+    assignment_id = data.get('assignment_id')
+    if assignment_id in (None, ''):
+        return None
+    submission_id = data.get('submission_id')
+    return str(assignment_id), str(submission_id) if submission_id not in (None, '') else uuid.uuid4().hex
+
+def check_near_duplicates(assignment_id, items):
+    """Closest earlier submissions for each (submission id, text), or None for each if the index is unavailable"""
+    try:
+        with metrics.span('near_duplicates', submissions=len(items)):
+            return near_duplicates.check_many(assignment_id, items)
+    except Exception as e:
+        logger.warning(f"Near-duplicate check failed: {e}")
+        return [None] * len(items)
+
+# Sentence embeddings of each assignment's submissions, for searching a class by meaning (see semantic_index.py)
+semantic_index = SemanticIndex(
+    os.environ.get('SEMANTIC_INDEX_PATH', os.path.join(DATA_DIR, 'semantic_index.sqlite')),
+    max_cached_bytes=int(os.environ.get('SEMANTIC_INDEX_MAX_CACHED_BYTES', 512 * 1024 * 1024))
+)
+MAX_SEARCH_RESULTS = 100
+
+def index_sentences(assignment_id, items):
+    """Add each (submission id, text) to the assignment's semantic index; failures are logged, not raised"""
+    if not analyzer.models['sentence_transformer']:
+        return
+    try:
+        with metrics.span('indexing', submissions=len(items)):
+            for submission_id, text in items:
+                # The same sentences analyze_semantic_content encoded, so their embeddings come from the store
+                sentences = sent_tokenize(preprocess_text(text))
+                if sentences:
+                    semantic_index.add(assignment_id, EMBEDDING_MODEL_ID, submission_id, sentences,
+                                       encode_texts(sentences))
+                    metrics.count(sentences=len(sentences))
+    except Exception as e:
+        logger.warning(f"Semantic indexing failed: {e}")
+
+def encode_texts(texts):
+    """Sentence transformer embeddings, encoding only texts not already in the embedding store"""
+    model = metrics.counted(analyzer.models['sentence_transformer'], 'sentence_transformer')
+    return embedding_store.encode(model, EMBEDDING_MODEL_ID, texts)
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
-def extract_text_from_file(filepath):
-    """Extract text from various file formats"""
-    _, ext = os.path.splitext(filepath)
+def upload_source(file):
+    """An uploaded file's bytes if it is held in memory, or the path of the temp file it spilled to"""
+    stream = file.stream
+    name = getattr(stream, 'name', None)
+    if isinstance(name, str) and os.path.isfile(name):
+        stream.flush()
+        return name
+    stream.seek(0)
+    return stream.read()
+
+def extract_text_from_file(source, filename=None):
+    """Extract text from a TXT or DOCX file, given a path or the file's bytes and its name.
+
+    PDFs go through extract_clean_text, which streams their pages.
+    """
+    in_memory = isinstance(source, (bytes, bytearray))
+    label = filename or source
+    _, ext = os.path.splitext(filename or source)
     ext = ext.lower()
     
     try:
-        if ext == '.pdf':
-            return extract_text_from_pdf(filepath)
-        elif ext == '.txt':
-            with open(filepath, 'r', encoding='utf-8') as f:
-                text = f.read()
-                logger.info(f"Extracted {len(text)} characters from TXT file: {filepath}")
-                return text
+        if ext == '.txt':
+            if in_memory:
+                text = source.decode('utf-8')
+            else:
+                with open(source, 'r', encoding='utf-8') as f:
+                    text = f.read()
+            logger.info(f"Extracted {len(text)} characters from TXT file: {label}")
+            return text
         elif ext == '.docx':
             try:
                 import docx
-                doc = docx.Document(filepath)
+                doc = docx.Document(io.BytesIO(source) if in_memory else source)
                 text = '\n'.join([paragraph.text for paragraph in doc.paragraphs if paragraph.text.strip()])
-                logger.info(f"Extracted {len(text)} characters from DOCX file: {filepath}")
+                logger.info(f"Extracted {len(text)} characters from DOCX file: {label}")
                 return text
             except ImportError:
                 logger.error("python-docx not installed")
@@ -158,63 +304,82 @@ def extract_text_from_file(filepath):
             logger.error(f"Unsupported file extension: {ext}")
             return ""
     except Exception as e:
-        logger.error(f"Error extracting text from {filepath}: {e}")
+        logger.error(f"Error extracting text from {label}: {e}")
         return ""
 
-def extract_text_from_pdf(pdf_path):
-    """Extract text from PDF file"""
-    text = ""
+def extract_clean_text(source, filename=None):
+    """Preprocessed text of an uploaded file, and the PDF extraction summary (None for other formats).
+
+    PDF pages are preprocessed one at a time as they are extracted, so the
+    raw text of the whole document is never held at once.
+    """
+    _, ext = os.path.splitext(filename or source)
+    if ext.lower() != '.pdf':
+        return preprocess_text(extract_text_from_file(source, filename)), None
     try:
-        with fitz.open(pdf_path) as doc:
-            for page in doc:
-                page_text = page.get_text()
-                if page_text.strip():
-                    text += page_text + "\n"
-        logger.info(f"Extracted {len(text)} characters from PDF: {pdf_path}")
-        return text.strip()
+        pages = PdfPages(source)
+        text = preprocess_pages(pages)
+        logger.info(f"Extracted {pages.characters} characters from PDF: {filename or source}")
+        return text, pages.summary()
     except Exception as e:
         logger.error(f"Error extracting text from PDF: {e}")
-        return ""
+        return "", None
 
-def preprocess_text(text):
-    """Advanced text preprocessing"""
-    if not text:
-        return ""
+def _clean(text):
     text = re.sub(r'\s+', ' ', text).strip()
     text = re.sub(r'[^\w\s\.\!\?\,\;\:\-\(\)\"\']', '', text)
     text = re.sub(r'\b([a-z])([A-Z])', r'\1 \2', text)
     text = re.sub(r'\btriad\b', 'triad_word', text, flags=re.IGNORECASE)
-    logger.info(f"Preprocessed text length: {len(text)}")
     return text
 
-def analyze_writing_style(text):
+def preprocess_text(text):
+    """Advanced text preprocessing"""
+    if not text:
+        return ""
+    text = _clean(text)
+    logger.debug(f"Preprocessed text length: {len(text)}")
+    return text
+
+def preprocess_pages(pages):
+    """preprocess_text of the pages joined by newlines, cleaning each page as it arrives"""
+    # Whitespace runs, page breaks included, collapse to one space, so cleaning pages
+    # separately and joining them with a space gives the same text
+    text = ' '.join(_clean(page) for page in pages)
+    logger.debug(f"Preprocessed text length: {len(text)}")
+    return text
+
+def parse_document(text):
+    """Tokenize a submission once for all metric functions"""
+    doc = ParsedDocument(text, analyzer.models['stopwords'] or ())
+    metrics.count(characters=len(text), sentences=doc.sentence_count, tokens=len(doc.tokens))
+    return doc
+
+def analyze_writing_style(doc):
     """Analyze writing style and quality"""
-    if not text.strip():
+    if not doc.text.strip():
         logger.warning("Empty text in analyze_writing_style")
         return {}
     
-    sentences = sent_tokenize(text)
-    words = word_tokenize(text.lower())
-    content_words = [word for word in words if word.isalnum() and word not in analyzer.models['stopwords']]
+    content_words = doc.content_words
     
     style_metrics = {
-        'avg_sentence_length': np.mean([len(word_tokenize(s)) for s in sentences]) if sentences else 0,
-        'sentence_length_variance': np.var([len(word_tokenize(s)) for s in sentences]) if sentences else 0,
-        'lexical_diversity': len(set(content_words)) / len(content_words) if content_words else 0,
-        'word_frequency_distribution': Counter(content_words).most_common(10),
+        'avg_sentence_length': np.mean(doc.sentence_lengths) if doc.sentences else 0,
+        'sentence_length_variance': np.var(doc.sentence_lengths) if doc.sentences else 0,
+        'lexical_diversity': len(doc.content_word_counts) / len(content_words) if content_words else 0,
+        'word_frequency_distribution': doc.content_word_counts.most_common(10),
         'complex_words': len([w for w in content_words if len(w) > 6]),
         'simple_words': len([w for w in content_words if len(w) <= 6]),
-        'paragraph_count': len([p for p in text.split('\n\n') if p.strip()]),
-        'transition_words': count_transition_words(text),
-        'passive_voice_count': count_passive_voice(text),
-        'question_count': text.count('?'),
-        'exclamation_count': text.count('!')
+        'paragraph_count': len(doc.paragraphs),
+        'transition_words': count_transition_words(doc),
+        'passive_voice_count': count_passive_voice(doc),
+        'question_count': doc.text.count('?'),
+        'exclamation_count': doc.text.count('!')
     }
     
-    logger.info(f"Writing style metrics: {style_metrics}")
+    logger.debug(f"Writing style metrics: {style_metrics}")
     return style_metrics
 
-def count_transition_words(text):
+def count_transition_words(doc):
     """Count transition words in text"""
     transition_words = [
         'however', 'therefore', 'furthermore', 'moreover', 'additionally',
@@ -222,75 +387,94 @@ def count_transition_words(text):
         'similarly', 'likewise', 'conversely', 'alternatively', 'specifically',
         'particularly', 'especially', 'notably', 'importantly', 'significantly'
     ]
-    text_lower = text.lower()
-    count = sum(1 for word in transition_words if word in text_lower)
-    logger.info(f"Transition words count: {count}")
+    count = sum(1 for word in transition_words if word in doc.lower)
+    logger.debug(f"Transition words count: {count}")
     return count
 
-def count_passive_voice(text):
+def count_passive_voice(doc):
     """Count passive voice instances"""
     if not analyzer.models['nlp']:
         logger.warning("spaCy model not available for passive voice analysis")
         return 0
     
-    doc = analyzer.models['nlp'](text)
-    passive_count = sum(1 for sent in doc.sents for token in sent if token.dep_ == "nsubjpass")
-    logger.info(f"Passive voice count: {passive_count}")
+    passive_count = sum(
+        1 for parsed in doc.spacy_docs(metrics.counted(analyzer.models['nlp'], 'nlp'))
+        for token in parsed if token.dep_ == "nsubjpass"
+    )
+    logger.debug(f"Passive voice count: {passive_count}")
     return passive_count
 
-def analyze_semantic_content(text, criteria):
-    """Analyze semantic content using sentence transformers"""
-    if not analyzer.models['sentence_transformer'] or not text.strip() or not criteria:
-        logger.warning(f"Semantic analysis skipped: model={analyzer.models['sentence_transformer'] is not None}, text={bool(text.strip())}, criteria={bool(criteria)}")
+def analyze_semantic_content(doc, criteria, criteria_embeddings=None, sentence_embeddings=None):
+    """Analyze semantic content using sentence transformers, optionally with precomputed embeddings"""
+    if not analyzer.models['sentence_transformer'] or not doc.text.strip() or not criteria:
+        logger.warning(f"Semantic analysis skipped: model={analyzer.models['sentence_transformer'] is not None}, text={bool(doc.text.strip())}, criteria={bool(criteria)}")
         return {}
     
     try:
-        sentences = sent_tokenize(text)
+        sentences = doc.sentences
         if not sentences:
             logger.warning("No sentences found in text")
             return {}
+        metrics.count(sentences=len(sentences), criteria=len(criteria))
         
-        sentence_embeddings = analyzer.models['sentence_transformer'].encode(sentences)
-        criteria_embeddings = analyzer.models['sentence_transformer'].encode(criteria)
-        logger.info(f"Sentence embeddings shape: {sentence_embeddings.shape}")
-        logger.info(f"Criteria embeddings shape: {criteria_embeddings.shape}")
+        if sentence_embeddings is None:
+            sentence_embeddings = encode_texts(sentences)
+        if criteria_embeddings is None:
+            criteria_embeddings = encode_texts(criteria)
+        logger.debug(f"Sentence embeddings shape: {sentence_embeddings.shape}")
+        logger.debug(f"Criteria embeddings shape: {criteria_embeddings.shape}")
+        
+        max_sims, mean_sims, top_indices, top_sims = criteria_similarity(criteria_embeddings, sentence_embeddings)
         
         semantic_analysis = {}
         for i, criterion in enumerate(criteria):
-            similarities = cosine_similarity([criteria_embeddings[i]], sentence_embeddings)[0]
-            top_indices = np.argsort(similarities)[-3:][::-1]
-            relevant_sentences = [sentences[idx] for idx in top_indices if similarities[idx] > 0.3]
+            relevant_sentences = [sentences[idx] for idx, sim in zip(top_indices[i], top_sims[i]) if sim > 0.3]
             
             semantic_analysis[criterion] = {
-                'max_similarity': float(np.max(similarities)),
-                'avg_similarity': float(np.mean(similarities)),
+                'max_similarity': float(max_sims[i]),
+                'avg_similarity': float(mean_sims[i]),
                 'relevant_sentences': relevant_sentences[:2],
-                'coverage_score': float(np.max(similarities))
+                'coverage_score': float(max_sims[i])
             }
         
-        logger.info(f"Semantic analysis: {semantic_analysis}")
+        logger.debug(f"Semantic analysis: {semantic_analysis}")
         return semantic_analysis
     except Exception as e:
         logger.error(f"Error in analyze_semantic_content: {str(e)}")
         return {}
 
-def analyze_sentiment_and_tone(text):
-    """Analyze sentiment and tone of the text"""
-    if not analyzer.models['sentiment_analyzer']:
-        logger.warning("Sentiment analyzer not loaded")
-        return {}
+def analyze_semantic_content_batch(docs, criteria):
+    """Semantic analysis of many submissions against shared criteria, encoding all sentences in one call"""
+    if not analyzer.models['sentence_transformer'] or not criteria:
+        return [analyze_semantic_content(doc, criteria) for doc in docs]
     
-    chunks = [text[i:i+500] for i in range(0, len(text), 500)]
-    sentiments = []
+    try:
+        criteria_embeddings = encode_texts(criteria)
+        sentence_embeddings = encode_texts([sentence for doc in docs for sentence in doc.sentences])
+    except Exception as e:
+        logger.error(f"Error encoding batch for semantic analysis: {str(e)}")
+        return [{} for _ in docs]
     
-    for chunk in chunks:
-        if chunk.strip():
-            try:
-                result = analyzer.models['sentiment_analyzer'](chunk)
-                sentiments.append(result[0])
-            except Exception as e:
-                logger.warning(f"Sentiment analysis failed for chunk: {e}")
-                continue
+    results, start = [], 0
+    for doc in docs:
+        end = start + len(doc.sentences)
+        results.append(analyze_semantic_content(doc, criteria, criteria_embeddings, sentence_embeddings[start:end]))
+        start = end
+    return results
+
+def analyze_sentiment_and_tone(doc, sentiments=None):
+    """Analyze sentiment and tone of the text, optionally from precomputed chunk sentiments"""
+    if sentiments is None:
+        if not analyzer.models['sentiment_analyzer']:
+            logger.warning("Sentiment analyzer not loaded")
+            return {}
+        
+        try:
+            sentiments = classify_chunks(metrics.counted(analyzer.models['sentiment_analyzer'], 'sentiment_analyzer'),
+                                         doc.sentences)
+        except Exception as e:
+            logger.warning(f"Sentiment analysis failed: {e}")
+            sentiments = []
     
     if not sentiments:
         logger.warning("No valid sentiment analysis results")
@@ -303,6 +487,7 @@ def analyze_sentiment_and_tone(text):
     }
     
     total_chunks = len(sentiments)
+    metrics.count(chunks=total_chunks)
     sentiment_distribution = {
         'positive_ratio': sentiment_scores['positive'] / total_chunks if total_chunks else 0,
         'neutral_ratio': sentiment_scores['neutral'] / total_chunks if total_chunks else 0,
@@ -310,9 +495,23 @@ def analyze_sentiment_and_tone(text):
         'overall_tone': max(sentiment_scores, key=sentiment_scores.get)
     }
     
-    logger.info(f"Sentiment analysis: {sentiment_distribution}")
+    logger.debug(f"Sentiment analysis: {sentiment_distribution}")
     return sentiment_distribution
 
+def analyze_sentiment_batch(docs):
+    """Sentiment and tone of many submissions, with all their chunks in one batched pipeline call"""
+    if not analyzer.models['sentiment_analyzer']:
+        logger.warning("Sentiment analyzer not loaded")
+        return [{} for _ in docs]
+    
+    try:
+        classifier = metrics.counted(analyzer.models['sentiment_analyzer'], 'sentiment_analyzer')
+        sentiments = classify_documents(classifier, [doc.sentences for doc in docs])
+    except Exception as e:
+        logger.warning(f"Batch sentiment analysis failed: {e}")
+        sentiments = [[] for _ in docs]
+    return [analyze_sentiment_and_tone(doc, doc_sentiments) for doc, doc_sentiments in zip(docs, sentiments)]
+
 def generate_comprehensive_feedback(text, criteria, quality_metrics, style_metrics, semantic_analysis, sentiment_analysis):
     """Generate comprehensive AI feedback"""
     feedback = {
@@ -375,76 +574,9 @@ def generate_comprehensive_feedback(text, criteria, quality_metrics, style_metri
     else:
         feedback['overall_assessment'] = "This assignment shows balanced performance with equal strengths and areas for development."
     
-    logger.info(f"Feedback generated: {feedback}")
+    logger.debug(f"Feedback generated: {feedback}")
     return feedback
 
-def create_visualizations(quality_metrics, style_metrics, semantic_analysis):
-    """Create visualizations for analysis results"""
-    plots = {}
-    try:
-        # Quality metrics bar chart
-        fig, ax = plt.subplots(figsize=(8, 6))
-        metrics = ['Word Count', 'Readability', 'Grade Level', 'Sentence Length']
-        values = [
-            min(quality_metrics.get('word_count', 0) / 10, 100),
-            quality_metrics.get('readability_score', 0),
-            min(quality_metrics.get('grade_level', 0) * 10, 100),
-            min(quality_metrics.get('avg_sentence_length', 0) * 4, 100)
-        ]
-        ax.bar(metrics, values, color=['#ff9999', '#66b3ff', '#99ff99', '#ffcc99'])
-        ax.set_title('Text Quality Metrics')
-        ax.set_ylabel('Score')
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        img_buffer = io.BytesIO()
-        plt.savefig(img_buffer, format='png')
-        img_buffer.seek(0)
-        plots['quality_metrics'] = base64.b64encode(img_buffer.getvalue()).decode()
-        plt.close(fig)
-
-        # Criteria coverage chart
-        if semantic_analysis and len(semantic_analysis) > 0:
-            fig, ax = plt.subplots(figsize=(10, 6))
-            criteria = list(semantic_analysis.keys())[:5]
-            scores = [semantic_analysis[c]['coverage_score'] * 100 for c in criteria]
-            bars = ax.bar(range(len(criteria)), scores, color='skyblue')
-            ax.set_title('Criteria Coverage Analysis')
-            ax.set_ylabel('Coverage Score (%)')
-            ax.set_xticks(range(len(criteria)))
-            ax.set_xticklabels([c[:20] + '...' if len(c) > 20 else c for c in criteria], rotation=45)
-            for bar, score in zip(bars, scores):
-                ax.text(bar.get_x() + bar.get_width()/2, bar.get_height() + 1,
-                       f'{score:.1f}%', ha='center', va='bottom')
-            plt.tight_layout()
-            img_buffer = io.BytesIO()
-            plt.savefig(img_buffer, format='png')
-            img_buffer.seek(0)
-            plots['criteria_coverage'] = base64.b64encode(img_buffer.getvalue()).decode()
-            plt.close(fig)
-
-        # Word frequency visualization
-        if style_metrics.get('word_frequency_distribution') and len(style_metrics['word_frequency_distribution']) > 0:
-            try:
-                word_freq = dict(style_metrics['word_frequency_distribution'])
-                if len(word_freq) > 1:
-                    wordcloud = WordCloud(width=800, height=400, background_color='white', min_font_size=10).generate_from_frequencies(word_freq)
-                    fig, ax = plt.subplots(figsize=(10, 5))
-                    ax.imshow(wordcloud, interpolation='bilinear')
-                    ax.axis('off')
-                    ax.set_title('Most Frequent Words')
-                    img_buffer = io.BytesIO()
-                    plt.savefig(img_buffer, format='png')
-                    img_buffer.seek(0)
-                    plots['word_cloud'] = base64.b64encode(img_buffer.getvalue()).decode()
-                    plt.close(fig)
-                else:
-                    logger.warning("Skipping word cloud: insufficient unique words")
-            except Exception as e:
-                logger.warning(f"Could not create word cloud: {e}")
-    except Exception as e:
-        logger.error(f"Error creating visualizations: {e}")
-    return plots
-
 def calculate_advanced_score(quality_metrics, style_metrics, semantic_analysis, criteria, max_score=100):
     """Calculate advanced scoring with multiple factors"""
     score_breakdown = {
@@ -528,11 +660,11 @@ def calculate_advanced_score(quality_metrics, style_metrics, semantic_analysis,
     total_score = sum(score_breakdown.values())
     final_score = min(total_score, max_score)
     
-    logger.info(f"Quality metrics: {quality_metrics}")
-    logger.info(f"Style metrics: {style_metrics}")
-    logger.info(f"Semantic analysis: {semantic_analysis}")
-    logger.info(f"Score breakdown: {score_breakdown}")
-    logger.info(f"Final score: {final_score}")
+    logger.debug(f"Quality metrics: {quality_metrics}")
+    logger.debug(f"Style metrics: {style_metrics}")
+    logger.debug(f"Semantic analysis: {semantic_analysis}")
+    logger.debug(f"Score breakdown: {score_breakdown}")
+    logger.debug(f"Final score: {final_score}")
     return final_score, score_breakdown
 
 def parse_criteria(criteria_text):
@@ -586,54 +718,59 @@ def grade_assignment():
             flash('Please provide valid grading criteria')
             return redirect(url_for('index'))
         
-        text = ''
-        filepaths = []
-        for file in files:
-            filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
-            filepaths.append(filepath)
-            extracted_text = extract_text_from_file(filepath)
-            if not extracted_text.strip():
-                flash(f'Could not extract text from {file.filename}')
-                for fp in filepaths:
-                    try:
-                        os.remove(fp)
-                    except Exception as e:
-                        logger.warning(f"Failed to remove file {fp}: {e}")
-                return redirect(url_for('index'))
-            text += extracted_text + '\n'
-        
-        clean_text = preprocess_text(text)
-        logger.info("Analyzing text quality...")
-        quality_metrics = analyze_text_quality(clean_text)
-        logger.info(f"Quality metrics: {quality_metrics}")
-        
-        logger.info("Analyzing writing style...")
-        style_metrics = analyze_writing_style(clean_text)
-        
-        logger.info("Analyzing semantic content...")
-        semantic_analysis = analyze_semantic_content(clean_text, criteria) if criteria else {}
-        
-        if not isinstance(semantic_analysis, dict):
-            logger.error(f"semantic_analysis is not a dictionary: {type(semantic_analysis)}")
-            semantic_analysis = {}
-        
-        logger.info("Analyzing sentiment and tone...")
-        sentiment_analysis = analyze_sentiment_and_tone(clean_text)
-        
-        logger.info("Generating comprehensive feedback...")
-        comprehensive_feedback = generate_comprehensive_feedback(
-            clean_text, criteria, quality_metrics, style_metrics, semantic_analysis, sentiment_analysis
-        )
-        
-        logger.info("Calculating advanced score...")
-        final_score, score_breakdown = calculate_advanced_score(
-            quality_metrics, style_metrics, semantic_analysis, criteria, max_score
-        )
+        start = time.perf_counter()
+        with metrics.collect() as stages:
+            texts, truncated_files = [], []
+            for file in files:
+                # Extracted straight from the upload buffer; nothing is written under its own name.
+                # PDF pages are cleaned up as they are read, so that preprocessing is timed here
+                with metrics.span('extraction', files=1) as counts:
+                    extracted_text, pdf = extract_clean_text(upload_source(file), secure_filename(file.filename))
+                    counts['characters'] = len(extracted_text)
+                if not extracted_text.strip():
+                    flash(f'Could not extract text from {file.filename}')
+                    return redirect(url_for('index'))
+                if pdf and pdf['truncated']:
+                    truncated_files.append({'filename': file.filename, **pdf})
+                texts.append(extracted_text)
+            
+            with metrics.span('preprocessing'):
+                clean_text = ' '.join(texts)
+                doc = parse_document(clean_text)
+            with metrics.span('quality'):
+                quality_metrics = analyze_text_quality(doc)
+            logger.debug(f"Quality metrics: {quality_metrics}")
+            
+            with metrics.span('style'):
+                style_metrics = analyze_writing_style(doc)
+            
+            with metrics.span('semantic'):
+                semantic_analysis = analyze_semantic_content(doc, criteria) if criteria else {}
+            
+            if not isinstance(semantic_analysis, dict):
+                logger.error(f"semantic_analysis is not a dictionary: {type(semantic_analysis)}")
+                semantic_analysis = {}
+            
+            with metrics.span('sentiment'):
+                sentiment_analysis = analyze_sentiment_and_tone(doc)
+            
+            with metrics.span('feedback'):
+                comprehensive_feedback = generate_comprehensive_feedback(
+                    clean_text, criteria, quality_metrics, style_metrics, semantic_analysis, sentiment_analysis
+                )
+            
+            with metrics.span('scoring'):
+                final_score, score_breakdown = calculate_advanced_score(
+                    quality_metrics, style_metrics, semantic_analysis, criteria, max_score
+                )
+        breakdown = ', '.join(f"{stage} {timing['seconds']:.3f}s" for stage, timing in stages.items())
+        logger.info(f"Graded {len(files)} file(s) in {time.perf_counter() - start:.2f}s: {breakdown}")
         
-        logger.info("Creating visualizations...")
-        plots = create_visualizations(quality_metrics, style_metrics, semantic_analysis)
+        # Charts are drawn when the results page requests them
+        result_id = uuid.uuid4().hex
+        charts = chart_data(quality_metrics, style_metrics, semantic_analysis)
+        plot_cache.put(result_id, app.json.dumps(charts).encode('utf-8'))
+        plots = {name: url_for('plot_image', result_id=result_id, name=name) for name in charts}
         
         results = {
             'filename': ', '.join([file.filename for file in files]),
@@ -647,31 +784,111 @@ def grade_assignment():
             'sentiment_analysis': sentiment_analysis,
             'comprehensive_feedback': comprehensive_feedback,
             'plots': plots,
+            'plot_data_url': url_for('plot_data', result_id=result_id),
             'text_preview': clean_text[:800] + '...' if len(clean_text) > 800 else clean_text,
             'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'criteria': criteria
+            'criteria': criteria,
+            # Only the text within PDF_MAX_PAGES / PDF_MAX_CHARS of these files was graded
+            'truncated_files': truncated_files
         }
         
-        for filepath in filepaths:
-            try:
-                os.remove(filepath)
-                logger.info(f"Successfully removed file {filepath}")
-            except Exception as e:
-                logger.warning(f"Failed to remove file {filepath}: {e}")
-        
         return render_template('results.html', results=results, current_year=datetime.now().year)        
     except Exception as e:
         logger.error(f"Error in grade_assignment: {str(e)}", exc_info=True)
         flash(f'Error processing assignment: {str(e)}. Please check the input format.')
-        if 'filepaths' in locals():
-            for filepath in filepaths:
-                try:
-                    os.remove(filepath)
-                    logger.info(f"Successfully removed file {filepath} after error")
-                except Exception as e:
-                    logger.warning(f"Failed to remove file {filepath} after error: {e}")
         return redirect(url_for('index'))
 
+@app.route('/plots/<result_id>')
+def plot_data(result_id):
+    """Chart data of a /grade result as JSON, for rendering in the browser"""
+    body = plot_cache.get(result_id)
+    if body is None:
+        return jsonify({'error': 'Unknown or expired result'}), 404
+    return app.response_class(body, mimetype='application/json')
+
+@app.route('/plots/<result_id>/<name>.png')
+def plot_image(result_id, name):
+    """One chart of a /grade result as PNG, rendered on first request and cached"""
+    body = plot_cache.get(result_id)
+    charts = json.loads(body) if body is not None else {}
+    if name not in charts:
+        return jsonify({'error': 'Unknown or expired chart'}), 404
+    try:
+        png, _ = plot_cache.get_or_compute(f"{result_id}/{name}", lambda: (render_plot(name, charts[name]), True))
+    except Exception as e:
+        logger.error(f"Error rendering chart {name}: {e}")
+        return jsonify({'error': 'Could not render chart'}), 500
+    return app.response_class(png, mimetype='image/png', headers={'Cache-Control': 'private, max-age=3600'})
+
+def render_plot(name, chart):
+    with metrics.span('plotting', charts=1):
+        return render_chart(name, chart)
+
+def build_grade_response(doc, criteria, max_score, semantic_analysis, sentiment_analysis):
+    """Score one parsed submission and assemble the /api/grade response"""
+    with metrics.span('quality'):
+        quality_metrics = analyze_text_quality(doc)
+    with metrics.span('style'):
+        style_metrics = analyze_writing_style(doc)
+    with metrics.span('feedback'):
+        comprehensive_feedback = generate_comprehensive_feedback(
+            doc.text, criteria, quality_metrics, style_metrics, semantic_analysis, sentiment_analysis
+        )
+    with metrics.span('scoring'):
+        final_score, score_breakdown = calculate_advanced_score(
+            quality_metrics, style_metrics, semantic_analysis, criteria, max_score
+        )
+    
+    return {
+        'final_score': round(final_score, 1),
+        'max_score': max_score,
+        'percentage': round((final_score / max_score) * 100, 1),
+        'score_breakdown': score_breakdown,
+        'quality_metrics': quality_metrics,
+        'style_metrics': style_metrics,
+        'semantic_analysis': semantic_analysis,
+        'sentiment_analysis': sentiment_analysis,
+        'comprehensive_feedback': comprehensive_feedback,
+        'criteria': criteria
+    }
+
+def degraded_analysis(doc, semantic_analysis, sentiment_analysis):
+    """Whether a model was unavailable or failed while analyzing a submission that has sentences.
+
+    Both analyses catch model errors and come back empty, so such a result
+    looks like a normal one and must not be cached under the models' versions.
+    """
+    return bool(doc.sentences) and (not semantic_analysis or not sentiment_analysis)
+
+def grade_submission(text, criteria, max_score, progress=None):
+    """The /api/grade response for one submission as JSON bytes, and where it came from.
+
+    Served from the result cache when the same text, criteria and max score
+    were graded before with the same models; progress(stage, fraction) is
+    called as each stage of a fresh computation starts. A result built
+    while a model was unavailable is returned but not cached.
+    """
+    progress = progress or (lambda stage, fraction: None)
+
+    def compute():
+        progress('parsing', 0.05)
+        with metrics.span('preprocessing'):
+            doc = parse_document(preprocess_text(text))
+        progress('semantic', 0.25)
+        with metrics.span('semantic'):
+            semantic_analysis = analyze_semantic_content(doc, criteria)
+        progress('sentiment', 0.55)
+        with metrics.span('sentiment'):
+            sentiment_analysis = analyze_sentiment_and_tone(doc)
+        progress('scoring', 0.85)
+        response = build_grade_response(doc, criteria, max_score, semantic_analysis, sentiment_analysis)
+        degraded = degraded_analysis(doc, semantic_analysis, sentiment_analysis)
+        if degraded:
+            logger.warning("Not caching a result graded without the semantic or sentiment model")
+        return app.json.dumps(response).encode('utf-8'), not degraded
+
+    return result_cache.get_or_compute(result_key(text, criteria, max_score, MODEL_VERSIONS), compute)
+
 @app.route('/api/grade', methods=['POST'])
 def api_grade_assignment():
     try:
@@ -691,49 +908,270 @@ def api_grade_assignment():
         logger.info(f"API received text (first 500 chars): {text[:500]}")
         logger.info(f"API received criteria: {criteria}")
         
-        clean_text = preprocess_text(text)
-        quality_metrics = analyze_text_quality(clean_text)
-        style_metrics = analyze_writing_style(clean_text)
-        semantic_analysis = analyze_semantic_content(clean_text, criteria)
-        sentiment_analysis = analyze_sentiment_and_tone(clean_text)
-        comprehensive_feedback = generate_comprehensive_feedback(
-            clean_text, criteria, quality_metrics, style_metrics, semantic_analysis, sentiment_analysis
-        )
-        final_score, score_breakdown = calculate_advanced_score(
-            quality_metrics, style_metrics, semantic_analysis, criteria, max_score
-        )
+        start = time.perf_counter()
+        with metrics.collect() as stages:
+            body, source = grade_submission(text, criteria, max_score)
+            logger.info(f"API grade served from: {source}")
+            # Matches depend on what else was submitted, so they are added after the cached result
+            extra = {}
+            ids = submission_ids(data)
+            if ids:
+                extra['near_duplicates'] = check_near_duplicates(ids[0], [(ids[1], text)])[0]
+                index_sentences(ids[0], [(ids[1], text)])
+        if timings_requested(data):
+            extra['timings'] = timings_block(stages, time.perf_counter() - start, result_cache=source)
+        if extra:
+            response = json.loads(body)
+            response.update(extra)
+            body = app.json.dumps(response).encode('utf-8')
+        return app.response_class(body, mimetype='application/json', headers={'X-Result-Cache': source})
         
-        response = {
-            'final_score': round(final_score, 1),
-            'max_score': max_score,
-            'percentage': round((final_score / max_score) * 100, 1),
-            'score_breakdown': score_breakdown,
-            'quality_metrics': quality_metrics,
-            'style_metrics': style_metrics,
-            'semantic_analysis': semantic_analysis,
-            'sentiment_analysis': sentiment_analysis,
-            'comprehensive_feedback': comprehensive_feedback,
-            'criteria': criteria
-        }
+    except Exception as e:
+        logger.error(f"Error in api_grade_assignment: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/grade/batch', methods=['POST'])
+def api_grade_batch():
+    """Grade many submissions against one criteria list, batching model work across all of them.
+
+    Body: {"criteria": [...], "max_score": 100, "assignment_id": ..., "submissions": [{"id": ..., "text": ...}, ...]}
+    Each result has the /api/grade response shape plus the submission id, or an error.
+    With an assignment_id, each result lists near-duplicates among the
+    assignment's earlier submissions and the batch, and a submission sent
+    without an id is given one, returned as its result's id. With "timings": true,
+    the response has a `timings` block for the whole batch.
+    """
+    try:
+        data = request.get_json()
+        criteria = data.get('criteria', []) if data else []
+        max_score = data.get('max_score', 100) if data else 100
+        submissions = data.get('submissions') if data else None
+        
+        if not criteria or not all(isinstance(c, str) and c.strip() for c in criteria):
+            logger.warning("No valid criteria provided in batch API request")
+            return jsonify({'error': 'No valid grading criteria provided'}), 400
+        if not isinstance(submissions, list) or not submissions:
+            return jsonify({'error': 'No submissions provided'}), 400
+        if len(submissions) > MAX_BATCH_SUBMISSIONS:
+            return jsonify({'error': f'At most {MAX_BATCH_SUBMISSIONS} submissions per batch'}), 413
+        
+        start = time.perf_counter()
+        with metrics.collect() as stages:
+            valid = [i for i, sub in enumerate(submissions)
+                     if isinstance(sub, dict) and isinstance(sub.get('text'), str) and sub['text'].strip()]
+            results = [{'id': sub.get('id') if isinstance(sub, dict) else None, 'error': 'No text provided'}
+                       for sub in submissions]
+            keys = {i: result_key(submissions[i]['text'], criteria, max_score, MODEL_VERSIONS) for i in valid}
+            missing = []
+            for i in valid:
+                body = result_cache.get(keys[i])
+                if body is None:
+                    missing.append(i)
+                else:
+                    results[i] = {'id': submissions[i].get('id'), **json.loads(body)}
+        
+            compute_start = time.perf_counter()
+            with metrics.span('preprocessing', documents=len(missing)):
+                docs = [parse_document(preprocess_text(submissions[i]['text'])) for i in missing]
+            with metrics.span('semantic', documents=len(docs)):
+                semantic_results = analyze_semantic_content_batch(docs, criteria)
+            with metrics.span('sentiment', documents=len(docs)):
+                sentiment_results = analyze_sentiment_batch(docs)
+            responses = [build_grade_response(doc, criteria, max_score, semantic_analysis, sentiment_analysis)
+                         for doc, semantic_analysis, sentiment_analysis in zip(docs, semantic_results, sentiment_results)]
+            seconds_each = (time.perf_counter() - compute_start) / max(1, len(missing))
+            degraded = 0
+            for i, doc, semantic_analysis, sentiment_analysis, response in zip(
+                    missing, docs, semantic_results, sentiment_results, responses):
+                if degraded_analysis(doc, semantic_analysis, sentiment_analysis):
+                    degraded += 1
+                else:
+                    result_cache.put(keys[i], app.json.dumps(response).encode('utf-8'), seconds_each)
+                results[i] = {'id': submissions[i].get('id'), **response}
+            if degraded:
+                logger.warning(f"Not caching {degraded} batch result(s) graded without the semantic or sentiment model")
         
+            ids = submission_ids(data)
+            if ids:
+                items = [(str(submissions[i]['id']) if submissions[i].get('id') not in (None, '') else uuid.uuid4().hex,
+                          submissions[i]['text']) for i in valid]
+                for i, (submission_id, _), check in zip(valid, items, check_near_duplicates(ids[0], items)):
+                    # A submission indexed under a generated id gets it back, to resend with a retry
+                    results[i]['id'] = submission_id
+                    results[i]['near_duplicates'] = check
+                index_sentences(ids[0], items)
+        
+        elapsed = time.perf_counter() - start
+        batch_stats = {
+            'submissions': len(valid),
+            'cached': len(valid) - len(missing),
+            'seconds': round(elapsed, 3),
+            'submissions_per_second': round(len(valid) / elapsed, 2) if elapsed > 0 else None
+        }
+        logger.info(f"Batch graded: {batch_stats}")
+        response = {'results': results, 'batch_stats': batch_stats}
+        if timings_requested(data):
+            response['timings'] = timings_block(stages, elapsed)
         return jsonify(response)
         
     except Exception as e:
-        logger.error(f"Error in api_grade_assignment: {str(e)}", exc_info=True)
+        logger.error(f"Error in api_grade_batch: {str(e)}", exc_info=True)
         return jsonify({'error': str(e)}), 500
 
+def run_grading_job(kind, payload, progress):
+    """Grade one queued /api/jobs submission, reporting each stage as it starts"""
+    if kind != 'grade':
+        raise ValueError(f"Unknown job kind: {kind}")
+    start = time.perf_counter()
+    with metrics.collect() as stages:
+        body, source = grade_submission(payload['text'], payload['criteria'], payload['max_score'], progress)
+        response = json.loads(body)
+        if payload.get('assignment_id'):
+            response['near_duplicates'] = check_near_duplicates(
+                payload['assignment_id'], [(payload['submission_id'], payload['text'])])[0]
+            index_sentences(payload['assignment_id'], [(payload['submission_id'], payload['text'])])
+    if payload.get('timings'):
+        response['timings'] = timings_block(stages, time.perf_counter() - start, result_cache=source)
+    return response
+
+grading_jobs = JobQueue(JOB_DB_PATH, run_grading_job, workers=JOB_WORKERS,
+                        lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS)
+
+@app.route('/api/jobs', methods=['POST'])
+def api_submit_job():
+    """Queue a grading job and return its id at once.
+
+    Body is the same as /api/grade, including the optional assignment_id, submission_id and timings. Poll GET /api/jobs/<job_id> (optionally
+    with ?wait=<seconds>&stage=<last seen stage> to long-poll) and fetch
+    GET /api/jobs/<job_id>/result once the status is "done".
+    """
+    try:
+        data = request.get_json()
+        text = data.get('text', '') if data else ''
+        criteria = data.get('criteria', []) if data else []
+        max_score = data.get('max_score', 100) if data else 100
+        
+        if not isinstance(text, str) or not text.strip():
+            logger.error("No text provided in job request")
+            return jsonify({'error': 'No text provided'}), 400
+        if not criteria or not all(isinstance(c, str) and c.strip() for c in criteria):
+            logger.warning("No valid criteria provided in job request")
+            return jsonify({'error': 'No valid grading criteria provided'}), 400
+        
+        payload = {'text': text, 'criteria': criteria, 'max_score': max_score}
+        ids = submission_ids(data)
+        if ids:
+            # Fixed at submission so a retried job replaces its own signature
+            payload['assignment_id'], payload['submission_id'] = ids
+        if timings_requested(data):
+            payload['timings'] = True
+        job_id = grading_jobs.submit('grade', payload)
+        logger.info(f"Queued grading job {job_id} ({len(text)} chars)")
+        return jsonify({
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': url_for('api_job_status', job_id=job_id),
+            'result_url': url_for('api_job_result', job_id=job_id)
+        }), 202
+        
+    except Exception as e:
+        logger.error(f"Error in api_submit_job: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<job_id>')
+def api_job_status(job_id):
+    """Job status, stage and progress; with ?wait=N, wait up to N seconds for the stage to change"""
+    wait = min(max(request.args.get('wait', 0, type=float), 0), MAX_JOB_WAIT_SECONDS)
+    if wait:
+        status = grading_jobs.wait(job_id, wait, known_stage=request.args.get('stage') or None)
+    else:
+        status = grading_jobs.status(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(status)
+
+@app.route('/api/jobs/<job_id>/result')
+def api_job_result(job_id):
+    """The /api/grade response of a finished job; 202 with the status while it is still pending"""
+    status = grading_jobs.status(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if status['status'] == 'failed':
+        return jsonify({'error': status['error'], 'job': status}), 500
+    if status['status'] != 'done':
+        return jsonify(status), 202
+    return jsonify(grading_jobs.result(job_id))
+
+@app.route('/api/jobs/stats')
+def api_job_stats():
+    """Queue depth and recent wait and run times"""
+    return jsonify(grading_jobs.stats())
+
+@app.route('/api/assignments/<assignment_id>/near_duplicates')
+def api_near_duplicates(assignment_id):
+    """Pairs of an assignment's submissions with estimated Jaccard similarity of at least ?min_similarity"""
+    min_similarity = request.args.get('min_similarity', near_duplicates.min_similarity, type=float)
+    return jsonify({'assignment_id': assignment_id, 'pairs': near_duplicates.pairs(assignment_id, min_similarity)})
+
+@app.route('/api/assignments/<assignment_id>/search')
+def api_search_assignment(assignment_id):
+    """Submissions whose sentences best match ?q, with up to ?evidence matching sentences each.
+
+    Query parameters: q (required), k (submissions, default 10),
+    evidence (sentences per submission, default 3) and min_score.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'No query provided'}), 400
+    if not analyzer.models['sentence_transformer']:
+        return jsonify({'error': 'Sentence transformer unavailable'}), 503
+    k = min(max(request.args.get('k', 10, type=int), 1), MAX_SEARCH_RESULTS)
+    evidence = min(max(request.args.get('evidence', 3, type=int), 0), 20)
+    min_score = request.args.get('min_score', type=float)
+    try:
+        start = time.perf_counter()
+        results, count = semantic_index.search(assignment_id, EMBEDDING_MODEL_ID, encode_texts([query])[0],
+                                               k=k, evidence=evidence, min_score=min_score)
+        return jsonify({
+            'assignment_id': assignment_id,
+            'query': query,
+            'results': results,
+            'sentences_searched': count,
+            'seconds': round(time.perf_counter() - start, 3)
+        })
+    except Exception as e:
+        logger.error(f"Error in api_search_assignment: {str(e)}", exc_info=True)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/metrics')
+def metrics_report():
+    """Per-stage latency histograms and counts and model inference counts, as Prometheus text or with ?format=json"""
+    if request.args.get('format') == 'json':
+        return jsonify(metrics.snapshot())
+    return app.response_class(metrics.prometheus(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/health')
 def health_check():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
+    return jsonify({
+        'status': 'healthy',
+        'models_warm': all(analyzer.models.is_loaded(name) for name in WARM_MODELS if name in analyzer.models),
+        'embedding_store': embedding_store.stats,
+        'result_cache': result_cache.stats,
+        'near_duplicates': near_duplicates.stats,
+        'semantic_index': semantic_index.stats,
+        'jobs': grading_jobs.stats(),
+        'timestamp': datetime.now().isoformat()
+    })
 
 @app.route('/test_models')
 def test_models():
-    """Test model loading status"""
-    return jsonify({k: v is not None for k, v in analyzer.models.items()})
+    """Model load state, load time and resident memory, without loading anything"""
+    return jsonify({**analyzer.models.status(), 'resources': resources})
 
-def analyze_text_quality(text):
+def analyze_text_quality(doc):
     """Enhanced text quality analysis"""
+    text = doc.text
     if not text.strip():
         logger.warning("Empty text in analyze_text_quality")
         return {
@@ -748,17 +1186,13 @@ def analyze_text_quality(text):
             'avg_word_length': 0
         }
     
-    words = word_tokenize(text.lower())
-    sentences = sent_tokenize(text)
-    paragraphs = [p.strip() for p in text.split('\n\n') if p.strip()]
-    
-    word_count = len([w for w in words if w.isalnum()])
-    sentence_count = len(sentences)
-    paragraph_count = len(paragraphs)
-    unique_words = len(set([w for w in words if w.isalnum()]))
+    word_count = doc.word_count
+    sentence_count = doc.sentence_count
+    paragraph_count = len(doc.paragraphs)
+    unique_words = doc.unique_words
     
     avg_sentence_length = word_count / sentence_count if sentence_count > 0 else 0
-    avg_word_length = np.mean([len(w) for w in words if w.isalnum()]) if words else 0
+    avg_word_length = np.mean([len(w) for w in doc.words]) if doc.tokens else 0
     
     try:
         readability_score = flesch_reading_ease(text)
@@ -770,7 +1204,7 @@ def analyze_text_quality(text):
         grade_level = 0
         ari_score = 0
     
-    metrics = {
+    quality = {
         'word_count': word_count,
         'sentence_count': sentence_count,
         'paragraph_count': paragraph_count,
@@ -783,10 +1217,17 @@ def analyze_text_quality(text):
         'lexical_diversity': round(unique_words / word_count if word_count > 0 else 0, 3)
     }
     
-    logger.info(f"Text quality metrics: {metrics}")
-    return metrics
+    logger.debug(f"Text quality metrics: {quality}")
+    return quality
 
 if __name__ == '__main__':
     print("Starting Enhanced AI Assignment Grading System...")
     logger.info("Starting Flask application with enhanced AI features")
-    app.run(debug=True, host='0.0.0.0', port=5100)
\ No newline at end of file
+    # With debug=True this file runs twice; only the reloader's child process serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        analyzer.models.warmup(WARM_MODELS)
+        grading_jobs.start()
+    app.run(debug=True, host='0.0.0.0', port=5100)
+else:
+    analyzer.models.warmup(WARM_MODELS)
+    grading_jobs.start()
\ No newline at end of file
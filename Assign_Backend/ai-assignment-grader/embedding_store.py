@@ -0,0 +1,191 @@
+"""Persistent, content-addressed cache of sentence embeddings.
+
+Vectors are keyed by (model id, hash of the normalized text) and stored as
+float16 rows of a fixed-capacity memory-mapped file per model. A SQLite
+index maps keys to rows and tracks last use for LRU eviction. SQLite
+serializes writers across worker processes; readers check a per-row tag
+after copying a vector, so a row overwritten concurrently reads as a miss
+instead of a wrong vector.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of bound parameters per statement
+_QUERY_BATCH = 500
+
+
+def normalize_text(text):
+    return ' '.join(unicodedata.normalize('NFKC', text).split())
+
+
+def text_hash(text):
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+
+
+def _tag(digest):
+    # Non-zero 64-bit tag derived from the hash; 0 marks a row being written
+    return int.from_bytes(bytes.fromhex(digest[:16]), 'big', signed=True) or 1
+
+
+class EmbeddingStore:
+    """Bounded LRU store of float16 embeddings shared by all worker processes"""
+
+    def __init__(self, directory, max_entries=200000):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+
+        self._db = sqlite3.connect(os.path.join(directory, 'index.sqlite'), timeout=30,
+                                   isolation_level=None, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS entries (
+            model TEXT NOT NULL, hash TEXT NOT NULL, slot INTEGER NOT NULL, last_used REAL NOT NULL,
+            PRIMARY KEY (model, hash))''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS entries_lru ON entries (model, last_used)')
+        # Rows stored under a larger max_entries may sit past the end of the memmap; drop them
+        dropped = self._db.execute('DELETE FROM entries WHERE slot >= ?', (max_entries,)).rowcount
+        if dropped:
+            logger.info(f"Dropped {dropped} embedding(s) stored past max_entries={max_entries}")
+        self._lock = threading.Lock()
+        self._spaces = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _space(self, model_id, dim):
+        """Memory-mapped vector rows and row tags for one model"""
+        key = (model_id, dim)
+        if key not in self._spaces:
+            name = f"vectors-{hashlib.sha1(model_id.encode('utf-8')).hexdigest()[:12]}-{dim}"
+            vectors_path = os.path.join(self.directory, name + '.f16')
+            tags_path = os.path.join(self.directory, name + '.tags')
+            # Growing to the same size from several processes is harmless
+            for path, size in ((vectors_path, self.max_entries * dim * 2), (tags_path, self.max_entries * 8)):
+                with open(path, 'ab') as f:
+                    if f.tell() < size:
+                        f.truncate(size)
+            self._spaces[key] = (
+                np.memmap(vectors_path, dtype=np.float16, mode='r+', shape=(self.max_entries, dim)),
+                np.memmap(tags_path, dtype=np.int64, mode='r+', shape=(self.max_entries,))
+            )
+        return self._spaces[key]
+
+    def get_many(self, model_id, dim, digests):
+        """Return {hash: float32 vector} for the hashes present in the store"""
+        vectors, tags = self._space(model_id, dim)
+        found = {}
+        with self._lock:
+            for start in range(0, len(digests), _QUERY_BATCH):
+                batch = digests[start:start + _QUERY_BATCH]
+                rows = self._db.execute(
+                    f"SELECT hash, slot FROM entries WHERE model = ? AND hash IN ({','.join('?' * len(batch))})",
+                    [model_id] + batch
+                ).fetchall()
+                for digest, slot in rows:
+                    vector = np.array(vectors[slot], dtype=np.float32)
+                    if tags[slot] == _tag(digest):
+                        found[digest] = vector
+            if found:
+                now = time.time()
+                self._db.executemany('UPDATE entries SET last_used = ? WHERE model = ? AND hash = ?',
+                                     [(now, model_id, digest) for digest in found])
+        return found
+
+    def put_many(self, model_id, dim, items):
+        """Store (hash, vector) pairs, evicting the least recently used rows when full"""
+        vectors, tags = self._space(model_id, dim)
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                existing = set()
+                digests = [digest for digest, _ in items]
+                for start in range(0, len(digests), _QUERY_BATCH):
+                    batch = digests[start:start + _QUERY_BATCH]
+                    existing.update(row[0] for row in self._db.execute(
+                        f"SELECT hash FROM entries WHERE model = ? AND hash IN ({','.join('?' * len(batch))})",
+                        [model_id] + batch
+                    ))
+                new = [(digest, vector) for digest, vector in items if digest not in existing][:self.max_entries]
+                if not new:
+                    self._db.execute('COMMIT')
+                    return
+
+                # Slots are handed out in order and only reused on eviction, so the next free one is past the highest
+                next_slot = self._db.execute('SELECT COALESCE(MAX(slot) + 1, 0) FROM entries WHERE model = ?',
+                                             (model_id,)).fetchone()[0]
+                slots = list(range(next_slot, min(self.max_entries, next_slot + len(new))))
+                if len(slots) < len(new):
+                    victims = self._db.execute(
+                        'SELECT hash, slot FROM entries WHERE model = ? ORDER BY last_used LIMIT ?',
+                        (model_id, len(new) - len(slots))
+                    ).fetchall()
+                    self._db.executemany('DELETE FROM entries WHERE model = ? AND hash = ?',
+                                         [(model_id, digest) for digest, _ in victims])
+                    slots.extend(slot for _, slot in victims)
+
+                now = time.time()
+                for (digest, vector), slot in zip(new, slots):
+                    tags[slot] = 0
+                    vectors[slot] = vector.astype(np.float16)
+                    tags[slot] = _tag(digest)
+                self._db.executemany('INSERT INTO entries (model, hash, slot, last_used) VALUES (?, ?, ?, ?)',
+                                     [(model_id, digest, slot, now) for (digest, _), slot in zip(new, slots)])
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+
+    def encode(self, model, model_id, texts, **encode_kwargs):
+        """Embeddings for texts as a float32 array, running model.encode only for texts not in the store.
+
+        Texts encoded by this call come back exactly as the model produced
+        them; texts served from the store come back rounded through float16,
+        within about 1e-3 of the model's output per component.
+        """
+        if not texts:
+            return np.zeros((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+        dim = model.get_sentence_embedding_dimension()
+        digests = [text_hash(text) for text in texts]
+        unique = list(dict.fromkeys(digests))
+
+        try:
+            found = self.get_many(model_id, dim, unique)
+        except Exception as e:
+            logger.warning(f"Embedding store lookup failed: {e}")
+            found = {}
+
+        missing = [digest for digest in unique if digest not in found]
+        self.hits += len(unique) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            first_text = {}
+            for digest, text in zip(digests, texts):
+                first_text.setdefault(digest, text)
+            # Returned as the model's float32 output; only the stored copy is rounded to float16
+            encoded = np.asarray(model.encode([first_text[d] for d in missing], **encode_kwargs), dtype=np.float32)
+            found.update(zip(missing, encoded))
+            try:
+                self.put_many(model_id, dim, list(zip(missing, encoded)))
+            except Exception as e:
+                logger.warning(f"Embedding store write failed: {e}")
+
+        return np.stack([found[digest] for digest in digests])
+
+    @property
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            'max_entries': self.max_entries
+        }
@@ -0,0 +1,240 @@
+"""Per-stage timing spans, counts and model inference counters for the grading pipeline.
+
+A span times one stage of grading (extraction, preprocessing, semantic,
+sentiment, ...) and records its duration in that stage's latency
+histogram. Code running inside a span attaches counts to it, such as
+sentences, tokens or chunks, without needing a handle on the span.
+
+Spans opened while a request is collecting timings are also added to that
+request's breakdown. The open span and the breakdown live in context
+variables, so concurrent requests and job worker threads only see their
+own. Recording takes a perf_counter pair and a short lock, a few
+microseconds per span.
+
+Run this module directly to measure the cost of a span, alone and from
+several threads at once:
+
+    python instrumentation.py
+"""
+import contextvars
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Upper bounds in seconds of the latency histogram buckets; the last bucket is +Inf
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Counts of the innermost open span, and the stages of the request collecting timings
+_open_span = contextvars.ContextVar('open_span', default=None)
+_collected = contextvars.ContextVar('collected_timings', default=None)
+
+
+class CountedModel:
+    """A model whose inference calls are counted and timed; everything else is passed through"""
+
+    def __init__(self, model, name, metrics):
+        self._model = model
+        self._name = name
+        self._metrics = metrics
+
+    def __getattr__(self, attr):
+        return getattr(self._model, attr)
+
+    def _run(self, method, inputs, args, kwargs):
+        start = time.perf_counter()
+        try:
+            return method(inputs, *args, **kwargs)
+        finally:
+            count = 1 if isinstance(inputs, str) else len(inputs)
+            self._metrics.inference(self._name, count, time.perf_counter() - start)
+
+    def __call__(self, inputs, *args, **kwargs):
+        return self._run(self._model, inputs, args, kwargs)
+
+    def encode(self, sentences, *args, **kwargs):
+        return self._run(self._model.encode, sentences, args, kwargs)
+
+    def pipe(self, texts, *args, **kwargs):
+        # spaCy yields lazily; parse everything here so the time is spent inside the count
+        return self._run(lambda texts, *a, **kw: list(self._model.pipe(texts, *a, **kw)), list(texts), args, kwargs)
+
+
+class Metrics:
+    """Latency histograms and counts per stage, and inference counts per model, for the whole process"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._models = {}
+        self.started = time.time()
+
+    @contextmanager
+    def span(self, stage, **counts):
+        """Time a stage; counts given here or added inside with count() are recorded with it"""
+        token = _open_span.set(counts)
+        start = time.perf_counter()
+        try:
+            yield counts
+        finally:
+            seconds = time.perf_counter() - start
+            _open_span.reset(token)
+            self.observe(stage, seconds, counts)
+
+    def count(self, **counts):
+        """Add counts to the innermost open span; without one they are dropped"""
+        current = _open_span.get()
+        if current is not None:
+            for item, value in counts.items():
+                current[item] = current.get(item, 0) + value
+
+    def observe(self, stage, seconds, counts=None):
+        """Record one run of a stage that took `seconds`"""
+        bucket = bisect_left(self.buckets, seconds)
+        with self._lock:
+            stats = self._stages.get(stage)
+            if stats is None:
+                stats = self._stages[stage] = {'buckets': [0] * (len(self.buckets) + 1), 'count': 0,
+                                               'seconds': 0.0, 'items': {}}
+            stats['buckets'][bucket] += 1
+            stats['count'] += 1
+            stats['seconds'] += seconds
+            for item, value in (counts or {}).items():
+                stats['items'][item] = stats['items'].get(item, 0) + value
+
+        collected = _collected.get()
+        if collected is not None:
+            timing = collected.setdefault(stage, {'seconds': 0.0, 'calls': 0})
+            timing['seconds'] += seconds
+            timing['calls'] += 1
+            for item, value in (counts or {}).items():
+                timing[item] = timing.get(item, 0) + value
+
+    def inference(self, model, inputs, seconds):
+        """Record one inference call of a model over `inputs` texts or chunks"""
+        with self._lock:
+            stats = self._models.get(model)
+            if stats is None:
+                stats = self._models[model] = {'calls': 0, 'inputs': 0, 'seconds': 0.0}
+            stats['calls'] += 1
+            stats['inputs'] += inputs
+            stats['seconds'] += seconds
+
+    def counted(self, model, name):
+        """Wrap a model so its inference calls are recorded under `name`; None stays None"""
+        return CountedModel(model, name, self) if model is not None else None
+
+    @contextmanager
+    def collect(self):
+        """Collect the stages run in this context into a dict of {stage: {'seconds', 'calls', counts...}}"""
+        stages = {}
+        token = _collected.set(stages)
+        try:
+            yield stages
+        finally:
+            _collected.reset(token)
+
+    def snapshot(self):
+        """Stage histograms and counts and model inference counts, as JSON-ready dicts"""
+        with self._lock:
+            stages = {stage: {**stats, 'buckets': list(stats['buckets']), 'items': dict(stats['items'])}
+                      for stage, stats in self._stages.items()}
+            models = {name: dict(stats) for name, stats in self._models.items()}
+        bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+        return {
+            'uptime_seconds': round(time.time() - self.started, 1),
+            'stages': {
+                stage: {
+                    'count': stats['count'],
+                    'seconds': round(stats['seconds'], 6),
+                    'mean_ms': round(stats['seconds'] * 1000 / stats['count'], 3),
+                    'buckets': [{'le': bound, 'count': count}
+                                for bound, count in zip(bounds, _cumulative(stats['buckets']))],
+                    'items': stats['items']
+                }
+                for stage, stats in sorted(stages.items())
+            },
+            'models': {name: {**stats, 'seconds': round(stats['seconds'], 6)} for name, stats in sorted(models.items())}
+        }
+
+    def prometheus(self):
+        """The snapshot in the Prometheus text exposition format"""
+        snapshot = self.snapshot()
+        lines = ['# HELP grader_stage_seconds Time spent in each grading stage.',
+                 '# TYPE grader_stage_seconds histogram']
+        for stage, stats in snapshot['stages'].items():
+            for bucket in stats['buckets']:
+                lines.append(f'grader_stage_seconds_bucket{{stage="{stage}",le="{bucket["le"]}"}} {bucket["count"]}')
+            lines.append(f'grader_stage_seconds_sum{{stage="{stage}"}} {stats["seconds"]}')
+            lines.append(f'grader_stage_seconds_count{{stage="{stage}"}} {stats["count"]}')
+        lines += ['# HELP grader_stage_items_total Items processed by each grading stage (sentences, tokens, chunks, ...).',
+                  '# TYPE grader_stage_items_total counter']
+        for stage, stats in snapshot['stages'].items():
+            for item, value in sorted(stats['items'].items()):
+                lines.append(f'grader_stage_items_total{{stage="{stage}",item="{item}"}} {value}')
+        for metric, key, help_text in (
+                ('grader_model_inferences_total', 'calls', 'Inference calls of each model.'),
+                ('grader_model_inputs_total', 'inputs', 'Texts or chunks run through each model.'),
+                ('grader_model_inference_seconds_total', 'seconds', 'Time spent in inference calls of each model.')):
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+            for name, stats in snapshot['models'].items():
+                lines.append(f'{metric}{{model="{name}"}} {stats[key]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _cumulative(counts):
+    total, cumulative = 0, []
+    for count in counts:
+        total += count
+        cumulative.append(total)
+    return cumulative
+
+
+def timings_block(stages, seconds, **extra):
+    """The `timings` block of an API response from the stages collected for it"""
+    return {
+        'total_seconds': round(seconds, 4),
+        **extra,
+        'stages': {stage: {**timing, 'seconds': round(timing['seconds'], 4)} for stage, timing in stages.items()}
+    }
+
+
+def benchmark(spans=200000, threads=8):
+    """Cost of an empty span, alone and with several threads recording and collecting at once"""
+    metrics = Metrics()
+    start = time.perf_counter()
+    for _ in range(spans):
+        with metrics.span('benchmark'):
+            metrics.count(items=1)
+    alone = (time.perf_counter() - start) / spans
+
+    per_thread = spans // threads
+    breakdowns = []
+
+    def record():
+        with metrics.collect() as stages:
+            for _ in range(per_thread):
+                with metrics.span('concurrent'):
+                    metrics.count(items=1)
+        breakdowns.append(stages)
+
+    workers = [threading.Thread(target=record) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    concurrent = (time.perf_counter() - start) / (per_thread * threads)
+
+    stats = metrics.snapshot()['stages']
+    # Every span reached the shared histogram, and each thread collected only its own
+    assert stats['concurrent']['count'] == per_thread * threads == stats['concurrent']['items']['items']
+    assert all(stages['concurrent']['calls'] == per_thread and stages['concurrent']['items'] == per_thread
+               for stages in breakdowns)
+    print(f"{spans} spans: {alone * 1e6:.2f} us each alone, "
+          f"{concurrent * 1e6:.2f} us each from {threads} threads while collecting")
+
+
+if __name__ == '__main__':
+    benchmark()
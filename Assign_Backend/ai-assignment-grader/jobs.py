@@ -0,0 +1,279 @@
+"""Persistent grading job queue with a bounded worker pool.
+
+Jobs live in SQLite so every worker process shares one queue and a job
+outlives the process that accepted it. A worker claims a job with a lease
+that a heartbeat thread keeps extending while it runs; if the process dies
+the lease runs out and the job goes back to the queue, up to
+``max_attempts`` times.
+"""
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATES = ('done', 'failed')
+
+
+def _json_default(value):
+    # numpy scalars and arrays in metric results
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+class JobQueue:
+    """Queue of grading jobs processed by a pool of worker threads in each process"""
+
+    def __init__(self, path, handler, workers=2, lease_seconds=60.0, max_attempts=3,
+                 poll_interval=1.0, retention_seconds=24 * 3600):
+        self.path = path
+        self.handler = handler
+        self.workers = workers
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        self._changed = threading.Condition()
+        self._running = set()
+        self._running_lock = threading.Lock()
+        self._threads = []
+        self._stopping = threading.Event()
+
+        db = self._db()
+        db.execute('''CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY, kind TEXT NOT NULL, payload TEXT NOT NULL,
+            status TEXT NOT NULL, stage TEXT, progress REAL NOT NULL DEFAULT 0,
+            result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0,
+            created REAL NOT NULL, started REAL, finished REAL,
+            lease_until REAL, owner TEXT)''')
+        db.execute('CREATE INDEX IF NOT EXISTS jobs_queue ON jobs (status, created)')
+
+    def _db(self):
+        # One connection per thread; SQLite serializes writers across processes
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.row_factory = sqlite3.Row
+            self._local.db = db
+        return db
+
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    # ------------------------------------------------------------------ clients
+
+    def submit(self, kind, payload):
+        """Queue a job and return its id"""
+        job_id = uuid.uuid4().hex
+        self._db().execute(
+            'INSERT INTO jobs (id, kind, payload, status, stage, created) VALUES (?, ?, ?, ?, ?, ?)',
+            (job_id, kind, json.dumps(payload), 'queued', 'queued', time.time())
+        )
+        self._notify()
+        return job_id
+
+    def status(self, job_id):
+        """Job state without the result, or None if the job does not exist"""
+        row = self._db().execute(
+            'SELECT id, status, stage, progress, error, attempts, created, started, finished FROM jobs WHERE id = ?',
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'job_id': row['id'],
+            'status': row['status'],
+            'stage': row['stage'],
+            'progress': round(row['progress'], 3),
+            'error': row['error'],
+            'attempts': row['attempts'],
+            'created_at': row['created'],
+            'started_at': row['started'],
+            'finished_at': row['finished']
+        }
+
+    def wait(self, job_id, timeout, known_stage=None):
+        """Long-poll: return the status once the job finishes or leaves known_stage, or after timeout.
+
+        Without known_stage, waits for the job to leave the stage it is in when called.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            status = self.status(job_id)
+            if status is not None and known_stage is None:
+                known_stage = status['stage']
+            if status is None or status['status'] in TERMINAL_STATES or status['stage'] != known_stage:
+                return status
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return status
+            # Woken early by progress in this process; other processes are seen by polling
+            with self._changed:
+                self._changed.wait(min(remaining, 0.5))
+
+    def result(self, job_id):
+        row = self._db().execute('SELECT result FROM jobs WHERE id = ? AND status = ?', (job_id, 'done')).fetchone()
+        return json.loads(row['result']) if row else None
+
+    def stats(self, recent=100):
+        """Queue depth, running jobs, and wait and run times of recently finished jobs"""
+        db = self._db()
+        counts = dict(db.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+        rows = db.execute(
+            'SELECT started - created, finished - started FROM jobs WHERE status = ? ORDER BY finished DESC LIMIT ?',
+            ('done', recent)
+        ).fetchall()
+        oldest = db.execute('SELECT MIN(created) FROM jobs WHERE status = ?', ('queued',)).fetchone()[0]
+
+        def summarize(values):
+            values = sorted(v for v in values if v is not None)
+            if not values:
+                return None
+            return {
+                'avg': round(sum(values) / len(values), 3),
+                'p50': round(values[len(values) // 2], 3),
+                'p95': round(values[min(len(values) - 1, int(len(values) * 0.95))], 3),
+                'max': round(values[-1], 3)
+            }
+
+        return {
+            'queue_depth': counts.get('queued', 0),
+            'running': counts.get('running', 0),
+            'done': counts.get('done', 0),
+            'failed': counts.get('failed', 0),
+            'oldest_queued_seconds': round(time.time() - oldest, 3) if oldest else None,
+            'wait_seconds': summarize(row[0] for row in rows),
+            'run_seconds': summarize(row[1] for row in rows),
+            'workers_per_process': self.workers
+        }
+
+    # ------------------------------------------------------------------ workers
+
+    def start(self):
+        """Start the worker and heartbeat threads of this process"""
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f'grading-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(target=self._heartbeat_loop, name='grading-heartbeat', daemon=True)
+        thread.start()
+        self._threads.append(thread)
+        logger.info(f"Started {self.workers} grading worker(s) on {self.path}")
+
+    def stop(self):
+        self._stopping.set()
+        self._notify()
+
+    def _requeue_expired(self, db):
+        """Return jobs whose worker stopped renewing its lease to the queue, or fail them after max_attempts"""
+        now = time.time()
+        failed = db.execute(
+            "UPDATE jobs SET status = 'failed', stage = 'failed', error = ?, finished = ?, owner = NULL "
+            "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+            (f'Worker lost {self.max_attempts} times', now, now, self.max_attempts)
+        ).rowcount
+        requeued = db.execute(
+            "UPDATE jobs SET status = 'queued', stage = 'queued', progress = 0, owner = NULL "
+            "WHERE status = 'running' AND lease_until < ?",
+            (now,)
+        ).rowcount
+        if requeued or failed:
+            logger.warning(f"Requeued {requeued} and failed {failed} job(s) with expired leases")
+
+    def _claim(self):
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            self._requeue_expired(db)
+            row = db.execute(
+                "SELECT id, kind, payload FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1"
+            ).fetchone()
+            if row is not None:
+                now = time.time()
+                db.execute(
+                    "UPDATE jobs SET status = 'running', stage = 'starting', started = ?, lease_until = ?, "
+                    "owner = ?, attempts = attempts + 1 WHERE id = ?",
+                    (now, now + self.lease_seconds, self.owner, row['id'])
+                )
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        return row
+
+    def _progress(self, job_id, stage, progress):
+        self._db().execute(
+            "UPDATE jobs SET stage = ?, progress = ?, lease_until = ? WHERE id = ? AND owner = ?",
+            (stage, progress, time.time() + self.lease_seconds, job_id, self.owner)
+        )
+        self._notify()
+
+    def _finish(self, job_id, result=None, error=None):
+        status = 'failed' if error else 'done'
+        self._db().execute(
+            "UPDATE jobs SET status = ?, stage = ?, progress = ?, result = ?, error = ?, finished = ?, "
+            "lease_until = NULL WHERE id = ? AND owner = ?",
+            (status, status, 1.0 if not error else 0.0,
+             json.dumps(result, default=_json_default) if result is not None else None,
+             error, time.time(), job_id, self.owner)
+        )
+        self._notify()
+
+    def _worker_loop(self):
+        while not self._stopping.is_set():
+            try:
+                row = self._claim()
+            except Exception as e:
+                logger.error(f"Error claiming grading job: {e}")
+                row = None
+            if row is None:
+                with self._changed:
+                    self._changed.wait(self.poll_interval)
+                continue
+
+            job_id = row['id']
+            with self._running_lock:
+                self._running.add(job_id)
+            try:
+                result = self.handler(row['kind'], json.loads(row['payload']),
+                                      lambda stage, progress: self._progress(job_id, stage, progress))
+                self._finish(job_id, result=result)
+            except Exception as e:
+                logger.error(f"Grading job {job_id} failed: {e}", exc_info=True)
+                self._finish(job_id, error=str(e))
+            finally:
+                with self._running_lock:
+                    self._running.discard(job_id)
+
+    def _heartbeat_loop(self):
+        last_cleanup = 0.0
+        while not self._stopping.wait(self.lease_seconds / 4):
+            with self._running_lock:
+                running = list(self._running)
+            try:
+                db = self._db()
+                if running:
+                    db.executemany(
+                        "UPDATE jobs SET lease_until = ? WHERE id = ? AND owner = ? AND status = 'running'",
+                        [(time.time() + self.lease_seconds, job_id, self.owner) for job_id in running]
+                    )
+                if time.time() - last_cleanup > 3600:
+                    db.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished < ?",
+                               (time.time() - self.retention_seconds,))
+                    last_cleanup = time.time()
+            except Exception as e:
+                logger.error(f"Grading job heartbeat failed: {e}")
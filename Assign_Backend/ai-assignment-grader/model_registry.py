@@ -0,0 +1,230 @@
+import gc
+import logging
+import os
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+
+def resident_memory_bytes():
+    """Resident set size of this process in bytes, or None if it cannot be read"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def model_bytes(model):
+    """Bytes of the torch parameters and buffers of a model or pipeline, or None if it has none"""
+    module = getattr(model, 'model', model)
+    if not callable(getattr(module, 'parameters', None)) or not callable(getattr(module, 'buffers', None)):
+        return None
+    tensors = list(module.parameters()) + list(module.buffers())
+    if not tensors:
+        # A torch wrapper around another runtime (sentence-transformers on OpenVINO)
+        return None
+    # Tied weights are shared between modules; count each tensor's storage once
+    seen, total = set(), 0
+    for tensor in tensors:
+        if tensor.data_ptr() in seen:
+            continue
+        seen.add(tensor.data_ptr())
+        total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class ModelRegistry:
+    """Models registered by name, loaded on first use and evicted under a memory budget.
+
+    Indexing the registry (``registry['nlp']``) loads the model if needed and
+    returns it, or None if it failed to load, so callers can keep treating a
+    missing model as unavailable. Loads are serialized, which keeps each
+    model's resident memory delta attributable to it.
+
+    With a ``memory_budget`` in bytes, loading a model that would not fit
+    first evicts the least recently used models; an evicted model is loaded
+    again the next time it is requested. A model's footprint is the size of
+    its torch tensors, or the resident memory it added for other models.
+    Before the first load it is estimated with the model's ``size_hint``.
+    Callers still holding an evicted model keep it alive until they finish.
+
+    A model that failed to load is tried again on a later request once
+    ``retry_seconds`` have passed, doubling after each consecutive failure
+    up to ``max_retry_seconds``, so a model that becomes available (its
+    files copied in, memory freed) does not need a restart.
+    """
+
+    def __init__(self, memory_budget=None, retry_seconds=60, max_retry_seconds=3600):
+        self.memory_budget = memory_budget or None
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self._loaders = {}
+        self._size_hints = {}
+        self._pinned = set()
+        self._models = {}
+        self._status = {}
+        self._load_lock = threading.Lock()
+        self.evictions = 0
+
+    def register(self, name, loader, size_hint=None, pinned=False):
+        """Register a zero-argument loader for a model.
+
+        size_hint is a zero-argument callable estimating the model's size in
+        bytes before it has been loaded; pinned models are never evicted.
+        """
+        self._loaders[name] = loader
+        if size_hint is not None:
+            self._size_hints[name] = size_hint
+        if pinned:
+            self._pinned.add(name)
+        self._status[name] = {
+            'state': 'not_loaded', 'load_seconds': None, 'memory_mb': None, 'footprint_mb': None,
+            'error': None, 'loads': 0, 'evictions': 0, 'last_used': None, 'reload_seconds': None,
+            'failed_at': None, 'failures': 0, 'retry_at': None
+        }
+
+    def __contains__(self, name):
+        return name in self._loaders
+
+    def __getitem__(self, name):
+        return self.get(name)
+
+    def get(self, name):
+        """Return the named model, loading it first if needed"""
+        model = self._models.get(name)
+        if model is not None:
+            self._status[name]['last_used'] = time.time()
+            return model
+        if name not in self._loaders:
+            raise KeyError(name)
+
+        with self._load_lock:
+            if name in self._models:
+                self._status[name]['last_used'] = time.time()
+                return self._models[name]
+            status = self._status[name]
+            if status['state'] == 'failed' and time.time() < status['retry_at']:
+                return None
+
+            if self.memory_budget:
+                self._make_room(self._expected_bytes(name), keep=name)
+
+            reload = status['loads'] > 0
+            status['state'] = 'loading'
+            rss_before = resident_memory_bytes()
+            start = time.perf_counter()
+            try:
+                model = self._loaders[name]()
+            except Exception as e:
+                failures = status['failures'] + 1
+                backoff = min(self.retry_seconds * 2 ** (failures - 1), self.max_retry_seconds)
+                now = time.time()
+                status.update(state='failed', error=str(e), load_seconds=round(time.perf_counter() - start, 2),
+                              failed_at=now, failures=failures, retry_at=now + backoff)
+                logger.error(f"Error loading model {name} (attempt {failures}, retrying after {backoff:.0f}s): {e}")
+                return None
+
+            rss_after = resident_memory_bytes()
+            status.update(state='loaded', load_seconds=round(time.perf_counter() - start, 2),
+                          loads=status['loads'] + 1, last_used=time.time(), error=None, failures=0, retry_at=None)
+            if reload:
+                status['reload_seconds'] = status['load_seconds']
+            rss_delta = None
+            if rss_before is not None and rss_after is not None:
+                rss_delta = max(0, rss_after - rss_before)
+                status['memory_mb'] = round(rss_delta / (1024 * 1024), 1)
+            footprint = model_bytes(model)
+            if footprint is None:
+                # Runtimes that allocate lazily (OpenVINO) show little at load; fall back to the estimate
+                footprint = rss_delta or self._expected_bytes(name)
+            status['footprint'] = footprint
+            status['footprint_mb'] = round(footprint / (1024 * 1024), 1)
+            self._models[name] = model
+            logger.info(f"Model {name} {'reloaded' if reload else 'loaded'} in {status['load_seconds']}s "
+                        f"({status['footprint_mb']} MB)")
+
+            # The estimate may have been low
+            if self.memory_budget:
+                self._make_room(0, keep=name)
+            return model
+
+    def _expected_bytes(self, name):
+        status = self._status[name]
+        if status.get('footprint') is not None:
+            return status['footprint']
+        hint = self._size_hints.get(name)
+        if hint is None:
+            return 0
+        try:
+            return hint() or 0
+        except Exception as e:
+            logger.warning(f"Could not estimate the size of model {name}: {e}")
+            return 0
+
+    def resident_bytes(self):
+        """Sum of the footprints of the loaded models"""
+        return sum(self._status[name].get('footprint') or 0 for name in list(self._models))
+
+    def _make_room(self, needed, keep):
+        """Evict least recently used models until `needed` more bytes fit in the budget"""
+        candidates = sorted((name for name in self._models if name != keep and name not in self._pinned),
+                            key=lambda name: self._status[name]['last_used'] or 0)
+        for name in candidates:
+            if self.resident_bytes() + needed <= self.memory_budget:
+                break
+            self.evict(name)
+        if self.resident_bytes() + needed > self.memory_budget:
+            logger.warning(f"Model memory budget of {self.memory_budget // (1024 * 1024)} MB exceeded "
+                           f"with nothing left to evict")
+
+    def evict(self, name):
+        """Drop a loaded model; it is loaded again on its next use"""
+        model = self._models.pop(name, None)
+        if model is None:
+            return False
+        status = self._status[name]
+        status.update(state='evicted', evictions=status['evictions'] + 1)
+        self.evictions += 1
+        del model
+        gc.collect()
+        logger.info(f"Evicted model {name} ({status['footprint_mb']} MB)")
+        return True
+
+    def is_loaded(self, name):
+        return name in self._models
+
+    def warmup(self, names, background=True):
+        """Load the given models, by default in a daemon thread so the server can start serving first"""
+        def load_all():
+            for name in names:
+                if name in self._loaders:
+                    self.get(name)
+            logger.info(f"Model warmup finished: {', '.join(names)}")
+
+        if not background:
+            load_all()
+            return None
+        thread = threading.Thread(target=load_all, name='model-warmup', daemon=True)
+        thread.start()
+        return thread
+
+    def status(self):
+        """Load state, footprint, evictions and reload times of every model, and the budget in use"""
+        rss = resident_memory_bytes()
+        return {
+            'models': {name: {key: value for key, value in status.items() if key != 'footprint'}
+                       for name, status in self._status.items()},
+            'memory_budget_mb': round(self.memory_budget / (1024 * 1024), 1) if self.memory_budget else None,
+            'resident_models_mb': round(self.resident_bytes() / (1024 * 1024), 1),
+            'evictions': self.evictions,
+            'process_memory_mb': round(rss / (1024 * 1024), 1) if rss is not None else None
+        }
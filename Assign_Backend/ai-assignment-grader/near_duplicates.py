@@ -0,0 +1,283 @@
+"""Near-duplicate detection across the submissions of an assignment with MinHash and LSH.
+
+Each submission is reduced to a MinHash signature of its word shingles:
+NUM_PERM minimum hash values whose agreement rate between two submissions
+estimates the Jaccard similarity of their shingle sets. Signatures are cut
+into LSH_BANDS bands; two submissions become candidates when any band is
+identical, so a query looks up LSH_BANDS buckets instead of comparing
+against every submission. With 32 bands of 4 rows, pairs above about 0.5
+Jaccard similarity are found with high probability and pairs below 0.2
+rarely become candidates.
+
+Signatures and buckets live in SQLite, shared by all worker processes.
+Run this module directly to index and query 10,000 generated submissions
+with planted copies:
+
+    python near_duplicates.py
+"""
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = 128
+LSH_BANDS = 32
+SHINGLE_WORDS = 5
+# Shingle hashes are permuted in blocks to bound memory on very long submissions
+_SHINGLE_BLOCK = 4096
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_SHINGLE_BASE = np.uint64(1000003)
+# SQLite limits the number of bound parameters per statement
+_QUERY_BATCH = 500
+
+_WORD = re.compile(r'\w+')
+# One primary key lookup per band; SQLite scans the whole assignment for an OR of the bands
+_BUCKET_QUERY = ' UNION '.join(f"SELECT submission FROM buckets WHERE assignment = ?1 AND band = {band} "
+                               f"AND hash = ?{band + 2}" for band in range(LSH_BANDS))
+
+
+def _permutations(num_perm, seed=1):
+    # a, b < 2**32 and shingle hashes < 2**32 keep a * x + b within uint64
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, int(_MAX_HASH), num_perm, dtype=np.uint64)
+    b = rng.randint(0, int(_MAX_HASH), num_perm, dtype=np.uint64)
+    return a, b
+
+
+_PERMUTATIONS = _permutations(NUM_PERM)
+_BAND_MULTIPLIERS = np.random.RandomState(2).randint(1, 1 << 62, NUM_PERM // LSH_BANDS, dtype=np.uint64) * 2 + 1
+
+
+def shingle_hashes(text, size=SHINGLE_WORDS):
+    """Distinct 32-bit hashes of a text's lowercased word n-grams; a text shorter than one shingle is one shingle.
+
+    Words are hashed once and each shingle hash is a polynomial of its word
+    hashes, so no shingle strings are built.
+    """
+    words = _WORD.findall(text.lower())
+    if not words:
+        return np.zeros(0, dtype=np.uint64)
+    vocabulary = {word: zlib.crc32(word.encode('utf-8')) for word in set(words)}
+    word_hashes = np.fromiter(map(vocabulary.__getitem__, words), dtype=np.uint64, count=len(words))
+    size = min(size, len(words))
+    count = len(words) - size + 1
+    hashes = np.zeros(count, dtype=np.uint64)
+    for offset in range(size):
+        hashes = (hashes * _SHINGLE_BASE + word_hashes[offset:offset + count]) & _MAX_HASH
+    return np.unique(hashes)
+
+
+def minhash(text):
+    """MinHash signature of a text's shingles as NUM_PERM uint32 values, or None for a text without words"""
+    hashes = shingle_hashes(text)
+    if not len(hashes):
+        return None
+    a, b = _PERMUTATIONS
+    signature = np.full(NUM_PERM, _MAX_HASH, dtype=np.uint64)
+    for start in range(0, len(hashes), _SHINGLE_BLOCK):
+        block = hashes[start:start + _SHINGLE_BLOCK, None]
+        permuted = block * a + b
+        # One folding step of reduction modulo the Mersenne prime; cheaper than % and as good for hashing
+        permuted = ((permuted & _MERSENNE_PRIME) + (permuted >> np.uint64(61))) & _MAX_HASH
+        np.minimum(signature, permuted.min(axis=0), out=signature)
+    return signature.astype(np.uint32)
+
+
+def band_hashes(signature, bands=LSH_BANDS):
+    """One signed 64-bit bucket key per band of a signature"""
+    rows = signature.reshape(bands, -1).astype(np.uint64)
+    # Wraps modulo 2**64; a rare collision only adds a candidate, which is then compared in full
+    return (rows * _BAND_MULTIPLIERS[:rows.shape[1]]).sum(axis=1).view(np.int64).tolist()
+
+
+def jaccard(signature, others):
+    """Estimated Jaccard similarity of one signature to each row of others"""
+    return (np.asarray(others) == signature).mean(axis=1)
+
+
+class NearDuplicateIndex:
+    """Per-assignment LSH index of submission signatures shared by all worker processes"""
+
+    def __init__(self, path, min_similarity=0.5, max_matches=5):
+        self.min_similarity = min_similarity
+        self.max_matches = max_matches
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS signatures (
+            assignment TEXT NOT NULL, submission TEXT NOT NULL, signature BLOB NOT NULL, added REAL NOT NULL,
+            PRIMARY KEY (assignment, submission))''')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS buckets (
+            assignment TEXT NOT NULL, band INTEGER NOT NULL, hash INTEGER NOT NULL, submission TEXT NOT NULL,
+            PRIMARY KEY (assignment, band, hash, submission)) WITHOUT ROWID''')
+        self._lock = threading.Lock()
+        self.checks = 0
+        self.candidates = 0
+        self.seconds = 0.0
+
+    def _signatures(self, assignment, submissions):
+        found = {}
+        for start in range(0, len(submissions), _QUERY_BATCH):
+            batch = submissions[start:start + _QUERY_BATCH]
+            found.update(self._db.execute(
+                f"SELECT submission, signature FROM signatures WHERE assignment = ? "
+                f"AND submission IN ({','.join('?' * len(batch))})", [assignment] + batch))
+        return {submission: np.frombuffer(blob, dtype=np.uint32) for submission, blob in found.items()}
+
+    def _query(self, assignment, signature, exclude):
+        candidates = {row[0] for row in self._db.execute(_BUCKET_QUERY, [assignment] + band_hashes(signature))}
+        candidates.discard(exclude)
+        signatures = self._signatures(assignment, sorted(candidates))
+        self.candidates += len(signatures)
+        if not signatures:
+            return []
+        names = list(signatures)
+        similarity = jaccard(signature, np.stack([signatures[name] for name in names]))
+        matches = sorted(((round(float(s), 3), name) for s, name in zip(similarity, names)
+                          if s >= self.min_similarity), reverse=True)
+        return [{'submission_id': name, 'similarity': s} for s, name in matches[:self.max_matches]]
+
+    def _add(self, assignment, submission, signature):
+        previous = self._db.execute('SELECT signature FROM signatures WHERE assignment = ? AND submission = ?',
+                                    (assignment, submission)).fetchone()
+        if previous is not None:
+            # Deleting by full key; deleting by submission alone would scan the assignment's buckets
+            self._db.executemany('DELETE FROM buckets WHERE assignment = ? AND band = ? AND hash = ? AND submission = ?',
+                                 [(assignment, band, key, submission) for band, key in
+                                  enumerate(band_hashes(np.frombuffer(previous[0], dtype=np.uint32)))])
+        self._db.execute('INSERT OR REPLACE INTO signatures (assignment, submission, signature, added) '
+                         'VALUES (?, ?, ?, ?)', (assignment, submission, signature.tobytes(), time.time()))
+        self._db.executemany('INSERT OR IGNORE INTO buckets (assignment, band, hash, submission) VALUES (?, ?, ?, ?)',
+                             [(assignment, band, key, submission) for band, key in enumerate(band_hashes(signature))])
+
+    def query(self, assignment, signature, exclude=None):
+        """Indexed submissions of an assignment at least min_similarity similar, most similar first"""
+        with self._lock:
+            return self._query(assignment, signature, exclude)
+
+    def check_many(self, assignment, items):
+        """Compare each (submission id, text) with the assignment's earlier submissions, then index it.
+
+        Runs in one transaction, so a batch also finds copies within itself
+        and concurrent checks from other processes see each other. Returns
+        one {'submission_id', 'matches': [{'submission_id', 'similarity'}]}
+        per item, with similarity the estimated Jaccard similarity of word
+        shingles.
+        """
+        start = time.perf_counter()
+        signatures = [minhash(text) for _, text in items]
+        results = []
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                for (submission, _), signature in zip(items, signatures):
+                    matches = []
+                    if signature is not None:
+                        matches = self._query(assignment, signature, submission)
+                        self._add(assignment, submission, signature)
+                    results.append({'submission_id': submission, 'matches': matches})
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+            self.checks += len(items)
+            self.seconds += time.perf_counter() - start
+        return results
+
+    def check(self, assignment, submission, text):
+        """check_many for a single submission"""
+        return self.check_many(assignment, [(submission, text)])[0]
+
+    def pairs(self, assignment, min_similarity=None):
+        """All pairs of an assignment's submissions at least min_similarity similar, most similar first"""
+        min_similarity = self.min_similarity if min_similarity is None else min_similarity
+        with self._lock:
+            buckets = self._db.execute(
+                "SELECT group_concat(submission, char(31)) FROM buckets WHERE assignment = ? "
+                "GROUP BY band, hash HAVING COUNT(*) > 1", (assignment,)).fetchall()
+            candidates = {tuple(sorted((a, b))) for (members,) in buckets
+                          for i, a in enumerate(members.split('\x1f')) for b in members.split('\x1f')[i + 1:]}
+            signatures = self._signatures(assignment, sorted({name for pair in candidates for name in pair}))
+        pairs = []
+        for a, b in candidates:
+            similarity = float((signatures[a] == signatures[b]).mean())
+            if similarity >= min_similarity:
+                pairs.append({'submission_ids': [a, b], 'similarity': round(similarity, 3)})
+        return sorted(pairs, key=lambda pair: -pair['similarity'])
+
+    @property
+    def stats(self):
+        return {
+            'checks': self.checks,
+            'candidates_per_check': round(self.candidates / self.checks, 2) if self.checks else None,
+            'ms_per_check': round(self.seconds * 1000 / self.checks, 3) if self.checks else None,
+            'min_similarity': self.min_similarity
+        }
+
+
+def _edit(text, rng, fraction):
+    words = text.split()
+    for i in rng.sample(range(len(words)), int(len(words) * fraction)):
+        words[i] = rng.choice(words)
+    return ' '.join(words)
+
+
+def benchmark(submissions=10000, words=300, copies=100):
+    """Index and query generated submissions, some of them lightly edited copies of earlier ones"""
+    import random
+    import tempfile
+
+    from document import _essay
+
+    rng = random.Random(0)
+    texts, planted = [], {}
+    for i in range(submissions):
+        if i >= submissions // 10 and i % (submissions // copies) == 0:
+            original = rng.randrange(i)
+            planted[str(i)] = str(original)
+            texts.append(_edit(texts[original], rng, 0.05))
+        else:
+            texts.append(_essay(words, seed=i))
+
+    with tempfile.TemporaryDirectory() as scratch:
+        index = NearDuplicateIndex(os.path.join(scratch, 'near_duplicates.sqlite'))
+        start = time.perf_counter()
+        results = [index.check('one-by-one', str(i), text) for i, text in enumerate(texts)]
+        single = time.perf_counter() - start
+        start = time.perf_counter()
+        for first in range(0, submissions, 500):
+            index.check_many('batched', [(str(i), texts[i]) for i in range(first, min(first + 500, submissions))])
+        batched = time.perf_counter() - start
+
+        found = sum(any(m['submission_id'] == planted[r['submission_id']] for m in r['matches'])
+                    for r in results if r['submission_id'] in planted)
+        false = sum(bool(r['matches']) for r in results if r['submission_id'] not in planted)
+        print(f"{submissions} submissions indexed and queried one by one in {single:.2f}s "
+              f"({single * 1000 / submissions:.2f} ms each), in batches of 500 in {batched:.2f}s; "
+              f"{found}/{len(planted)} planted copies found, {false} other submissions flagged, "
+              f"{index.candidates / index.checks:.2f} candidates per query")
+
+        start = time.perf_counter()
+        pairs = index.pairs('one-by-one')
+        print(f"all near-duplicate pairs: {len(pairs)} in {time.perf_counter() - start:.2f}s")
+
+        # What comparing every pair would cost, extrapolated from a sample
+        signatures = np.stack([minhash(text) for text in texts[:500]])
+        start = time.perf_counter()
+        for signature in signatures:
+            jaccard(signature, signatures)
+        per_row = (time.perf_counter() - start) / len(signatures) * submissions / len(signatures)
+        print(f"all-pairs signature comparison: about {per_row * submissions:.1f}s for {submissions} submissions")
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,154 @@
+"""OpenVINO inference for the sentence encoder and the sentiment classifier.
+
+With INFERENCE_BACKEND=openvino each model is exported to OpenVINO IR the
+first time it is loaded and the export is kept under DATA_DIR/openvino,
+one directory per model snapshot, so later loads (and other worker
+processes) reuse it. Inference runs at FP32 precision to match PyTorch.
+
+Export ahead of time, or compare both backends on a generated essay:
+
+    python openvino_backend.py --export
+    python openvino_backend.py --benchmark
+"""
+import argparse
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from preflight import DATA_DIR, HF_MODELS, configure_environment, model_versions
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_BACKENDS = ('pytorch', 'openvino')
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'pytorch').lower()
+OPENVINO_DIR = os.path.join(DATA_DIR, 'openvino')
+# Keep FP32 so outputs match PyTorch; CPUs with bf16 support would otherwise default to it
+OV_CONFIG = {'INFERENCE_PRECISION_HINT': 'f32'}
+
+
+def export_path(name, version):
+    """Export directory for one version of a registered model"""
+    return os.path.join(OPENVINO_DIR, f"{name}-{hashlib.sha1(version.encode('utf-8')).hexdigest()[:12]}")
+
+
+def _export_once(path, export):
+    """Run export(directory) into a temporary directory and move it to path, unless path already exists"""
+    if os.path.isdir(path):
+        return
+    os.makedirs(OPENVINO_DIR, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=OPENVINO_DIR, prefix='.export-')
+    start = time.perf_counter()
+    try:
+        export(tmp)
+        os.replace(tmp, path)
+        logger.info(f"Exported {os.path.basename(path)} to OpenVINO in {time.perf_counter() - start:.1f}s")
+    except OSError:
+        # Another worker process finished the same export first
+        if not os.path.isdir(path):
+            raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def load_sentence_encoder(model_id, path):
+    """SentenceTransformer running on OpenVINO, exported from model_id on first use"""
+    from sentence_transformers import SentenceTransformer
+    _export_once(path, lambda tmp: SentenceTransformer(model_id, backend='openvino').save(tmp))
+    return SentenceTransformer(path, backend='openvino', model_kwargs={'ov_config': OV_CONFIG})
+
+
+def load_sequence_classifier(task, model_id, path):
+    """transformers pipeline over an OpenVINO sequence classification model, exported on first use"""
+    from optimum.intel import OVModelForSequenceClassification
+    from transformers import AutoTokenizer, pipeline
+
+    def export(tmp):
+        OVModelForSequenceClassification.from_pretrained(model_id, export=True).save_pretrained(tmp)
+        AutoTokenizer.from_pretrained(model_id).save_pretrained(tmp)
+
+    _export_once(path, export)
+    model = OVModelForSequenceClassification.from_pretrained(path, ov_config=OV_CONFIG)
+    return pipeline(task, model=model, tokenizer=AutoTokenizer.from_pretrained(path))
+
+
+def _timed(fn, repeats):
+    fn()  # warm up
+    wall, cpu = time.perf_counter(), time.process_time()
+    for _ in range(repeats):
+        result = fn()
+    wall, cpu = (time.perf_counter() - wall) / repeats, (time.process_time() - cpu) / repeats
+    return result, wall, cpu
+
+
+def benchmark(sentence_model, sentiment_model, words=3000, repeats=3):
+    """Latency, CPU time and output agreement of PyTorch and OpenVINO on one generated essay"""
+    from sentence_transformers import SentenceTransformer
+    from transformers import pipeline
+
+    from document import ParsedDocument, _essay
+    from sentiment import classify_chunks
+
+    sentences = ParsedDocument(_essay(words)).sentences
+    versions = model_versions()
+    with tempfile.TemporaryDirectory() as scratch:
+        def path(name, model_id):
+            # Local model directories are exported to a scratch directory
+            if os.path.isdir(model_id):
+                return os.path.join(scratch, name)
+            return export_path(name, versions[name])
+
+        encoders = {
+            'pytorch': SentenceTransformer(sentence_model),
+            'openvino': load_sentence_encoder(sentence_model, path('sentence_transformer', sentence_model))
+        }
+        classifiers = {
+            'pytorch': pipeline('sentiment-analysis', model=sentiment_model),
+            'openvino': load_sequence_classifier('sentiment-analysis', sentiment_model,
+                                                 path('sentiment_analyzer', sentiment_model))
+        }
+
+        embeddings, labels = {}, {}
+        for backend in INFERENCE_BACKENDS:
+            embeddings[backend], wall, cpu = _timed(lambda: encoders[backend].encode(sentences), repeats)
+            print(f"encoder   {backend:8s} {wall * 1000:7.0f} ms, {cpu * 1000:7.0f} ms CPU "
+                  f"({len(sentences)} sentences)")
+            labels[backend], wall, cpu = _timed(lambda: classify_chunks(classifiers[backend], sentences), repeats)
+            print(f"sentiment {backend:8s} {wall * 1000:7.0f} ms, {cpu * 1000:7.0f} ms CPU "
+                  f"({len(labels[backend])} chunks)")
+
+    a, b = embeddings['pytorch'], embeddings['openvino']
+    cosine = np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+    same_labels = sum(x['label'] == y['label'] for x, y in zip(labels['pytorch'], labels['openvino']))
+    score_diff = max(abs(x['score'] - y['score']) for x, y in zip(labels['pytorch'], labels['openvino']))
+    print(f"embedding cosine min {cosine.min():.6f}, max abs diff {np.abs(a - b).max():.2e}; "
+          f"sentiment labels {same_labels}/{len(labels['pytorch'])} equal, max score diff {score_diff:.2e}")
+    assert cosine.min() > 0.999 and same_labels == len(labels['pytorch']) and score_diff < 1e-2
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the grader's models to OpenVINO or benchmark both backends")
+    parser.add_argument('--export', action='store_true', help="Export the cached models to OpenVINO IR")
+    parser.add_argument('--benchmark', action='store_true', help="Compare PyTorch and OpenVINO latency and outputs")
+    parser.add_argument('--sentence-model', default=HF_MODELS['sentence_transformer'])
+    parser.add_argument('--sentiment-model', default=HF_MODELS['sentiment_analyzer'])
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    configure_environment()
+    if args.export:
+        versions = model_versions()
+        load_sentence_encoder(HF_MODELS['sentence_transformer'],
+                              export_path('sentence_transformer', versions['sentence_transformer']))
+        load_sequence_classifier('sentiment-analysis', HF_MODELS['sentiment_analyzer'],
+                                 export_path('sentiment_analyzer', versions['sentiment_analyzer']))
+    if args.benchmark:
+        benchmark(args.sentence_model, args.sentiment_model)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Chart data for a graded submission and on-demand PNG rendering.
+
+Grading only records the data behind each chart; PNGs are drawn when first
+requested. Rendering uses Figure and FigureCanvasAgg directly instead of
+pyplot's global figure state, so several requests can draw at once.
+
+Run this module directly to compare rendering every chart up front with
+collecting the chart data only:
+
+    python plots.py
+"""
+import io
+import time
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+CHART_NAMES = ('quality_metrics', 'criteria_coverage', 'word_cloud')
+
+
+def chart_data(quality_metrics, style_metrics, semantic_analysis):
+    """The values behind each chart that applies to this result, as JSON-ready dicts"""
+    charts = {
+        'quality_metrics': {
+            'title': 'Text Quality Metrics',
+            'ylabel': 'Score',
+            'labels': ['Word Count', 'Readability', 'Grade Level', 'Sentence Length'],
+            'values': [
+                min(quality_metrics.get('word_count', 0) / 10, 100),
+                quality_metrics.get('readability_score', 0),
+                min(quality_metrics.get('grade_level', 0) * 10, 100),
+                min(quality_metrics.get('avg_sentence_length', 0) * 4, 100)
+            ],
+            'colors': ['#ff9999', '#66b3ff', '#99ff99', '#ffcc99']
+        }
+    }
+
+    if semantic_analysis:
+        criteria = list(semantic_analysis.keys())[:5]
+        charts['criteria_coverage'] = {
+            'title': 'Criteria Coverage Analysis',
+            'ylabel': 'Coverage Score (%)',
+            'labels': criteria,
+            'values': [semantic_analysis[c]['coverage_score'] * 100 for c in criteria]
+        }
+
+    frequencies = dict(style_metrics.get('word_frequency_distribution') or [])
+    if len(frequencies) > 1:
+        charts['word_cloud'] = {'title': 'Most Frequent Words', 'frequencies': frequencies}
+    return charts
+
+
+def _png(fig):
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+
+def _bar_chart(chart, figsize, short_labels=False):
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    labels = chart['labels']
+    if short_labels:
+        labels = [label[:20] + '...' if len(label) > 20 else label for label in labels]
+    bars = ax.bar(range(len(labels)), chart['values'], color=chart.get('colors', 'skyblue'))
+    ax.set_title(chart['title'])
+    ax.set_ylabel(chart['ylabel'])
+    ax.set_xticks(range(len(labels)))
+    ax.set_xticklabels(labels, rotation=45)
+    if short_labels:
+        for bar, value in zip(bars, chart['values']):
+            ax.text(bar.get_x() + bar.get_width() / 2, bar.get_height() + 1, f'{value:.1f}%', ha='center', va='bottom')
+    fig.tight_layout()
+    return _png(fig)
+
+
+def _word_cloud(chart):
+    from wordcloud import WordCloud
+    wordcloud = WordCloud(width=800, height=400, background_color='white',
+                          min_font_size=10).generate_from_frequencies(chart['frequencies'])
+    fig = Figure(figsize=(10, 5))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.imshow(wordcloud, interpolation='bilinear')
+    ax.axis('off')
+    ax.set_title(chart['title'])
+    return _png(fig)
+
+
+def render_chart(name, chart):
+    """PNG bytes of one chart from its chart_data entry"""
+    if name == 'quality_metrics':
+        return _bar_chart(chart, (8, 6))
+    if name == 'criteria_coverage':
+        return _bar_chart(chart, (10, 6), short_labels=True)
+    if name == 'word_cloud':
+        return _word_cloud(chart)
+    raise KeyError(name)
+
+
+def benchmark(repeats=3):
+    """Time rendering every chart against collecting the chart data"""
+    quality_metrics = {'word_count': 800, 'readability_score': 55.2, 'grade_level': 11.3, 'avg_sentence_length': 19.5}
+    style_metrics = {'word_frequency_distribution': [(f"word{i}", 40 - i) for i in range(20)]}
+    semantic_analysis = {f"Criterion number {i} about the topic": {'coverage_score': 0.1 * i} for i in range(1, 6)}
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        charts = chart_data(quality_metrics, style_metrics, semantic_analysis)
+    data = (time.perf_counter() - start) * 1000 / repeats
+
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for name, chart in charts.items():
+            render_chart(name, chart)
+    render = (time.perf_counter() - start) * 1000 / repeats
+    print(f"chart data: {data:.2f} ms; rendering all {len(charts)} PNGs: {render:.0f} ms")
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,220 @@
+"""Local data directory for NLTK corpora, the spaCy model and Hugging Face snapshots.
+
+At startup ``preflight()`` only checks that everything is already on disk
+and points NLTK and Hugging Face at the data directory; downloads are
+switched off unless GRADER_ALLOW_DOWNLOADS=1. Populate the directory once,
+with network access, by running:
+
+    python preflight.py --bootstrap     (or python setup.py)
+"""
+import argparse
+import importlib.metadata
+import importlib.util
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.path.abspath(os.environ.get(
+    'GRADER_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+))
+NLTK_DIR = os.path.join(DATA_DIR, 'nltk_data')
+HF_DIR = os.path.join(DATA_DIR, 'huggingface')
+SPACY_MODEL = 'en_core_web_sm'
+SPACY_DIR = os.path.join(DATA_DIR, 'spacy', SPACY_MODEL)
+ALLOW_DOWNLOADS = os.environ.get('GRADER_ALLOW_DOWNLOADS', '').lower() in ('1', 'true', 'yes')
+
+# NLTK package -> resource path checked with nltk.data.find
+NLTK_RESOURCES = {
+    'punkt': 'tokenizers/punkt',
+    'punkt_tab': 'tokenizers/punkt_tab',
+    'stopwords': 'corpora/stopwords',
+    'wordnet': 'corpora/wordnet',
+    'averaged_perceptron_tagger': 'taggers/averaged_perceptron_tagger',
+    'vader_lexicon': 'sentiment/vader_lexicon.zip',
+    'brown': 'corpora/brown',
+    # textstat's syllable counter; it tries to download this on first use otherwise
+    'cmudict': 'corpora/cmudict'
+}
+
+# Registry name -> Hugging Face repo id
+HF_MODELS = {
+    'sentence_transformer': 'sentence-transformers/all-MiniLM-L6-v2',
+    'sentiment_analyzer': 'cardiffnlp/twitter-roberta-base-sentiment-latest',
+    'text_classifier': 'distilbert-base-uncased-finetuned-sst-2-english',
+    'question_answering': 'distilbert-base-cased-distilled-squad',
+    'summarizer': 'facebook/bart-large-cnn'
+}
+# Only the PyTorch weights are used; skip the other frameworks' copies in each repo
+HF_IGNORE_PATTERNS = ['*.h5', '*.msgpack', '*.ot', '*.tflite', 'onnx/*', 'openvino/*', 'coreml/*']
+
+
+def configure_environment():
+    """Point NLTK and Hugging Face at the data directory; must run before transformers is imported"""
+    os.environ.setdefault('HF_HOME', HF_DIR)
+    if not ALLOW_DOWNLOADS:
+        os.environ['HF_HUB_OFFLINE'] = '1'
+        os.environ['TRANSFORMERS_OFFLINE'] = '1'
+
+    import nltk
+    if NLTK_DIR not in nltk.data.path:
+        nltk.data.path.insert(0, NLTK_DIR)
+
+
+def missing_nltk():
+    import nltk
+    missing = []
+    for package, resource in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            missing.append(package)
+    return missing
+
+
+def spacy_model_path():
+    """Where to load the spaCy model from, or None if it is not available locally"""
+    if os.path.exists(os.path.join(SPACY_DIR, 'config.cfg')):
+        return SPACY_DIR
+    if importlib.util.find_spec(SPACY_MODEL) is not None:
+        return SPACY_MODEL
+    return None
+
+
+def hf_cached(repo_id):
+    """Whether a snapshot of the repo is in the local Hugging Face cache"""
+    try:
+        from huggingface_hub import try_to_load_from_cache
+    except ImportError:
+        return False
+    return isinstance(try_to_load_from_cache(repo_id, 'config.json'), str)
+
+
+def hf_weights_bytes(repo_id):
+    """Size of the cached snapshot's weights, as an estimate of the model's memory; None if not cached"""
+    try:
+        from huggingface_hub import try_to_load_from_cache
+    except ImportError:
+        return None
+    config = try_to_load_from_cache(repo_id, 'config.json')
+    if not isinstance(config, str):
+        return None
+    sizes = {}
+    for root, _, files in os.walk(os.path.dirname(config)):
+        for name in files:
+            ext = os.path.splitext(name)[1]
+            if ext in ('.safetensors', '.bin'):
+                sizes[ext] = sizes.get(ext, 0) + os.path.getsize(os.path.join(root, name))
+    # Repos may ship both formats; only one of them is loaded
+    return max(sizes.values()) if sizes else None
+
+
+def model_versions():
+    """Snapshot revision of each cached Hugging Face model and the spaCy model version, for cache keys"""
+    versions = {}
+    try:
+        from huggingface_hub import try_to_load_from_cache
+    except ImportError:
+        try_to_load_from_cache = None
+    for name, repo_id in HF_MODELS.items():
+        path = try_to_load_from_cache(repo_id, 'config.json') if try_to_load_from_cache else None
+        # .../snapshots/<commit hash>/config.json
+        versions[name] = f"{repo_id}@{os.path.basename(os.path.dirname(path))}" if isinstance(path, str) else repo_id
+
+    path = spacy_model_path()
+    version = None
+    meta_path = os.path.join(SPACY_DIR, 'meta.json')
+    if path == SPACY_DIR and os.path.exists(meta_path):
+        with open(meta_path, encoding='utf-8') as f:
+            version = json.load(f).get('version')
+    elif path is not None:
+        try:
+            version = importlib.metadata.version(SPACY_MODEL)
+        except importlib.metadata.PackageNotFoundError:
+            pass
+    versions['nlp'] = f"{SPACY_MODEL}@{version}" if version else SPACY_MODEL
+    return versions
+
+
+def preflight():
+    """Check local resources without network access and return what is present.
+
+    Missing NLTK data is fatal, as the text metrics cannot run without it,
+    unless downloads are allowed, in which case it is fetched into the data
+    directory. Missing models only disable the analyses that need them.
+    """
+    configure_environment()
+
+    missing = missing_nltk()
+    if missing and ALLOW_DOWNLOADS:
+        import nltk
+        logger.info(f"Downloading NLTK data to {NLTK_DIR}: {', '.join(missing)}")
+        nltk.download(missing, download_dir=NLTK_DIR, quiet=True)
+        missing = missing_nltk()
+    if missing:
+        raise RuntimeError(f"NLTK data missing from {NLTK_DIR}: {', '.join(missing)}. "
+                           f"Run `python preflight.py --bootstrap` with network access.")
+
+    report = {
+        'data_dir': DATA_DIR,
+        'downloads_allowed': ALLOW_DOWNLOADS,
+        'nltk': True,
+        'spacy': spacy_model_path() is not None,
+        'huggingface': {name: hf_cached(repo_id) for name, repo_id in HF_MODELS.items()}
+    }
+    unavailable = [name for name, present in report['huggingface'].items() if not present]
+    if not report['spacy']:
+        unavailable.append(SPACY_MODEL)
+    if unavailable and not ALLOW_DOWNLOADS:
+        logger.warning(f"Not cached locally, will be unavailable: {', '.join(unavailable)}. "
+                       f"Run `python preflight.py --bootstrap` to fetch them.")
+    logger.info(f"Preflight finished using {DATA_DIR}")
+    return report
+
+
+def bootstrap(hf_models=None):
+    """Download everything into the data directory; the only step that needs network access"""
+    os.environ.setdefault('HF_HOME', HF_DIR)
+    os.makedirs(NLTK_DIR, exist_ok=True)
+
+    import nltk
+    nltk.data.path.insert(0, NLTK_DIR)
+    missing = missing_nltk()
+    if missing:
+        nltk.download(missing, download_dir=NLTK_DIR)
+    logger.info(f"NLTK data ready in {NLTK_DIR}")
+
+    if spacy_model_path() is None:
+        import spacy
+        import spacy.cli
+        spacy.cli.download(SPACY_MODEL)
+        importlib.invalidate_caches()
+        spacy.load(SPACY_MODEL).to_disk(SPACY_DIR)
+    logger.info(f"spaCy model ready ({spacy_model_path()})")
+
+    from huggingface_hub import snapshot_download
+    for name in hf_models or HF_MODELS:
+        repo_id = HF_MODELS[name]
+        if hf_cached(repo_id):
+            continue
+        logger.info(f"Downloading {repo_id}")
+        snapshot_download(repo_id, ignore_patterns=HF_IGNORE_PATTERNS)
+    logger.info(f"Hugging Face models ready in {os.environ['HF_HOME']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check or populate the grader's local data directory")
+    parser.add_argument('--bootstrap', action='store_true', help="Download missing resources (needs network access)")
+    parser.add_argument('--models', nargs='*', choices=sorted(HF_MODELS),
+                        help="Only bootstrap these Hugging Face models (default: all)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.bootstrap:
+        bootstrap(args.models)
+    print(preflight())
+
+
+if __name__ == '__main__':
+    main()
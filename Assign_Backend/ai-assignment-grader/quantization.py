@@ -0,0 +1,350 @@
+"""Offline INT8 quantization of the grader's models, gated by an evaluation against FP32.
+
+The sentence encoder and sentiment model, the models the grading routes
+run, are exported to OpenVINO (see openvino_backend.py) and quantized to
+INT8 with NNCF post-training quantization, calibrated on local essays. Each
+INT8 model is then evaluated by grading a local set of essays with it
+swapped in for the FP32 model. Only models whose coverage scores, labels
+and grades stay within tolerance are approved in DATA_DIR/int8/manifest.json.
+The grader uses an INT8 model only if it is listed in QUANTIZED_MODELS and
+approved for the model snapshot it was made from.
+
+The evaluation set is a JSON Lines file of {"text": ..., "criteria": [...],
+"max_score": 100} records (default DATA_DIR/eval/essays.jsonl):
+
+    python quantization.py --quantize            quantize, evaluate and record approvals
+    python quantization.py --evaluate            re-evaluate existing INT8 models
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from preflight import DATA_DIR, HF_MODELS, configure_environment, model_versions
+
+logger = logging.getLogger(__name__)
+
+# Registry name -> pipeline task (None for the sentence encoder)
+QUANTIZABLE_MODELS = {
+    'sentence_transformer': None,
+    'sentiment_analyzer': 'sentiment-analysis'
+}
+INT8_DIR = os.path.join(DATA_DIR, 'int8')
+MANIFEST_PATH = os.path.join(INT8_DIR, 'manifest.json')
+EVAL_SET_PATH = os.path.join(DATA_DIR, 'eval', 'essays.jsonl')
+
+# Drift allowed between FP32 and INT8 before a model is refused
+MAX_GRADE_DRIFT = 2.0  # percentage points of the final grade
+MAX_COVERAGE_DRIFT = 0.03  # absolute difference of a criterion's coverage score
+MIN_LABEL_AGREEMENT = 0.95  # fraction of chunks given the same label
+CALIBRATION_SAMPLES = 300
+
+
+def int8_path(name, version):
+    return os.path.join(INT8_DIR, f"{name}-{hashlib.sha1(version.encode('utf-8')).hexdigest()[:12]}")
+
+
+def load_manifest():
+    try:
+        with open(MANIFEST_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_manifest(manifest):
+    os.makedirs(INT8_DIR, exist_ok=True)
+    tmp = MANIFEST_PATH + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, MANIFEST_PATH)
+
+
+def approved_int8_path(name, version):
+    """Path of the INT8 model approved for this model version, or None"""
+    entry = load_manifest().get(name)
+    if not entry or entry.get('version') != version or not entry.get('approved'):
+        return None
+    return entry['path'] if os.path.isdir(entry['path']) else None
+
+
+def load_int8(name, path):
+    """Load an INT8 model directory written by quantize_model"""
+    from openvino_backend import load_sentence_encoder, load_sequence_classifier
+    task = QUANTIZABLE_MODELS[name]
+    if task is None:
+        return load_sentence_encoder(path, path)
+    return load_sequence_classifier(task, path, path)
+
+
+def directory_bytes(path, extensions=('.bin', '.safetensors')):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files
+                     if os.path.splitext(name)[1] in extensions)
+    return total
+
+
+def _ir_file(directory):
+    # sentence-transformers keeps the IR in an openvino/ subdirectory
+    nested = os.path.join(directory, 'openvino', 'openvino_model.xml')
+    return nested if os.path.exists(nested) else os.path.join(directory, 'openvino_model.xml')
+
+
+def _model_inputs(names, encoding):
+    """The model's inputs from a tokenizer encoding; inputs it does not produce (token_type_ids) are zeros"""
+    return {name: encoding[name] if name in encoding else np.zeros_like(encoding['input_ids']) for name in names}
+
+
+def quantize_model(name, version, documents, subset_size=CALIBRATION_SAMPLES):
+    """Quantize the OpenVINO export of a model to INT8, calibrated on documents (lists of sentences).
+
+    Returns the directory of the INT8 model.
+    """
+    import nncf
+    import openvino as ov
+    from transformers import AutoTokenizer
+
+    from openvino_backend import export_path, load_sentence_encoder, load_sequence_classifier
+    from sentiment import sentiment_chunks
+
+    fp32_path = export_path(name, version)
+    if QUANTIZABLE_MODELS[name] is None:
+        load_sentence_encoder(HF_MODELS[name], fp32_path)
+    else:
+        load_sequence_classifier(QUANTIZABLE_MODELS[name], HF_MODELS[name], fp32_path)
+
+    out = int8_path(name, version)
+    os.makedirs(INT8_DIR, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=INT8_DIR, prefix='.quantize-')
+    try:
+        shutil.copytree(fp32_path, tmp, dirs_exist_ok=True)
+        model = ov.Core().read_model(_ir_file(fp32_path))
+        tokenizer = AutoTokenizer.from_pretrained(fp32_path)
+        if QUANTIZABLE_MODELS[name] is None:
+            texts = [s for sentences in documents for s in sentences]
+        else:
+            # Classifiers see sentence-aligned chunks, not single sentences
+            texts = [text for sentences in documents for text, _ in sentiment_chunks(sentences, tokenizer)]
+        inputs = [port.get_any_name() for port in model.inputs]
+        samples = [_model_inputs(inputs, tokenizer(text, truncation=True, return_tensors='np'))
+                   for text in texts[:subset_size]]
+
+        start = time.perf_counter()
+        quantized = nncf.quantize(model, nncf.Dataset(samples), model_type=nncf.ModelType.TRANSFORMER,
+                                  subset_size=len(samples))
+        # Keep the layers left in floating point at FP32 rather than compressing them to FP16
+        ov.save_model(quantized, _ir_file(tmp), compress_to_fp16=False)
+        shutil.rmtree(out, ignore_errors=True)
+        os.replace(tmp, out)
+        logger.info(f"Quantized {name} to INT8 in {time.perf_counter() - start:.1f}s "
+                    f"on {len(samples)} calibration samples")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return out
+
+
+def load_eval_set(path):
+    with open(path, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if not records:
+        raise ValueError(f"No essays in {path}")
+    return records
+
+
+def _import_grader():
+    """The grader app, configured for offline use: no job workers, no warmup, FP32 models, private caches"""
+    os.environ['JOB_WORKERS'] = '0'
+    os.environ['WARM_MODELS'] = 'none'
+    os.environ['QUANTIZED_MODELS'] = ''
+    os.environ['EMBEDDING_STORE_DIR'] = tempfile.mkdtemp(prefix='grader-eval-embeddings-')
+    os.environ['JOB_DB_PATH'] = os.path.join(os.environ['EMBEDDING_STORE_DIR'], 'jobs.sqlite')
+    import app as grader
+    # Per-request logging would bury the report
+    logging.getLogger(grader.__name__).setLevel(logging.WARNING)
+    return grader
+
+
+class Evaluation:
+    """Grades an evaluation set with FP32 models and with INT8 models swapped in"""
+
+    def __init__(self, records):
+        self.grader = _import_grader()
+        self.records = records
+        self.fp32 = self.grader.analyzer
+        self.fp32_embedding_id = self.grader.EMBEDDING_MODEL_ID
+        self.docs = [self.grader.parse_document(self.grader.preprocess_text(r['text'])) for r in records]
+        self.baseline = self.grade(self.fp32, self.fp32_embedding_id)
+
+    def variant(self, int8_paths):
+        """An analyzer using the given INT8 models and sharing every other model with FP32"""
+        analyzer = self.grader.AssignmentAnalyzer()
+        for name in list(QUANTIZABLE_MODELS) + ['nlp', 'stopwords', 'lemmatizer']:
+            if name in int8_paths:
+                analyzer.models.register(name, lambda name=name: load_int8(name, int8_paths[name]))
+            else:
+                analyzer.models.register(name, lambda name=name: self.fp32.models[name])
+        return analyzer
+
+    def grade(self, analyzer, embedding_id):
+        self.grader.analyzer, self.grader.EMBEDDING_MODEL_ID = analyzer, embedding_id
+        try:
+            responses = []
+            for record, doc in zip(self.records, self.docs):
+                semantic_analysis = self.grader.analyze_semantic_content(doc, record['criteria'])
+                sentiment_analysis = self.grader.analyze_sentiment_and_tone(doc)
+                responses.append(self.grader.build_grade_response(
+                    doc, record['criteria'], record.get('max_score', 100), semantic_analysis, sentiment_analysis))
+            return responses
+        finally:
+            self.grader.analyzer, self.grader.EMBEDDING_MODEL_ID = self.fp32, self.fp32_embedding_id
+
+    def drift(self, responses):
+        grade = [abs(a['percentage'] - b['percentage']) for a, b in zip(self.baseline, responses)]
+        coverage = [abs(a['semantic_analysis'][c]['coverage_score'] - b['semantic_analysis'][c]['coverage_score'])
+                    for a, b in zip(self.baseline, responses) for c in a['semantic_analysis']
+                    if c in b['semantic_analysis']]
+        return {
+            'max_grade_drift': round(max(grade), 3),
+            'mean_grade_drift': round(sum(grade) / len(grade), 3),
+            'max_coverage_drift': round(max(coverage), 4) if coverage else 0.0
+        }
+
+    def model_report(self, name, models):
+        """Throughput of each variant ({'fp32': model, 'int8': model}) and label agreement for the classifiers"""
+        from sentiment import classify_documents
+
+        report, labels = {}, {}
+        for variant, model in models.items():
+            start = time.perf_counter()
+            if QUANTIZABLE_MODELS[name] is None:
+                items, unit = [s for doc in self.docs for s in doc.sentences], 'sentences'
+                model.encode(items)
+            else:
+                outputs = classify_documents(model, [doc.sentences for doc in self.docs])
+                labels[variant] = [o['label'] for doc_outputs in outputs for o in doc_outputs]
+                items, unit = labels[variant], 'chunks'
+            report[variant] = {f'{unit}_per_second': round(len(items) / (time.perf_counter() - start), 1)}
+        if labels:
+            same = sum(a == b for a, b in zip(labels['fp32'], labels['int8']))
+            report['label_agreement'] = round(same / max(1, len(labels['fp32'])), 4)
+        return report
+
+
+def _memory_report(registry, name, model, weights_dir):
+    """Weights size (torch tensors, else the IR on disk) and resident memory added by loading the model"""
+    from model_registry import model_bytes
+    weights = model_bytes(model)
+    if weights is None and os.path.isdir(weights_dir):
+        weights = directory_bytes(weights_dir)
+    return {
+        'weights_mb': round(weights / (1024 * 1024), 1) if weights is not None else None,
+        'load_rss_mb': registry.status()['models'][name]['memory_mb']
+    }
+
+
+def evaluate(eval_set, names=None, max_grade_drift=MAX_GRADE_DRIFT, max_coverage_drift=MAX_COVERAGE_DRIFT,
+             min_label_agreement=MIN_LABEL_AGREEMENT):
+    """Evaluate the INT8 models against FP32 and record which ones are approved in the manifest"""
+    from openvino_backend import export_path
+
+    versions = model_versions()
+    names = names or list(QUANTIZABLE_MODELS)
+    paths = {name: int8_path(name, versions[name]) for name in names if os.path.isdir(int8_path(name, versions[name]))}
+    missing = sorted(set(names) - set(paths))
+    if missing:
+        logger.warning(f"No INT8 model to evaluate for: {', '.join(missing)}")
+
+    evaluation = Evaluation(load_eval_set(eval_set))
+    manifest = load_manifest()
+    for name, path in paths.items():
+        fp32_model = evaluation.fp32.models[name]
+        if fp32_model is None:
+            # Without the FP32 model both runs would skip the same analysis and agree trivially
+            raise RuntimeError(f"FP32 {name} could not be loaded; there is nothing to compare INT8 against")
+        analyzer = evaluation.variant({name: path})
+        int8_model = analyzer.models[name]
+        if int8_model is None:
+            report, reasons = {}, ['INT8 model failed to load']
+        else:
+            embedding_id = evaluation.fp32_embedding_id + ('@int8' if name == 'sentence_transformer' else '')
+            report = {**evaluation.drift(evaluation.grade(analyzer, embedding_id)),
+                      **evaluation.model_report(name, {'fp32': fp32_model, 'int8': int8_model})}
+            report['fp32'].update(_memory_report(evaluation.fp32.models, name, fp32_model,
+                                                 export_path(name, versions[name])))
+            report['int8'].update(_memory_report(analyzer.models, name, int8_model, path))
+
+            reasons = []
+            if report['max_grade_drift'] > max_grade_drift:
+                reasons.append(f"grade drift {report['max_grade_drift']} > {max_grade_drift}")
+            if report['max_coverage_drift'] > max_coverage_drift:
+                reasons.append(f"coverage drift {report['max_coverage_drift']} > {max_coverage_drift}")
+            if report.get('label_agreement', 1.0) < min_label_agreement:
+                reasons.append(f"label agreement {report['label_agreement']} < {min_label_agreement}")
+        manifest[name] = {
+            'version': versions[name],
+            'path': path,
+            'approved': not reasons,
+            'rejected_because': reasons,
+            'evaluation': report,
+            'essays': len(evaluation.records),
+            'evaluated_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+        }
+        logger.info(f"{name}: {'approved' if not reasons else 'rejected (' + '; '.join(reasons) + ')'} {report}")
+
+    # Individually acceptable drifts can add up; check the approved models together
+    approved = {name: paths[name] for name in paths if manifest[name]['approved']}
+    if len(approved) > 1:
+        embedding_id = evaluation.fp32_embedding_id + ('@int8' if 'sentence_transformer' in approved else '')
+        combined = evaluation.drift(evaluation.grade(evaluation.variant(approved), embedding_id))
+        logger.info(f"Approved INT8 models together: {combined}")
+        if combined['max_grade_drift'] > max_grade_drift:
+            for name in approved:
+                manifest[name]['approved'] = False
+                manifest[name]['rejected_because'].append(
+                    f"combined grade drift {combined['max_grade_drift']} > {max_grade_drift}")
+        for name in approved:
+            manifest[name]['evaluation']['combined'] = combined
+
+    save_manifest(manifest)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize the grader's models to INT8 and evaluate them against FP32")
+    parser.add_argument('--quantize', action='store_true', help="Quantize the models before evaluating them")
+    parser.add_argument('--evaluate', action='store_true', help="Evaluate existing INT8 models")
+    parser.add_argument('--eval-set', default=EVAL_SET_PATH, help="JSON Lines evaluation set")
+    parser.add_argument('--calibration-set', help="JSON Lines essays for calibration (default: the evaluation set)")
+    parser.add_argument('--models', nargs='*', choices=sorted(QUANTIZABLE_MODELS))
+    parser.add_argument('--max-grade-drift', type=float, default=MAX_GRADE_DRIFT)
+    parser.add_argument('--max-coverage-drift', type=float, default=MAX_COVERAGE_DRIFT)
+    parser.add_argument('--min-label-agreement', type=float, default=MIN_LABEL_AGREEMENT)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    configure_environment()
+    names = args.models or list(QUANTIZABLE_MODELS)
+    if args.quantize:
+        from document import ParsedDocument
+
+        versions = model_versions()
+        documents = [ParsedDocument(essay['text']).sentences
+                     for essay in load_eval_set(args.calibration_set or args.eval_set)]
+        for name in names:
+            quantize_model(name, versions[name], documents)
+    if args.quantize or args.evaluate:
+        manifest = evaluate(args.eval_set, names, args.max_grade_drift, args.max_coverage_drift,
+                            args.min_label_agreement)
+        print(json.dumps({name: {key: entry[key] for key in ('approved', 'rejected_because', 'evaluation')}
+                          for name, entry in manifest.items() if name in names}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
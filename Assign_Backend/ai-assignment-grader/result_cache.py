@@ -0,0 +1,234 @@
+"""Cache of serialized grading results.
+
+Results are keyed by the submission text, the criteria, the maximum score
+and the versions of the loaded models. A process-local LRU holds recent
+results. An optional SQLite file on disk shares them across worker
+processes and restarts. Identical requests arriving while a result is being
+computed wait for that computation instead of starting their own.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Bump when scoring changes so results computed by older code are not served
+RESULT_CACHE_VERSION = 1
+
+
+def result_key(text, criteria, max_score, model_versions):
+    """Cache key of one grading request; whitespace differences do not change the grade"""
+    payload = json.dumps([RESULT_CACHE_VERSION, ' '.join(text.split()), list(criteria), max_score, model_versions],
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class _Pending:
+    def __init__(self):
+        self.done = threading.Event()
+        self.body = None
+        self.seconds = 0.0
+        self.error = None
+
+
+class ResultCache:
+    """LRU of result bytes in memory, backed by an optional size-bounded SQLite file"""
+
+    def __init__(self, max_entries=1000, max_bytes=256 * 1024 * 1024, directory=None,
+                 max_disk_bytes=1024 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self.uncached = 0
+        self.bytes_saved = 0
+        self.seconds_saved = 0.0
+
+        self._db = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(os.path.join(directory, 'results.sqlite'), timeout=30,
+                                       isolation_level=None, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute('''CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY, body BLOB NOT NULL, size INTEGER NOT NULL,
+                seconds REAL NOT NULL, last_used REAL NOT NULL)''')
+            self._db.execute('CREATE INDEX IF NOT EXISTS results_lru ON results (last_used)')
+
+    # ------------------------------------------------------------------ memory tier
+
+    def _memory_get(self, key):
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+        return entry
+
+    def _memory_put(self, key, body, seconds):
+        if len(body) > self.max_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key)[0])
+        self._memory[key] = (body, seconds)
+        self._memory_bytes += len(body)
+        while len(self._memory) > self.max_entries or self._memory_bytes > self.max_bytes:
+            _, (evicted, _) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    # ------------------------------------------------------------------ disk tier
+
+    def _disk_get(self, key):
+        if self._db is None:
+            return None
+        try:
+            with self._db_lock:
+                row = self._db.execute('SELECT body, seconds FROM results WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    self._db.execute('UPDATE results SET last_used = ? WHERE key = ?', (time.time(), key))
+        except sqlite3.Error as e:
+            logger.warning(f"Result cache lookup failed: {e}")
+            return None
+        return (bytes(row[0]), row[1]) if row else None
+
+    def _disk_put(self, key, body, seconds):
+        if self._db is None or len(body) > self.max_disk_bytes:
+            return
+        try:
+            with self._db_lock:
+                self._db.execute('BEGIN IMMEDIATE')
+                try:
+                    self._db.execute('INSERT OR REPLACE INTO results (key, body, size, seconds, last_used) '
+                                     'VALUES (?, ?, ?, ?, ?)', (key, body, len(body), seconds, time.time()))
+                    total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM results').fetchone()[0]
+                    if total > self.max_disk_bytes:
+                        excess = total - self.max_disk_bytes
+                        victims, freed = [], 0
+                        for victim, size in self._db.execute('SELECT key, size FROM results ORDER BY last_used'):
+                            if freed >= excess:
+                                break
+                            victims.append((victim,))
+                            freed += size
+                        self._db.executemany('DELETE FROM results WHERE key = ?', victims)
+                    self._db.execute('COMMIT')
+                except Exception:
+                    self._db.execute('ROLLBACK')
+                    raise
+        except sqlite3.Error as e:
+            logger.warning(f"Result cache write failed: {e}")
+
+    # ------------------------------------------------------------------ public
+
+    def _hit(self, counter, body, seconds):
+        setattr(self, counter, getattr(self, counter) + 1)
+        self.bytes_saved += len(body)
+        self.seconds_saved += seconds
+
+    def get(self, key):
+        """Cached result bytes, or None"""
+        with self._lock:
+            entry = self._memory_get(key)
+            if entry is not None:
+                self._hit('memory_hits', *entry)
+                return entry[0]
+        entry = self._disk_get(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self._memory_put(key, *entry)
+            self._hit('disk_hits', *entry)
+        return entry[0]
+
+    def put(self, key, body, seconds=0.0):
+        """Store result bytes and the seconds it took to compute them"""
+        with self._lock:
+            self._memory_put(key, body, seconds)
+        self._disk_put(key, body, seconds)
+
+    def get_or_compute(self, key, compute):
+        """Return (result bytes, source), running compute() only if no identical request is cached or running.
+
+        compute() returns (result bytes, cacheable). A result that is not
+        cacheable, such as one built while a model was unavailable, goes to
+        this request and to identical requests already waiting for it, but
+        is not stored. source is 'memory', 'disk', 'coalesced' (waited for
+        an identical request in this process), 'computed' or 'uncached'
+        (computed and not stored).
+        """
+        with self._lock:
+            entry = self._memory_get(key)
+            if entry is not None:
+                self._hit('memory_hits', *entry)
+                return entry[0], 'memory'
+            pending = self._inflight.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._inflight[key] = _Pending()
+
+        if not owner:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            with self._lock:
+                self._hit('coalesced', pending.body, pending.seconds)
+            return pending.body, 'coalesced'
+
+        try:
+            entry = self._disk_get(key)
+            if entry is not None:
+                with self._lock:
+                    self._memory_put(key, *entry)
+                    self._hit('disk_hits', *entry)
+                pending.body, pending.seconds = entry
+                return entry[0], 'disk'
+
+            start = time.perf_counter()
+            body, cacheable = compute()
+            seconds = time.perf_counter() - start
+            with self._lock:
+                self.misses += 1
+                if not cacheable:
+                    self.uncached += 1
+            if cacheable:
+                self.put(key, body, seconds)
+            pending.body, pending.seconds = body, seconds
+            return body, 'computed' if cacheable else 'uncached'
+        except Exception as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            pending.done.set()
+
+    @property
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits + self.coalesced
+            return {
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'disk': self._db is not None,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'coalesced': self.coalesced,
+                'misses': self.misses,
+                'uncached': self.uncached,
+                'hit_rate': round(hits / (hits + self.misses), 4) if hits + self.misses else None,
+                'bytes_saved': self.bytes_saved,
+                'seconds_saved': round(self.seconds_saved, 3)
+            }
@@ -0,0 +1,237 @@
+"""Per-assignment index of submitted sentences and their embeddings, for searching across a class.
+
+Each sentence of a graded submission that names an assignment is stored
+with its normalized float16 embedding in SQLite, shared by all worker
+processes. A process keeps one float32 matrix per assignment in memory,
+within a byte budget, and extends it with the rows added since its last
+search, so the index grows incrementally as submissions arrive. A
+resubmission replaces the submission's earlier sentences.
+
+A search is an exact (flat) scan: the query is scored against one block
+of sentences at a time, and submissions are ranked by their best
+sentence. On one core this takes tens of milliseconds for 100,000
+sentences, so an approximate index is not needed at class sizes.
+
+Run this module directly to index and search 100,000 random sentence
+embeddings:
+
+    python semantic_index.py
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from similarity import SIMILARITY_BLOCK_BYTES, _normalize
+
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of bound parameters per statement
+_QUERY_BATCH = 500
+
+
+class _Matrix:
+    """Embeddings of one assignment's sentences in row id order, with the submission of each row"""
+
+    def __init__(self, dim):
+        # float32 in memory: converting float16 blocks on every search costs more than the search
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.row_ids = np.zeros(0, dtype=np.int64)
+        self.owners = np.zeros(0, dtype=np.int32)
+        self.submissions = []
+        self._submission_index = {}
+        self.count = 0
+        self.last_id = 0
+        self.replaced = 0
+
+    def append(self, rows):
+        if self.count + len(rows) > len(self.vectors):
+            # Grow geometrically; searches use views of the first `count` rows only
+            capacity = max(1024, self.count + len(rows), 2 * len(self.vectors))
+            for name in ('vectors', 'row_ids', 'owners'):
+                old = getattr(self, name)
+                grown = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+                grown[:self.count] = old[:self.count]
+                setattr(self, name, grown)
+        end = self.count + len(rows)
+        self.row_ids[self.count:end] = [row_id for row_id, _, _ in rows]
+        self.owners[self.count:end] = [self._owner(submission) for _, submission, _ in rows]
+        self.vectors[self.count:end] = np.frombuffer(b''.join(blob for _, _, blob in rows),
+                                                     dtype=np.float16).reshape(len(rows), -1)
+        self.count = end
+        self.last_id = int(self.row_ids[end - 1])
+
+    def _owner(self, submission):
+        index = self._submission_index.get(submission)
+        if index is None:
+            index = self._submission_index[submission] = len(self.submissions)
+            self.submissions.append(submission)
+        return index
+
+
+class SemanticIndex:
+    """Sentence embeddings of each assignment's submissions, searchable by meaning"""
+
+    def __init__(self, path, max_cached_bytes=512 * 1024 * 1024, block_bytes=SIMILARITY_BLOCK_BYTES):
+        self.max_cached_bytes = max_cached_bytes
+        self.block_bytes = block_bytes
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS sentences (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, assignment TEXT NOT NULL, model TEXT NOT NULL,
+            submission TEXT NOT NULL, position INTEGER NOT NULL, text TEXT NOT NULL, vector BLOB NOT NULL)''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS sentences_submission ON sentences (assignment, model, submission)')
+        self._db.execute('CREATE INDEX IF NOT EXISTS sentences_order ON sentences (assignment, model, id)')
+        # Bumped when a resubmission deletes sentences, telling other processes to reload the assignment
+        self._db.execute('''CREATE TABLE IF NOT EXISTS assignments (
+            assignment TEXT NOT NULL, model TEXT NOT NULL, replaced INTEGER NOT NULL,
+            PRIMARY KEY (assignment, model))''')
+        self._lock = threading.Lock()
+        self._matrices = OrderedDict()
+        self.searches = 0
+        self.search_seconds = 0.0
+
+    def add(self, assignment, model_id, submission, sentences, embeddings):
+        """Index a submission's sentences, replacing any sentences indexed for it before"""
+        vectors = _normalize(embeddings).astype(np.float16)
+        with self._lock:
+            self._db.execute('BEGIN IMMEDIATE')
+            try:
+                deleted = self._db.execute('DELETE FROM sentences WHERE assignment = ? AND model = ? AND submission = ?',
+                                           (assignment, model_id, submission)).rowcount
+                if deleted:
+                    self._db.execute('INSERT INTO assignments (assignment, model, replaced) VALUES (?, ?, 1) '
+                                     'ON CONFLICT (assignment, model) DO UPDATE SET replaced = replaced + 1',
+                                     (assignment, model_id))
+                self._db.executemany(
+                    'INSERT INTO sentences (assignment, model, submission, position, text, vector) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    [(assignment, model_id, submission, position, sentence, vector.tobytes())
+                     for position, (sentence, vector) in enumerate(zip(sentences, vectors))])
+                self._db.execute('COMMIT')
+            except Exception:
+                self._db.execute('ROLLBACK')
+                raise
+
+    def _sync(self, assignment, model_id, dim):
+        """This process's matrix for an assignment, brought up to date with the rows other processes added"""
+        key = (assignment, model_id)
+        matrix = self._matrices.get(key)
+        row = self._db.execute('SELECT replaced FROM assignments WHERE assignment = ? AND model = ?',
+                               (assignment, model_id)).fetchone()
+        replaced = row[0] if row else 0
+        if matrix is None or matrix.replaced != replaced:
+            matrix = _Matrix(dim)
+            matrix.replaced = replaced
+        rows = self._db.execute('SELECT id, submission, vector FROM sentences WHERE assignment = ? AND model = ? '
+                                'AND id > ? ORDER BY id', (assignment, model_id, matrix.last_id)).fetchall()
+        if rows:
+            matrix.append(rows)
+        self._matrices[key] = matrix
+        self._matrices.move_to_end(key)
+        # The least recently searched assignments are dropped and loaded again when next searched
+        while len(self._matrices) > 1 and self._cached_bytes() > self.max_cached_bytes:
+            self._matrices.popitem(last=False)
+        return matrix
+
+    def _cached_bytes(self):
+        return sum(matrix.vectors.nbytes for matrix in list(self._matrices.values()))
+
+    def search(self, assignment, model_id, query_embedding, k=10, evidence=3, min_score=None):
+        """Submissions ranked by their sentence most similar to the query, with their best sentences.
+
+        Returns ([{'submission_id', 'score', 'evidence': [{'sentence', 'score'}]}], sentences searched).
+        """
+        start = time.perf_counter()
+        query = _normalize(np.asarray(query_embedding).reshape(1, -1))[0]
+        with self._lock:
+            matrix = self._sync(assignment, model_id, len(query))
+            count = matrix.count
+            vectors, owners, row_ids = matrix.vectors[:count], matrix.owners[:count], matrix.row_ids[:count]
+            submissions = list(matrix.submissions)
+        if not count:
+            return [], 0
+
+        scores = np.empty(count, dtype=np.float32)
+        block = max(1, self.block_bytes // (4 * len(query)))
+        for first in range(0, count, block):
+            scores[first:first + block] = vectors[first:first + block] @ query
+        best = np.full(len(submissions), -np.inf, dtype=np.float32)
+        np.maximum.at(best, owners, scores)
+
+        ranked = np.argsort(-best, kind='stable')[:k]
+        if min_score is not None:
+            ranked = [owner for owner in ranked if best[owner] >= min_score]
+        results, evidence_rows = [], []
+        for owner in ranked:
+            rows = np.flatnonzero(owners == owner)
+            rows = rows[np.argsort(-scores[rows], kind='stable')[:evidence]]
+            evidence_rows.extend(rows)
+            results.append({'submission_id': submissions[owner], 'score': round(float(best[owner]), 4),
+                            'evidence': [(int(row_ids[row]), round(float(scores[row]), 4)) for row in rows]})
+
+        texts = {}
+        wanted = [int(row_ids[row]) for row in evidence_rows]
+        with self._lock:
+            for first in range(0, len(wanted), _QUERY_BATCH):
+                batch = wanted[first:first + _QUERY_BATCH]
+                texts.update(self._db.execute(
+                    f"SELECT id, text FROM sentences WHERE id IN ({','.join('?' * len(batch))})", batch))
+        for result in results:
+            result['evidence'] = [{'sentence': texts.get(row_id, ''), 'score': score}
+                                  for row_id, score in result['evidence']]
+        self.searches += 1
+        self.search_seconds += time.perf_counter() - start
+        return results, count
+
+    @property
+    def stats(self):
+        return {
+            'searches': self.searches,
+            'ms_per_search': round(self.search_seconds * 1000 / self.searches, 2) if self.searches else None,
+            'cached_assignments': len(self._matrices),
+            'cached_mb': round(self._cached_bytes() / (1024 * 1024), 1),
+            'cached_sentences': sum(matrix.count for matrix in list(self._matrices.values()))
+        }
+
+
+def benchmark(submissions=1000, sentences_each=100, dim=384, queries=20):
+    """Index and search random embeddings: bulk load, first search, incremental add and repeated searches"""
+    import tempfile
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as scratch:
+        index = SemanticIndex(os.path.join(scratch, 'semantic_index.sqlite'))
+        start = time.perf_counter()
+        for i in range(submissions):
+            vectors = rng.standard_normal((sentences_each, dim), dtype=np.float32)
+            index.add('benchmark', 'model', f"s{i}", [f"sentence {j} of s{i}" for j in range(sentences_each)], vectors)
+        added = time.perf_counter() - start
+
+        target = rng.standard_normal(dim, dtype=np.float32)
+        start = time.perf_counter()
+        index.search('benchmark', 'model', target)
+        first = time.perf_counter() - start
+
+        # A submission arrives with one sentence close to the query
+        vectors = rng.standard_normal((sentences_each, dim), dtype=np.float32)
+        vectors[7] = target + 0.1 * rng.standard_normal(dim, dtype=np.float32)
+        index.add('benchmark', 'model', 'new', [f"sentence {j} of new" for j in range(sentences_each)], vectors)
+
+        start = time.perf_counter()
+        for _ in range(queries):
+            results, count = index.search('benchmark', 'model', target)
+        repeated = (time.perf_counter() - start) / queries
+        assert results[0]['submission_id'] == 'new' and results[0]['evidence'][0]['sentence'] == 'sentence 7 of new'
+        print(f"{count} sentences: indexed in {added:.1f}s, first search (loads the matrix) {first * 1000:.0f} ms, "
+              f"searches after an incremental add {repeated * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,104 @@
+"""Sentence-aligned, token-limited chunking and batched sentiment inference.
+
+Run this module directly to time the old 500-character loop against batched
+inference on a generated essay, using the cached sentiment model:
+
+    python sentiment.py
+"""
+import os
+import time
+
+SENTIMENT_BATCH_SIZE = int(os.environ.get('SENTIMENT_BATCH_SIZE', 16))
+MAX_CHUNK_TOKENS = 512
+
+
+def max_chunk_tokens(tokenizer, cap=MAX_CHUNK_TOKENS):
+    """Content tokens that fit in one model input, leaving room for special tokens"""
+    limit = tokenizer.model_max_length
+    # Tokenizers without a configured limit report a huge sentinel value
+    if not limit or limit > 100000:
+        limit = cap
+    return min(limit, cap) - tokenizer.num_special_tokens_to_add()
+
+
+def sentiment_chunks(sentences, tokenizer, max_tokens=None):
+    """Group consecutive sentences into (text, token count) chunks that fit the model's input length.
+
+    A sentence longer than the limit becomes a chunk of its own and is
+    truncated by the pipeline.
+    """
+    max_tokens = max_tokens or max_chunk_tokens(tokenizer)
+    sentences = [s for s in sentences if s.strip()]
+    if not sentences:
+        return []
+    # One extra token per sentence covers the joining space changing the first subword
+    lengths = [len(ids) + 1 for ids in tokenizer(sentences, add_special_tokens=False)['input_ids']]
+
+    chunks, current, size = [], [], 0
+    for sentence, length in zip(sentences, lengths):
+        if current and size + length > max_tokens:
+            chunks.append((' '.join(current), size))
+            current, size = [], 0
+        current.append(sentence)
+        size += length
+    chunks.append((' '.join(current), size))
+    return chunks
+
+
+def classify_chunks(classifier, sentences, batch_size=SENTIMENT_BATCH_SIZE):
+    """Run sentence-aligned chunks through a text-classification pipeline in batches, in document order"""
+    return classify_documents(classifier, [sentences], batch_size)[0]
+
+
+def classify_documents(classifier, documents, batch_size=SENTIMENT_BATCH_SIZE):
+    """Classify the chunks of several documents (lists of sentences) in one pipeline call.
+
+    Returns one list of pipeline outputs per document, in chunk order.
+    """
+    chunks = [(doc, text, length) for doc, sentences in enumerate(documents)
+              for text, length in sentiment_chunks(sentences, classifier.tokenizer)]
+    results = [[] for _ in documents]
+    if not chunks:
+        return results
+    # Batches are padded to their longest member, so batch chunks of similar length together
+    order = sorted(range(len(chunks)), key=lambda i: chunks[i][2])
+    outputs = classifier([chunks[i][1] for i in order], batch_size=batch_size, truncation=True)
+
+    by_chunk = [None] * len(chunks)
+    for i, output in zip(order, outputs):
+        by_chunk[i] = output
+    for (doc, _, _), output in zip(chunks, by_chunk):
+        results[doc].append(output)
+    return results
+
+
+def benchmark(classifier=None, words=10000, repeats=3):
+    """Time per-500-character calls against batched sentence-aligned chunks on one essay"""
+    from document import ParsedDocument, _essay
+
+    if classifier is None:
+        from preflight import HF_MODELS, configure_environment
+        configure_environment()
+        from transformers import pipeline
+        classifier = pipeline("sentiment-analysis", model=HF_MODELS['sentiment_analyzer'],
+                              model_kwargs={"use_safetensors": False})
+
+    doc = ParsedDocument(_essay(words))
+
+    def per_chunk():
+        for i in range(0, len(doc.text), 500):
+            classifier(doc.text[i:i + 500])
+
+    def batched():
+        classify_chunks(classifier, doc.sentences)
+
+    for name, fn in (("500-character loop", per_chunk), ("batched sentence chunks", batched)):
+        fn()  # warm up
+        start = time.perf_counter()
+        for _ in range(repeats):
+            fn()
+        print(f"{name}: {(time.perf_counter() - start) / repeats:.2f} s per {words}-word essay")
+
+
+if __name__ == '__main__':
+    benchmark()
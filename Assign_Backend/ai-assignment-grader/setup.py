@@ -1,2 +1,5 @@
-import nltk
-nltk.download(['punkt', 'punkt_tab', 'stopwords', 'wordnet', 'averaged_perceptron_tagger', 'vader_lexicon', 'brown'])
\ No newline at end of file
+import logging
+from preflight import bootstrap
+
+logging.basicConfig(level=logging.INFO)
+bootstrap()
@@ -68,7 +68,10 @@ mongoose.connect('mongodb://localhost:27017/learning_platform', {
   useNewUrlParser: true,
   useUnifiedTopology: true
 })
-  .then(() => logger.info('Connected to MongoDB'))
+  .then(() => {
+    logger.info('Connected to MongoDB');
+    return resumeGradingJobs();
+  })
   .catch(err => logger.error(`MongoDB connection error: ${err}`));
 
 // MongoDB Schemas
@@ -97,8 +100,14 @@ const submissionSchema = new mongoose.Schema({
     styleMetrics: Object,
     semanticAnalysis: Object,
     sentimentAnalysis: Object,
-    comprehensiveFeedback: Object
+    comprehensiveFeedback: Object,
+    nearDuplicates: Object
   },
+  // Grading runs as a job on the Flask grader; aiGrade is filled in when it finishes
+  gradingJobId: { type: String },
+  // No default: submissions graded before grading jobs existed have an aiGrade but no gradingStatus
+  gradingStatus: { type: String, enum: ['pending', 'done', 'failed'] },
+  gradingError: { type: String },
   teacherGrade: { type: Number },
   teacherFeedback: { type: String },
   status: { type: String, enum: ['submitted', 'graded'], default: 'submitted' },
@@ -137,8 +146,115 @@ async function extractTextFromFile(filepath) {
   }
 }
 
-// Flask API client
-const FLASK_API_URL = 'http://localhost:5100/api/grade';
+// Flask API client: grading runs as a job on the grader. The submit request only queues it;
+// trackGradingJob follows the job in the background and records the grade on the submission.
+const FLASK_BASE_URL = 'http://localhost:5100';
+const GRADING_POLL_SECONDS = 25;
+const GRADING_TIMEOUT_MS = 30 * 60 * 1000;
+const GRADING_RETRY_MS = 5000;
+
+async function submitGradingJob(requestData) {
+  const submitted = await axios.post(`${FLASK_BASE_URL}/api/jobs`, requestData, {
+    headers: { 'Content-Type': 'application/json' }
+  });
+  logger.info(`Queued grading job ${submitted.data.job_id}`);
+  return submitted.data.job_id;
+}
+
+async function waitForGradingJob(jobId, startedAt) {
+  const deadline = startedAt + GRADING_TIMEOUT_MS;
+  let stage = '';
+  while (Date.now() < deadline) {
+    let job;
+    try {
+      // Long-poll: the grader answers as soon as the stage changes or the job ends
+      ({ data: job } = await axios.get(`${FLASK_BASE_URL}/api/jobs/${jobId}`, {
+        params: { wait: GRADING_POLL_SECONDS, stage }
+      }));
+    } catch (err) {
+      if (err.response && err.response.status === 404) {
+        throw new Error(`Grading job ${jobId} no longer exists`);
+      }
+      // The grader may be restarting; its jobs survive in SQLite
+      logger.warn(`Polling grading job ${jobId} failed: ${err.message}`);
+      await new Promise(resolve => setTimeout(resolve, GRADING_RETRY_MS));
+      continue;
+    }
+    if (job.status === 'failed') {
+      throw new Error(`Grading job ${jobId} failed: ${job.error}`);
+    }
+    if (job.status === 'done') {
+      const result = await axios.get(`${FLASK_BASE_URL}/api/jobs/${jobId}/result`);
+      return result.data;
+    }
+    if (job.stage !== stage) {
+      logger.info(`Grading job ${jobId}: ${job.stage} (${Math.round(job.progress * 100)}%)`);
+    }
+    stage = job.stage;
+  }
+  throw new Error(`Grading job ${jobId} did not finish in time`);
+}
+
+// Submissions graded before grading jobs existed have no gradingStatus but carry their aiGrade
+function gradingStatusOf(submission) {
+  return submission.gradingStatus || 'done';
+}
+
+// Submissions whose job is being followed by this process
+const trackedSubmissions = new Set();
+
+async function trackGradingJob(submission) {
+  const submissionId = submission._id.toString();
+  if (trackedSubmissions.has(submissionId)) {
+    return;
+  }
+  trackedSubmissions.add(submissionId);
+  try {
+    const gradeData = await waitForGradingJob(submission.gradingJobId, submission.submittedAt.getTime());
+    logger.info(`Received grade data from Flask: ${JSON.stringify(gradeData, null, 2).slice(0, 500)}`);
+
+    const reportFileName = `report_${uuidv4()}.json`;
+    const reportPath = path.join(reportDir, reportFileName);
+    await fs.writeFile(reportPath, JSON.stringify(gradeData, null, 2));
+    logger.info(`Saved report to ${reportPath}`);
+
+    // Matched on the job too, so a superseded attempt cannot overwrite a newer one
+    await Submission.updateOne({ _id: submissionId, gradingJobId: submission.gradingJobId }, {
+      aiGrade: {
+        finalScore: gradeData.final_score,
+        percentage: gradeData.percentage,
+        scoreBreakdown: gradeData.score_breakdown,
+        qualityMetrics: gradeData.quality_metrics,
+        styleMetrics: gradeData.style_metrics,
+        semanticAnalysis: gradeData.semantic_analysis,
+        sentimentAnalysis: gradeData.sentiment_analysis,
+        comprehensiveFeedback: gradeData.comprehensive_feedback,
+        nearDuplicates: gradeData.near_duplicates
+      },
+      gradingStatus: 'done',
+      reportPath
+    });
+    logger.info(`Recorded AI grade for submission ${submissionId}`);
+  } catch (error) {
+    logger.error(`Grading submission ${submissionId} failed: ${error.message}`);
+    await Submission.updateOne({ _id: submissionId, gradingJobId: submission.gradingJobId },
+      { gradingStatus: 'failed', gradingError: error.message })
+      .catch(err => logger.error(`Could not record grading failure for ${submissionId}: ${err.message}`));
+  } finally {
+    trackedSubmissions.delete(submissionId);
+  }
+}
+
+// Pick up submissions still being graded when this process last stopped
+async function resumeGradingJobs() {
+  const pending = await Submission.find({ gradingStatus: 'pending', gradingJobId: { $exists: true } });
+  for (const submission of pending) {
+    trackGradingJob(submission);
+  }
+  if (pending.length) {
+    logger.info(`Resumed tracking ${pending.length} grading job(s)`);
+  }
+}
 
 // Routes
 app.put('/api/assignments/:id', checkRole(['teacher']), upload.array('files', 5), async (req, res) => {
@@ -236,7 +352,7 @@ app.post('/api/assignments/:id/submit', checkRole(['student']), upload.array('fi
     }
 
     const existingSubmission = await Submission.findOne({ assignmentId: id, studentId: userId });
-    if (existingSubmission) {
+    if (existingSubmission && existingSubmission.gradingStatus !== 'failed') {
       return res.status(400).json({ error: 'You have already submitted this assignment' });
     }
 
@@ -251,49 +367,35 @@ app.post('/api/assignments/:id/submit', checkRole(['student']), upload.array('fi
     }
     logger.info(`Extracted text (first 500 chars): ${text.slice(0, 500)}`);
 
-    // Send to Flask /api/grade endpoint
+    // Grade through the Flask job API
+    // The grader compares the text with this assignment's other submissions, keyed by student
     const requestData = {
       text,
       criteria: assignment.criteria,
-      max_score: assignment.maxScore
+      max_score: assignment.maxScore,
+      assignment_id: id,
+      submission_id: userId
     };
     logger.info(`Sending to Flask: ${JSON.stringify(requestData, null, 2).slice(0, 500)}`);
-    const flaskResponse = await axios.post(FLASK_API_URL, requestData, {
-      headers: { 'Content-Type': 'application/json' }
-    });
-
-    const gradeData = flaskResponse.data;
-    logger.info(`Received grade data from Flask: ${JSON.stringify(gradeData, null, 2).slice(0, 500)}`);
-
-    const reportFileName = `report_${uuidv4()}.json`;
-    const reportPath = path.join(reportDir, reportFileName);
-    await fs.writeFile(reportPath, JSON.stringify(gradeData, null, 2));
-    logger.info(`Saved report to ${reportPath}`);
+    const gradingJobId = await submitGradingJob(requestData);
 
-    const submission = new Submission({
-      assignmentId: id,
-      studentId: userId,
+    // A submission whose grading failed is retried in place, keeping any teacher grade and feedback
+    const submission = existingSubmission || new Submission({ assignmentId: id, studentId: userId, status: 'submitted' });
+    submission.set({
       studentName: userName,
       files: files.map(file => ({
         filename: file.filename,
         path: file.path,
         originalName: file.originalname
       })),
-      aiGrade: {
-        finalScore: gradeData.final_score,
-        percentage: gradeData.percentage,
-        scoreBreakdown: gradeData.score_breakdown,
-        qualityMetrics: gradeData.quality_metrics,
-        styleMetrics: gradeData.style_metrics,
-        semanticAnalysis: gradeData.semantic_analysis,
-        sentimentAnalysis: gradeData.sentiment_analysis,
-        comprehensiveFeedback: gradeData.comprehensive_feedback
-      },
-      status: 'submitted',
-      reportPath
+      submittedAt: new Date(),
+      gradingJobId,
+      gradingStatus: 'pending',
+      gradingError: undefined
     });
 
     await submission.save();
+    trackGradingJob(submission);
 
     // Clean up uploaded files
     for (const file of files) {
@@ -305,8 +407,12 @@ app.post('/api/assignments/:id/submit', checkRole(['student']), upload.array('fi
       }
     }
 
-    logger.info(`Submission created for assignment ${id} by student ${userName}`);
-    res.status(201).json({ message: 'Submission successful', submission });
+    logger.info(`Submission created for assignment ${id} by student ${userName}, grading job ${gradingJobId}`);
+    res.status(202).json({
+      message: 'Submission received; AI grading in progress',
+      submission,
+      gradingStatusUrl: `/api/submissions/${submission._id}/grading`
+    });
   } catch (error) {
     logger.error(`Error submitting assignment: ${error.message}`);
     res.status(500).json({ error: error.message });
@@ -398,6 +504,44 @@ app.get('/api/submissions/:id', async (req, res) => {
   }
 });
 
+app.get('/api/submissions/:id/grading', async (req, res) => {
+  try {
+    const { id } = req.params;
+    const userId = req.headers['x-user-id'] || req.query.userId;
+    const userRole = req.headers['x-user-role'] || req.query.userRole;
+
+    const submission = await Submission.findById(id).populate('assignmentId');
+    if (!submission) {
+      return res.status(404).json({ error: 'Submission not found' });
+    }
+
+    if (userRole === 'student' && submission.studentId !== userId) {
+      return res.status(403).json({ error: 'Unauthorized: Not your submission' });
+    }
+    if (userRole === 'teacher' && submission.assignmentId.teacherId !== userId) {
+      return res.status(403).json({ error: 'Unauthorized: Not your assignment' });
+    }
+
+    const grading = { gradingStatus: gradingStatusOf(submission), gradingError: submission.gradingError };
+    if (grading.gradingStatus === 'done') {
+      grading.aiGrade = submission.aiGrade;
+    } else if (submission.gradingStatus === 'pending' && submission.gradingJobId) {
+      // Stage and progress come straight from the grader's job status
+      try {
+        const { data: job } = await axios.get(`${FLASK_BASE_URL}/api/jobs/${submission.gradingJobId}`);
+        grading.stage = job.stage;
+        grading.progress = job.progress;
+      } catch (err) {
+        logger.warn(`Could not fetch grading job ${submission.gradingJobId}: ${err.message}`);
+      }
+    }
+    res.json(grading);
+  } catch (error) {
+    logger.error(`Error fetching grading status of submission ${req.params.id}: ${error.message}`);
+    res.status(500).json({ error: error.message });
+  }
+});
+
 app.get('/api/submissions', checkRole(['teacher', 'student']), async (req, res) => {
   try {
     const userId = req.headers['x-user-id'] || req.query.userId;
@@ -448,6 +592,8 @@ app.get('/api/submissions/:assignmentId/reports', checkRole(['teacher']), async
       studentName: submission.studentName,
       reportPath: submission.reportPath,
       aiGrade: submission.aiGrade,
+      gradingStatus: gradingStatusOf(submission),
+      gradingError: submission.gradingError,
       submittedAt: submission.submittedAt
     }));
 
@@ -510,9 +656,11 @@ app.get('/api/stats', async (req, res) => {
         assignmentTitle: s.assignmentId.title,
         studentId: s.studentId,
         studentName: s.studentName,
-        aiGrade: s.aiGrade.finalScore,
+        // null until the grading job finishes; gradingStatus says whether it is pending or failed
+        aiGrade: gradingStatusOf(s) === 'done' ? s.aiGrade.finalScore : null,
         teacherGrade: s.teacherGrade,
-        percentage: s.aiGrade.percentage
+        percentage: gradingStatusOf(s) === 'done' ? s.aiGrade.percentage : null,
+        gradingStatus: gradingStatusOf(s)
       }));
     } else {
       const assignments = await Assignment.find({ deadline: { $gte: new Date() } });
@@ -528,9 +676,11 @@ app.get('/api/stats', async (req, res) => {
         assignmentTitle: s.assignmentId.title,
         studentId: s.studentId,
         studentName: s.studentName,
-        aiGrade: s.aiGrade.finalScore,
+        // null until the grading job finishes; gradingStatus says whether it is pending or failed
+        aiGrade: gradingStatusOf(s) === 'done' ? s.aiGrade.finalScore : null,
         teacherGrade: s.teacherGrade,
-        percentage: s.aiGrade.percentage
+        percentage: gradingStatusOf(s) === 'done' ? s.aiGrade.percentage : null,
+        gradingStatus: gradingStatusOf(s)
       }));
     }
 
@@ -28,32 +28,44 @@ public class AnalyticsController {
     private AnalyticsService analyticsService;
 
     @PostMapping("/emotion")
-    public ResponseEntity<?> recordEmotionData(@RequestBody EmotionDataRequest request) {
+    public ResponseEntity<?> recordEmotionData(@RequestBody EmotionDataRequest request,
+                                               @RequestHeader(value = "Idempotency-Key", required = false) String idempotencyKey) {
         try {
-            analyticsService.recordEmotionData(request);
+            analyticsService.recordEmotionData(request, idempotencyKey);
             return ResponseEntity.ok("Emotion data recorded successfully");
+        } catch (IllegalArgumentException e) {
+            return ResponseEntity.status(HttpStatus.BAD_REQUEST).body("Invalid emotion data: " + e.getMessage());
         } catch (Exception e) {
-            return ResponseEntity.status(HttpStatus.BAD_REQUEST).body("Failed to record emotion data: " + e.getMessage());
+            // Storage failures are transient; a 5xx tells the event spool to retry
+            return ResponseEntity.status(HttpStatus.SERVICE_UNAVAILABLE).body("Failed to record emotion data: " + e.getMessage());
         }
     }
 
     @PostMapping("/fatigue")
-    public ResponseEntity<?> recordFatigueData(@RequestBody FatigueDataRequest request) {
+    public ResponseEntity<?> recordFatigueData(@RequestBody FatigueDataRequest request,
+                                               @RequestHeader(value = "Idempotency-Key", required = false) String idempotencyKey) {
         try {
-            analyticsService.recordFatigueData(request);
+            analyticsService.recordFatigueData(request, idempotencyKey);
             return ResponseEntity.ok("Fatigue data recorded successfully");
+        } catch (IllegalArgumentException e) {
+            return ResponseEntity.status(HttpStatus.BAD_REQUEST).body("Invalid fatigue data: " + e.getMessage());
         } catch (Exception e) {
-            return ResponseEntity.status(HttpStatus.BAD_REQUEST).body("Failed to record fatigue data: " + e.getMessage());
+            // Storage failures are transient; a 5xx tells the event spool to retry
+            return ResponseEntity.status(HttpStatus.SERVICE_UNAVAILABLE).body("Failed to record fatigue data: " + e.getMessage());
         }
     }
 
     @PostMapping("/headpose")
-    public ResponseEntity<?> recordHeadPoseData(@RequestBody HeadPoseDataRequest request) {
+    public ResponseEntity<?> recordHeadPoseData(@RequestBody HeadPoseDataRequest request,
+                                                @RequestHeader(value = "Idempotency-Key", required = false) String idempotencyKey) {
         try {
-            analyticsService.recordHeadPoseData(request);
+            analyticsService.recordHeadPoseData(request, idempotencyKey);
             return ResponseEntity.ok("Head pose data recorded successfully");
+        } catch (IllegalArgumentException e) {
+            return ResponseEntity.status(HttpStatus.BAD_REQUEST).body("Invalid head pose data: " + e.getMessage());
         } catch (Exception e) {
-            return ResponseEntity.status(HttpStatus.BAD_REQUEST).body("Failed to record head pose data: " + e.getMessage());
+            // Storage failures are transient; a 5xx tells the event spool to retry
+            return ResponseEntity.status(HttpStatus.SERVICE_UNAVAILABLE).body("Failed to record head pose data: " + e.getMessage());
         }
     }
 
@@ -13,6 +13,8 @@ import com.example.learn.repository.EmotionRepository;
 import com.example.learn.repository.FatigueRepository;
 import com.example.learn.repository.HeadPoseRepository;
 import com.example.learn.repository.MeetingAnalyticsSnapshotRepository;
+import org.slf4j.Logger;
+import org.slf4j.LoggerFactory;
 import org.springframework.beans.factory.annotation.Autowired;
 import org.springframework.stereotype.Service;
 
@@ -26,6 +28,8 @@ import java.util.stream.Collectors;
 @Service
 public class AnalyticsService {
 
+    private static final Logger logger = LoggerFactory.getLogger(AnalyticsService.class);
+
     @Autowired
     private EmotionRepository emotionRepository;
 
@@ -41,56 +45,85 @@ public class AnalyticsService {
     @Autowired
     private AttendanceRepository attendanceRepository;
 
-    public void recordEmotionData(EmotionDataRequest request) {
+    public void recordEmotionData(EmotionDataRequest request, String idempotencyKey) {
+        requireParticipant(request.getMeetingId(), request.getParticipantId());
+        String id = entryId(idempotencyKey);
+        // A redelivered event was applied already; applying it again could overwrite newer state
+        if (emotionRepository.existsById(id)) {
+            return;
+        }
+
+        // Update attendance record - find by participantId, not by ID
+        attendanceRepository.findByMeetingIdAndParticipantEmail(request.getMeetingId(), request.getParticipantId())
+                .ifPresentOrElse(record -> {
+                    record.setCurrentEmotion(request.getEmotion());
+
+                    // Recalculate engagement score
+                    Double engagementScore = calculateEngagementScore(
+                        request.getEmotion(),
+                        record.getCurrentEngagement()
+                    );
+                    record.setEngagementScore(engagementScore);
+
+                    attendanceRepository.save(record);
+                }, () -> logger.warn("No attendance record yet for {} in meeting {}; storing the emotion entry only",
+                        request.getParticipantId(), request.getMeetingId()));
+
+        // Saved last: the entry marks the event as applied
         EmotionEntry entry = new EmotionEntry();
-        entry.setId(UUID.randomUUID().toString());
+        entry.setId(id);
         entry.setMeetingId(request.getMeetingId());
         entry.setParticipantId(request.getParticipantId());
         entry.setEmotion(request.getEmotion());
         entry.setTimestamp(request.getTimestamp());
         emotionRepository.save(entry);
-
-        // Update attendance record - find by participantId, not by ID
-        AttendanceRecord record = attendanceRepository.findByMeetingIdAndParticipantEmail(
-                request.getMeetingId(), request.getParticipantId())
-                .orElseThrow(() -> new IllegalArgumentException("Attendance record not found"));
-        
-        record.setCurrentEmotion(request.getEmotion());
-        
-        // Recalculate engagement score
-        Double engagementScore = calculateEngagementScore(
-            request.getEmotion(), 
-            record.getCurrentEngagement()
-        );
-        record.setEngagementScore(engagementScore);
-        
-        attendanceRepository.save(record);
     }
 
-    public void recordFatigueData(FatigueDataRequest request) {
+    public void recordFatigueData(FatigueDataRequest request, String idempotencyKey) {
+        requireParticipant(request.getMeetingId(), request.getParticipantId());
+        String id = entryId(idempotencyKey);
+        // A redelivered event was applied already; applying it again could overwrite newer state
+        if (fatigueRepository.existsById(id)) {
+            return;
+        }
+
+        // Update attendance record - find by participantId, not by ID
+        attendanceRepository.findByMeetingIdAndParticipantEmail(request.getMeetingId(), request.getParticipantId())
+                .ifPresentOrElse(record -> {
+                    record.setCurrentEngagement(request.getFatigueStatus());
+
+                    // Recalculate engagement score
+                    Double engagementScore = calculateEngagementScore(
+                        record.getCurrentEmotion(),
+                        request.getFatigueStatus()
+                    );
+                    record.setEngagementScore(engagementScore);
+
+                    attendanceRepository.save(record);
+                }, () -> logger.warn("No attendance record yet for {} in meeting {}; storing the fatigue entry only",
+                        request.getParticipantId(), request.getMeetingId()));
+
+        // Saved last: the entry marks the event as applied
         FatigueEntry entry = new FatigueEntry();
-        entry.setId(UUID.randomUUID().toString());
+        entry.setId(id);
         entry.setMeetingId(request.getMeetingId());
         entry.setParticipantId(request.getParticipantId());
         entry.setFatigueStatus(request.getFatigueStatus());
         entry.setTimestamp(request.getTimestamp());
         fatigueRepository.save(entry);
+    }
 
-        // Update attendance record - find by participantId, not by ID
-        AttendanceRecord record = attendanceRepository.findByMeetingIdAndParticipantEmail(
-                request.getMeetingId(), request.getParticipantId())
-                .orElseThrow(() -> new IllegalArgumentException("Attendance record not found"));
-        
-        record.setCurrentEngagement(request.getFatigueStatus());
-        
-        // Recalculate engagement score
-        Double engagementScore = calculateEngagementScore(
-            record.getCurrentEmotion(), 
-            request.getFatigueStatus()
-        );
-        record.setEngagementScore(engagementScore);
-        
-        attendanceRepository.save(record);
+    // Malformed events are rejected with IllegalArgumentException, which the controller answers with 400
+    private void requireParticipant(String meetingId, String participantId) {
+        if (meetingId == null || meetingId.isBlank() || participantId == null || participantId.isBlank()) {
+            throw new IllegalArgumentException("meetingId and participantId are required");
+        }
+    }
+
+    // Replayed events carry the same Idempotency-Key, so using it as the document
+    // id turns a redelivery into an overwrite instead of a duplicate entry.
+    private String entryId(String idempotencyKey) {
+        return idempotencyKey != null && !idempotencyKey.isBlank() ? idempotencyKey : UUID.randomUUID().toString();
     }
 
     private Double calculateEngagementScore(String emotion, String fatigueStatus) {
@@ -113,9 +146,10 @@ public class AnalyticsService {
         return Math.min(Math.max(baseScore, 0.0), 1.0);
     }
 
-    public void recordHeadPoseData(HeadPoseDataRequest request) {
+    public void recordHeadPoseData(HeadPoseDataRequest request, String idempotencyKey) {
+        requireParticipant(request.getMeetingId(), request.getParticipantId());
         HeadPoseEntry entry = new HeadPoseEntry();
-        entry.setId(UUID.randomUUID().toString());
+        entry.setId(entryId(idempotencyKey));
         entry.setMeetingId(request.getMeetingId());
         entry.setParticipantId(request.getParticipantId());
         entry.setYaw(request.getYaw());
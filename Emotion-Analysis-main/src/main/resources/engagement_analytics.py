@@ -0,0 +1,253 @@
+"""Offline engagement analytics over exported emotion, fatigue and head pose records.
+
+Exports of the ``emotion_entries``, ``fatigue_entries`` and ``head_pose_entries``
+collections (JSONL or CSV) are read in chunks and folded into per-window
+partial sums, so memory is bounded by the number of (meeting, participant,
+window) cells rather than the number of rows. Timelines, attention ratios and
+fatigue onset are then derived from those sums with vectorized pandas ops.
+
+Usage:
+    python engagement_analytics.py --emotion emotions.jsonl --fatigue fatigue.csv \\
+        --headpose headpose.jsonl --window 1min --out analytics/
+"""
+import argparse
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Same weights as AnalyticsService.calculateEngagementScore on the Spring side
+EMOTION_SCORES = {
+    "happy": 0.8,
+    "neutral": 0.5,
+    "sad": 0.2,
+    "surprise": 0.6,
+    "anger": 0.3
+}
+DEFAULT_EMOTION_SCORE = 0.5
+FATIGUE_ADJUSTMENT = 0.1
+
+# A participant counts as attending to the screen while the head is within these angles
+ATTENTION_YAW_LIMIT = 30.0
+ATTENTION_PITCH_LIMIT = 20.0
+
+KEYS = ["meetingId", "participantId", "window"]
+COUNT_COLUMNS = ["emotion_count", "sleepy_count", "alert_count", "fatigue_count", "attentive_count", "headpose_count"]
+KIND_COLUMNS = {
+    "emotion": ["emotion"],
+    "fatigue": ["fatigueStatus"],
+    "headpose": ["yaw", "pitch", "roll"]
+}
+
+
+def detect_kind(columns):
+    """Guess the record type of an export from its columns"""
+    for kind, required in KIND_COLUMNS.items():
+        if all(c in columns for c in required):
+            return kind
+    raise ValueError(f"Cannot tell record type from columns {list(columns)}")
+
+
+def _parse_timestamps(series):
+    # mongoexport writes {"$date": ...}; the REST API writes ISO strings
+    if series.dtype == object and len(series) and isinstance(series.iloc[0], dict):
+        series = series.map(lambda v: v.get("$date") if isinstance(v, dict) else v)
+    return pd.to_datetime(series, errors="coerce", utc=True).dt.tz_localize(None)
+
+
+def read_events(path, kind=None, chunksize=500_000):
+    """Yield normalized DataFrame chunks from a JSONL or CSV export"""
+    if path.endswith((".jsonl", ".json", ".ndjson")):
+        reader = pd.read_json(path, lines=True, chunksize=chunksize, dtype=False)
+    else:
+        reader = pd.read_csv(path, chunksize=chunksize)
+
+    for chunk in reader:
+        chunk_kind = kind or detect_kind(chunk.columns)
+        chunk = chunk[["meetingId", "participantId", "timestamp"] + KIND_COLUMNS[chunk_kind]]
+        chunk = chunk.assign(timestamp=_parse_timestamps(chunk["timestamp"]))
+        chunk = chunk.dropna(subset=["meetingId", "participantId", "timestamp"])
+        yield chunk_kind, chunk
+
+
+def aggregate_chunk(chunk, kind, window):
+    """Reduce one chunk of records to per-window sums and counts"""
+    frame = pd.DataFrame({
+        "meetingId": chunk["meetingId"].astype(str).values,
+        "participantId": chunk["participantId"].astype(str).values,
+        "window": chunk["timestamp"].dt.floor(window).values
+    })
+
+    if kind == "emotion":
+        labels = chunk["emotion"].astype(str).str.lower()
+        frame["emotion_score_sum"] = labels.map(EMOTION_SCORES).fillna(DEFAULT_EMOTION_SCORE).values
+        frame["emotion_count"] = 1
+    elif kind == "fatigue":
+        status = chunk["fatigueStatus"].astype(str).values
+        frame["sleepy_count"] = (status == "Sleepy").astype(np.int64)
+        frame["alert_count"] = (status == "Alert").astype(np.int64)
+        frame["fatigue_count"] = 1
+    else:
+        yaw = chunk["yaw"].to_numpy(dtype=np.float64)
+        pitch = chunk["pitch"].to_numpy(dtype=np.float64)
+        frame["attentive_count"] = ((np.abs(yaw) <= ATTENTION_YAW_LIMIT) &
+                                    (np.abs(pitch) <= ATTENTION_PITCH_LIMIT)).astype(np.int64)
+        frame["headpose_count"] = 1
+
+    return frame.groupby(KEYS, sort=False, observed=True).sum()
+
+
+class EngagementAnalytics:
+    """Accumulates exported records into windowed sums and derives engagement metrics"""
+
+    def __init__(self, window="1min", chunksize=500_000, compact_every=8):
+        self.window = window
+        self.chunksize = chunksize
+        self.compact_every = compact_every
+        self._partials = []
+        self._totals = None
+        self.rows_read = 0
+
+    def add_file(self, path, kind=None):
+        """Fold an export file into the running aggregates"""
+        for chunk_kind, chunk in read_events(path, kind, self.chunksize):
+            self._partials.append(aggregate_chunk(chunk, chunk_kind, self.window))
+            self.rows_read += len(chunk)
+            if len(self._partials) >= self.compact_every:
+                self._compact()
+        logger.info(f"Read {path}: {self.rows_read} rows so far")
+        return self
+
+    def _compact(self):
+        parts = self._partials if self._totals is None else [self._totals] + self._partials
+        # Different record types contribute different columns; missing counts are zero
+        self._totals = pd.concat(parts).fillna(0).groupby(level=KEYS, sort=False).sum()
+        self._partials = []
+
+    def windows(self):
+        """Per-participant windowed sums, sorted by meeting, participant and time"""
+        if self._totals is None and not self._partials:
+            raise ValueError("No records loaded")
+        if self._partials:
+            self._compact()
+        totals = self._totals.reindex(columns=["emotion_score_sum"] + COUNT_COLUMNS, fill_value=0)
+        # fillna(0) during compaction turns the counts into floats
+        totals[COUNT_COLUMNS] = totals[COUNT_COLUMNS].astype(np.int64)
+        return totals.sort_index()
+
+    def participant_timelines(self, smooth=1):
+        """Engagement timeline per meeting and participant, one row per window with data"""
+        w = self.windows()
+        emotion_count = w["emotion_count"].to_numpy(dtype=np.float64)
+        fatigue_count = w["fatigue_count"].to_numpy(dtype=np.float64)
+        headpose_count = w["headpose_count"].to_numpy(dtype=np.float64)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            emotion_score = np.where(emotion_count > 0, w["emotion_score_sum"] / emotion_count, np.nan)
+            sleepy_ratio = np.where(fatigue_count > 0, w["sleepy_count"] / fatigue_count, np.nan)
+            alert_ratio = np.where(fatigue_count > 0, w["alert_count"] / fatigue_count, np.nan)
+            attention_ratio = np.where(headpose_count > 0, w["attentive_count"] / headpose_count, np.nan)
+
+        adjustment = FATIGUE_ADJUSTMENT * np.nan_to_num(alert_ratio - sleepy_ratio)
+        engagement = np.clip(np.nan_to_num(emotion_score, nan=DEFAULT_EMOTION_SCORE) + adjustment, 0.0, 1.0)
+
+        timeline = pd.DataFrame({
+            "emotion_score": emotion_score,
+            "sleepy_ratio": sleepy_ratio,
+            "attention_ratio": attention_ratio,
+            "engagement": engagement
+        }, index=w.index)
+
+        if smooth > 1:
+            rolled = (timeline.groupby(level=["meetingId", "participantId"], sort=False)["engagement"]
+                      .rolling(smooth, min_periods=1).mean())
+            timeline["engagement"] = rolled.droplevel([0, 1]).reindex(timeline.index).to_numpy()
+        return timeline
+
+    def meeting_timelines(self, smooth=1):
+        """Engagement timeline per meeting, averaged over the participants present in each window"""
+        w = self.windows()
+        timeline = self.participant_timelines(smooth)
+        grouped = timeline.groupby(level=["meetingId", "window"], sort=True)
+        counts = w.groupby(level=["meetingId", "window"], sort=True)[["attentive_count", "headpose_count"]].sum()
+
+        result = grouped.agg(
+            engagement=("engagement", "mean"),
+            sleepy_ratio=("sleepy_ratio", "mean"),
+            participants=("engagement", "size")
+        )
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result["attention_ratio"] = np.where(counts["headpose_count"] > 0,
+                                                 counts["attentive_count"] / counts["headpose_count"], np.nan)
+        return result
+
+    def attention_ratios(self):
+        """Share of head pose samples facing the screen, per meeting and participant"""
+        totals = self.windows().groupby(level=["meetingId", "participantId"], sort=True)[
+            ["attentive_count", "headpose_count"]].sum()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            ratio = np.where(totals["headpose_count"] > 0, totals["attentive_count"] / totals["headpose_count"], np.nan)
+        return pd.DataFrame({"attention_ratio": ratio, "samples": totals["headpose_count"]}, index=totals.index)
+
+    def fatigue_onset(self, threshold=0.5, sustain=3):
+        """First window of the first run of `sustain` consecutive sleepy windows, per meeting and participant.
+
+        A window is sleepy when at least `threshold` of its fatigue samples are "Sleepy".
+        Windows are consecutive only when adjacent in time, so a gap without
+        fatigue samples ends a run. Participants who never cross the threshold
+        are omitted.
+        """
+        timeline = self.participant_timelines()
+        timeline = timeline[timeline["sleepy_ratio"].notna()]
+        if timeline.empty:
+            return pd.DataFrame(columns=["fatigue_onset"])
+
+        # Rows are sorted by (meeting, participant, window), so each participant is a
+        # contiguous run and a rolling sum over `sustain` rows only counts when the row
+        # `sustain - 1` back still belongs to the same participant and lies exactly
+        # `sustain - 1` windows earlier, i.e. no window in between is missing.
+        sleepy = (timeline["sleepy_ratio"].to_numpy() >= threshold).astype(np.int64)
+        group = timeline.groupby(level=["meetingId", "participantId"], sort=False).ngroup().to_numpy()
+        windows = timeline.index.get_level_values("window")
+        times = windows.to_numpy()
+        span = np.timedelta64(pd.Timedelta(self.window) * (sustain - 1))
+        csum = np.concatenate([[0], np.cumsum(sleepy)])
+        idx = np.arange(sustain - 1, len(sleepy))
+        start = idx - sustain + 1
+        hits = idx[((csum[idx + 1] - csum[idx + 1 - sustain]) == sustain) & (group[idx] == group[start]) &
+                   (times[idx] - times[start] == span)]
+
+        onsets = pd.DataFrame({"fatigue_onset": windows[hits - sustain + 1]}, index=timeline.index[hits].droplevel("window"))
+        return onsets.groupby(level=["meetingId", "participantId"], sort=True).first()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute engagement analytics from exported records")
+    parser.add_argument("--emotion", nargs="*", default=[], help="EmotionEntry exports (JSONL or CSV)")
+    parser.add_argument("--fatigue", nargs="*", default=[], help="FatigueEntry exports (JSONL or CSV)")
+    parser.add_argument("--headpose", nargs="*", default=[], help="HeadPoseEntry exports (JSONL or CSV)")
+    parser.add_argument("--window", default="1min", help="Timeline window size (pandas offset alias)")
+    parser.add_argument("--smooth", type=int, default=1, help="Rolling mean over this many windows")
+    parser.add_argument("--chunksize", type=int, default=500_000)
+    parser.add_argument("--out", default="analytics", help="Output directory for CSV results")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    analytics = EngagementAnalytics(window=args.window, chunksize=args.chunksize)
+    for kind in ("emotion", "fatigue", "headpose"):
+        for path in getattr(args, kind):
+            analytics.add_file(path, kind)
+
+    os.makedirs(args.out, exist_ok=True)
+    analytics.participant_timelines(args.smooth).to_csv(os.path.join(args.out, "participant_timelines.csv"))
+    analytics.meeting_timelines(args.smooth).to_csv(os.path.join(args.out, "meeting_timelines.csv"))
+    analytics.attention_ratios().to_csv(os.path.join(args.out, "attention_ratios.csv"))
+    analytics.fatigue_onset().to_csv(os.path.join(args.out, "fatigue_onset.csv"))
+    logger.info(f"Processed {analytics.rows_read} rows into {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,19 @@
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, request, jsonify, render_template, Response
 from flask_cors import CORS
-from openvino.runtime import Core
+from openvino.runtime import Core, Dimension, PartialShape
 import cv2
 import numpy as np
 import base64
-import io
-from PIL import Image
 import requests
 import logging
 from datetime import datetime
 import os
+import hmac
+from concurrent.futures import ThreadPoolExecutor
+from capture_policy import CAPTURE_POLICIES, CaptureHints
+from event_spool import REJECTED, EventSpool
+from frame_decode import DETECTOR_SIZE, DecodedFrame
+from sampling_profiler import ProfilerBusy, SamplingProfiler
 
 app = Flask(__name__)
 CORS(app)
@@ -28,10 +32,53 @@ logger = logging.getLogger(__name__)
 
 # Backend API configuration
 BACKEND_BASE_URL = "http://localhost:8080/api/analytics"
+BACKEND_TIMEOUT = 5  # seconds per delivery attempt
+
+# Analytics events are spooled to disk and replayed to the backend in order,
+# so a slow or unavailable backend never holds up frame analysis.
+SPOOL_DIR = os.environ.get("EVENT_SPOOL_DIR", "spool")
+SPOOL_SEGMENT_BYTES = 4 * 1024 * 1024
+SPOOL_MAX_BYTES = int(os.environ.get("EVENT_SPOOL_MAX_BYTES", 256 * 1024 * 1024))
+
+# Capture interval hints returned with every result ("fixed" restores the old 5050 ms cadence)
+CAPTURE_POLICY = os.environ.get("CAPTURE_POLICY", "load_aware")
+capture_hints = CaptureHints(CAPTURE_POLICIES[CAPTURE_POLICY]())
+
+# Batch inference limits for /analyze_batch
+MAX_BATCH_FRAMES = int(os.environ.get("MAX_BATCH_FRAMES", 32))
+MAX_INFER_BATCH = int(os.environ.get("MAX_INFER_BATCH", 16))
+
+# On-demand stack sampling at /debug/profile, disabled unless a token is configured
+PROFILER_TOKEN = os.environ.get("PROFILER_TOKEN")
+PROFILER_MAX_SECONDS = 60
+PROFILER_MAX_HZ = 1000
+profiler = SamplingProfiler({
+    "analyze_frame": {"engagement_detection:analyze_frame", "engagement_detection:analyze_frames"},
+    "decode": {"engagement_detection:decode_image", "frame_decode:__init__", "frame_decode:full", "frame_decode:crop"},
+    "model_calls": {"engagement_detection:infer_batch", "engagement_detection:detect_faces"},
+    "send_to_backend": {"engagement_detection:send_to_backend", "engagement_detection:send_events_to_backend",
+                        "engagement_detection:post_to_backend"}
+})
 
 # Initialize OpenVINO
 core = Core()
 
+
+def compile_batched(model):
+    """Compile a copy of the model with a dynamic batch dimension, or None if it cannot be reshaped"""
+    try:
+        batched = model.clone()
+        shapes = {}
+        for model_input in batched.inputs:
+            dims = model_input.get_partial_shape()
+            shapes[model_input] = PartialShape([Dimension(-1)] + [dims[i] for i in range(1, dims.rank.get_length())])
+        batched.reshape(shapes)
+        return core.compile_model(batched, "CPU")
+    except Exception as e:
+        logger.warning(f"Model {model.get_friendly_name()} cannot run dynamic batches, falling back to per-sample calls: {e}")
+        return None
+
+
 # Load models
 try:
     fd = core.read_model("static/face_detection/face-detection-adas-0001.xml")
@@ -49,142 +96,272 @@ try:
     gaze_out = gaze_net.output(0)
     hp_outs = hp_net.outputs
 
+    fd_batch_net = compile_batched(fd)
+    em_batch_net = compile_batched(em)
+    gaze_batch_net = compile_batched(gaze)
+    hp_batch_net = compile_batched(head_pose)
+
     emotion_labels = ['neutral', 'happy', 'sad', 'surprise', 'anger']
     logger.info("OpenVINO models loaded successfully")
 
 except Exception as e:
     logger.error(f"Error loading OpenVINO models: {e}")
     fd_net = em_net = gaze_net = hp_net = None
+    fd_batch_net = em_batch_net = gaze_batch_net = hp_batch_net = None
 
+# Frame decoding is mostly native code, so threads decode a batch in parallel
+decode_pool = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 4), thread_name_prefix="decode")
 
-def send_to_backend(endpoint, data):
+
+# Statuses that mean the backend refused the event itself; anything else is retried
+PERMANENT_REJECTIONS = {400, 409, 422}
+
+
+def post_to_backend(endpoint, data, event_id):
+    """Deliver one spooled event; returns False when it should be retried later and REJECTED when it never can be"""
     try:
-        response = requests.post(f"{BACKEND_BASE_URL}/{endpoint}", json=data)
-        if response.status_code == 200:
-            logger.info(f"Data sent to /{endpoint}: {data}")
-            return True
-        else:
-            logger.error(f"Failed to send to /{endpoint} | {response.status_code}: {response.text}")
-            return False
+        response = requests.post(
+            f"{BACKEND_BASE_URL}/{endpoint}",
+            json=data,
+            headers={"Idempotency-Key": event_id},
+            timeout=BACKEND_TIMEOUT
+        )
     except Exception as e:
         logger.error(f"Error sending data to backend: {e}")
         return False
 
+    if response.status_code == 200:
+        logger.info(f"Data sent to /{endpoint}: {data}")
+        return True
+    if response.status_code in PERMANENT_REJECTIONS:
+        # The backend rejected the event itself; retrying would block the spool forever
+        logger.error(f"Backend rejected /{endpoint} event {event_id} | {response.status_code}: {response.text}")
+        return REJECTED
+    logger.error(f"Failed to send to /{endpoint} | {response.status_code}: {response.text}")
+    return False
+
+
+event_spool = EventSpool(
+    SPOOL_DIR,
+    post_to_backend,
+    segment_bytes=SPOOL_SEGMENT_BYTES,
+    max_bytes=SPOOL_MAX_BYTES
+)
 
-def analyze_frame(frame, meeting_id, participant_id):
-    if fd_net is None:
-        return {"emotion": "Model not loaded", "fatigue": "Model not loaded", "head_pose": {}}
 
+def send_to_backend(endpoint, data):
     try:
-        h, w = frame.shape[:2]
-        blob = cv2.resize(frame, (672, 384)).transpose((2, 0, 1))[np.newaxis].astype(np.float32)
-        detections = fd_net([blob])[fd_out]
+        event_spool.append(endpoint, data)
+        return True
+    except Exception as e:
+        logger.error(f"Error spooling data for /{endpoint}: {e}")
+        return False
 
-        results = []
-        timestamp = datetime.now().isoformat()
 
-        for det in detections[0][0]:
-            if det[2] < 0.6:
-                continue
+def send_events_to_backend(events):
+    """Spool a list of (endpoint, data) events as one bulk write"""
+    if not events:
+        return True
+    try:
+        event_spool.append_many(events)
+        return True
+    except Exception as e:
+        logger.error(f"Error spooling {len(events)} events: {e}")
+        return False
+
+
+def infer_batch(net, batch_net, samples):
+    """Run samples through a model as real batches, or one by one if the model has no batch variant.
+
+    Each sample maps model inputs to arrays without the batch axis. Returns one
+    array per model output with the samples stacked along axis 0.
+    """
+    chunks = []
+    if batch_net is not None:
+        for start in range(0, len(samples), MAX_INFER_BATCH):
+            chunk = samples[start:start + MAX_INFER_BATCH]
+            res = batch_net({key: np.stack([s[key] for s in chunk]) for key in chunk[0]})
+            chunks.append([res[out] for out in batch_net.outputs])
+    else:
+        for sample in samples:
+            res = net({key: value[np.newaxis] for key, value in sample.items()})
+            chunks.append([res[out] for out in net.outputs])
+    return [np.concatenate([chunk[i] for chunk in chunks]) for i in range(len(chunks[0]))]
+
+
+def detect_faces(frames):
+    """Detect faces in each DecodedFrame, returning (confidence, native-resolution box) lists, one per frame"""
+    blobs = [cv2.resize(frame.preview, DETECTOR_SIZE).transpose((2, 0, 1)).astype(np.float32) for frame in frames]
+
+    # Batched SSD output is a single [1, 1, K, 7] table whose first column is the image index
+    if fd_batch_net is not None:
+        rows = []
+        for start in range(0, len(blobs), MAX_INFER_BATCH):
+            out = fd_batch_net([np.stack(blobs[start:start + MAX_INFER_BATCH])])[fd_batch_net.output(0)]
+            rows.extend((start + int(det[0]), det) for det in out[0][0] if det[0] >= 0)
+    else:
+        rows = [(i, det) for i, blob in enumerate(blobs) for det in fd_net([blob[np.newaxis]])[fd_out][0][0]]
+
+    faces = [[] for _ in frames]
+    for i, det in rows:
+        if det[2] < 0.6:
+            continue
+
+        faces[i].append((float(det[2]), frames[i].box(det[3], det[4], det[5], det[6])))
+    return faces
+
+
+def eyes_fit(box, eye_h=60, eye_w=60):
+    """Whether a native-resolution face box is large enough for crop_eyes"""
+    xmin, ymin, xmax, ymax = box
+    w, h = xmax - xmin, ymax - ymin
+    return int(w * 0.6) + eye_w <= w and int(h * 0.3) + eye_h <= h
+
+
+def crop_eyes(face, eye_h=60, eye_w=60):
+    """Cut fixed-size left/right eye patches from a face crop, or None if the face is too small"""
+    eye_y = int(face.shape[0] * 0.3)
+    left_eye_x = int(face.shape[1] * 0.2)
+    right_eye_x = int(face.shape[1] * 0.6)
+
+    left_eye = face[eye_y:eye_y+eye_h, left_eye_x:left_eye_x+eye_w]
+    right_eye = face[eye_y:eye_y+eye_h, right_eye_x:right_eye_x+eye_w]
+
+    if left_eye.shape[:2] != (eye_h, eye_w) or right_eye.shape[:2] != (eye_h, eye_w):
+        return None
+    return left_eye, right_eye
 
-            xmin, ymin, xmax, ymax = map(int, [det[3]*w, det[4]*h, det[5]*w, det[6]*h])
-            xmin, ymin = max(0, xmin), max(0, ymin)
-            xmax, ymax = min(w - 1, xmax), min(h - 1, ymax)
 
-            face = frame[ymin:ymax, xmin:xmax]
-            if face.size == 0:
-                continue
+def analyze_frames(frames, meeting_id, participant_ids, timestamps=None):
+    """Analyze several frames with batched model calls, returning one result per frame in order.
 
+    Every face found across all frames goes through emotion, head pose and gaze
+    as one batch per model, and the resulting telemetry is spooled in one write.
+    Frames may be DecodedFrame objects or BGR arrays.
+    """
+    if fd_net is None:
+        return [{"emotion": "Model not loaded", "fatigue": "Model not loaded", "head_pose": {}} for _ in frames]
+
+    try:
+        now = datetime.now().isoformat()
+        timestamps = [ts or now for ts in (timestamps or [None] * len(frames))]
+
+        frames = [f if isinstance(f, DecodedFrame) else DecodedFrame.from_array(f) for f in frames]
+
+        faces = []
+        for i, detections in enumerate(detect_faces(frames)):
+            for confidence, box in detections:
+                if box[2] <= box[0] or box[3] <= box[1]:
+                    continue
+                faces.append((i, confidence, box))
+
+        if faces:
             # Emotion Detection
-            em_blob = cv2.resize(face, (64, 64)).transpose((2, 0, 1))[np.newaxis].astype(np.float32)
-            em_res = em_net([em_blob])[em_out]
-            em_label = emotion_labels[np.argmax(em_res)]
-
-            emotion_data = {
-                "meetingId": meeting_id,
-                "participantId": participant_id,
-                "emotion": em_label,
-                "timestamp": timestamp
-            }
-            send_to_backend("emotion", emotion_data)
+            em_res = infer_batch(em_net, em_batch_net, [
+                {0: cv2.resize(frames[i].crop(box, 64), (64, 64)).transpose((2, 0, 1)).astype(np.float32)}
+                for i, _, box in faces
+            ])[0]
+            em_labels = [emotion_labels[np.argmax(res)] for res in em_res]
 
             # Head Pose
-            hp_blob = cv2.resize(face, (60, 60)).transpose((2, 0, 1))[np.newaxis].astype(np.float32)
-            hp_result = hp_net([hp_blob])
-            yaw = float(hp_result[hp_outs[0]][0][0])
-            pitch = float(hp_result[hp_outs[1]][0][0])
-            roll = float(hp_result[hp_outs[2]][0][0])
-
-            head_pose_data = {
-                "meetingId": meeting_id,
-                "participantId": participant_id,
-                "yaw": yaw,
-                "pitch": pitch,
-                "roll": roll,
-                "timestamp": timestamp
-            }
-            send_to_backend("headpose", head_pose_data)
-
-            # Fatigue Detection
+            hp_res = infer_batch(hp_net, hp_batch_net, [
+                {0: cv2.resize(frames[i].crop(box, 60), (60, 60)).transpose((2, 0, 1)).astype(np.float32)}
+                for i, _, box in faces
+            ])
+            poses = [(float(hp_res[0][k][0]), float(hp_res[1][k][0]), float(hp_res[2][k][0])) for k in range(len(faces))]
+
+        # Fatigue Detection; as with one frame, a face whose fatigue check fails gets no fatigue event
+        fatigue_statuses = ["Unknown"] * len(faces)
+        fatigue_failed = set()
+        gaze_samples, gaze_faces = [], []
+        for k, (i, _, (xmin, ymin, xmax, ymax)) in enumerate(faces):
             try:
-                eye_y = int(face.shape[0] * 0.3)
-                left_eye_x = int(face.shape[1] * 0.2)
-                right_eye_x = int(face.shape[1] * 0.6)
-                eye_h, eye_w = 60, 60
-
-                left_eye = face[eye_y:eye_y+eye_h, left_eye_x:left_eye_x+eye_w]
-                right_eye = face[eye_y:eye_y+eye_h, right_eye_x:right_eye_x+eye_w]
-
-                if left_eye.shape[:2] != (eye_h, eye_w) or right_eye.shape[:2] != (eye_h, eye_w):
-                    fatigue_status = "Unknown"
-                else:
-                    left_blob = left_eye.transpose((2, 0, 1))[np.newaxis].astype(np.float32)
-                    right_blob = right_eye.transpose((2, 0, 1))[np.newaxis].astype(np.float32)
-                    head_pose_angles = np.array([[yaw, pitch, roll]], dtype=np.float32)
-
-                    gaze_inputs = {
-                        "left_eye_image": left_blob,
-                        "right_eye_image": right_blob,
-                        "head_pose_angles": head_pose_angles
-                    }
-
-                    gaze_vec = gaze_net(gaze_inputs)[gaze_out][0]
-                    fatigue_status = "Sleepy" if abs(gaze_vec[1]) > 0.15 else "Alert"
-
-                fatigue_data = {
-                    "meetingId": meeting_id,
-                    "participantId": participant_id,
-                    "fatigueStatus": fatigue_status,
-                    "timestamp": timestamp
-                }
-                send_to_backend("fatigue", fatigue_data)
+                # The gaze model expects fixed-size eye patches at native resolution,
+                # so only decode the full frame for faces that can provide them
+                if not eyes_fit((xmin, ymin, xmax, ymax)):
+                    continue
+                eyes = crop_eyes(frames[i].full[ymin:ymax, xmin:xmax])
+                if eyes is None:
+                    continue
+                gaze_samples.append({
+                    "left_eye_image": eyes[0].transpose((2, 0, 1)).astype(np.float32),
+                    "right_eye_image": eyes[1].transpose((2, 0, 1)).astype(np.float32),
+                    "head_pose_angles": np.array(poses[k], dtype=np.float32)
+                })
+                gaze_faces.append(k)
             except Exception as e:
                 logger.error(f"Fatigue detection error: {e}")
-                fatigue_status = "Unknown"
+                fatigue_failed.add(k)
 
-            results.append({
-                "emotion": em_label,
-                "fatigue": fatigue_status,
+        if gaze_samples:
+            try:
+                gaze_vecs = list(infer_batch(gaze_net, gaze_batch_net, gaze_samples)[0])
+            except Exception as e:
+                # Retry face by face so one bad sample only costs its own fatigue event
+                logger.error(f"Batched fatigue detection error, retrying per face: {e}")
+                gaze_vecs = []
+                for k, sample in zip(gaze_faces, gaze_samples):
+                    try:
+                        gaze_vecs.append(infer_batch(gaze_net, None, [sample])[0][0])
+                    except Exception as e:
+                        logger.error(f"Fatigue detection error: {e}")
+                        fatigue_failed.add(k)
+                        gaze_vecs.append(None)
+            for k, gaze_vec in zip(gaze_faces, gaze_vecs):
+                if gaze_vec is not None:
+                    fatigue_statuses[k] = "Sleepy" if abs(gaze_vec[1]) > 0.15 else "Alert"
+
+        events = []
+        per_frame = [[] for _ in frames]
+        for k, (i, confidence, _) in enumerate(faces):
+            yaw, pitch, roll = poses[k]
+            base = {"meetingId": meeting_id, "participantId": participant_ids[i], "timestamp": timestamps[i]}
+            events.append(("emotion", {**base, "emotion": em_labels[k]}))
+            events.append(("headpose", {**base, "yaw": yaw, "pitch": pitch, "roll": roll}))
+            if k not in fatigue_failed:
+                events.append(("fatigue", {**base, "fatigueStatus": fatigue_statuses[k]}))
+
+            per_frame[i].append({
+                "emotion": em_labels[k],
+                "fatigue": fatigue_statuses[k],
                 "head_pose": {"yaw": yaw, "pitch": pitch, "roll": roll},
-                "confidence": float(det[2])
+                "confidence": confidence
             })
+        send_events_to_backend(events)
 
-        if results:
-            return max(results, key=lambda x: x['confidence'])
-        else:
-            return {
-                "emotion": "No face detected",
-                "fatigue": "No face detected",
-                "head_pose": {"yaw": 0.0, "pitch": 0.0, "roll": 0.0}
-            }
+        results = []
+        for frame_results in per_frame:
+            if frame_results:
+                results.append(max(frame_results, key=lambda x: x['confidence']))
+            else:
+                results.append({
+                    "emotion": "No face detected",
+                    "fatigue": "No face detected",
+                    "head_pose": {"yaw": 0.0, "pitch": 0.0, "roll": 0.0}
+                })
+        return results
 
     except Exception as e:
         logger.error(f"Analysis error: {e}")
-        return {
+        return [{
             "emotion": "Error",
             "fatigue": "Error",
             "head_pose": {"yaw": 0.0, "pitch": 0.0, "roll": 0.0}
-        }
+        } for _ in frames]
+
+
+def analyze_frame(frame, meeting_id, participant_id):
+    return analyze_frames([frame], meeting_id, [participant_id])[0]
+
+
+def decode_image(image):
+    """Decode a base64 (optionally data-URL) image string into a DecodedFrame"""
+    if ',' in image:
+        image_data = base64.b64decode(image.split(',')[1])
+    else:
+        image_data = base64.b64decode(image)
+
+    return DecodedFrame(image_data)
 
 
 @app.route('/')
@@ -199,16 +376,11 @@ def analyze_image():
         if not data or not all(k in data for k in ['image', 'meeting_id', 'participant_id']):
             return jsonify({"error": "Image, meeting_id, and participant_id required"}), 400
 
-        # Decode image from base64
-        if ',' in data['image']:
-            image_data = base64.b64decode(data['image'].split(',')[1])
-        else:
-            image_data = base64.b64decode(data['image'])
+        with capture_hints.track():
+            frame = decode_image(data['image'])
 
-        image = Image.open(io.BytesIO(image_data)).convert('RGB')
-        frame = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-
-        result = analyze_frame(frame, data['meeting_id'], data['participant_id'])
+            result = analyze_frame(frame, data['meeting_id'], data['participant_id'])
+            result["next_capture_ms"] = capture_hints.hint(data['meeting_id'], data['participant_id'], result)
         return jsonify(result)
 
     except Exception as e:
@@ -216,11 +388,92 @@ def analyze_image():
         return jsonify({"error": "Internal server error"}), 500
 
 
+@app.route('/analyze_batch', methods=['POST'])
+def analyze_image_batch():
+    """Analyze several buffered frames of one meeting in a single request.
+
+    Body: {"meeting_id": ..., "frames": [{"image": ..., "participant_id": ..., "timestamp": optional}, ...]}
+    Results come back in the same order as the frames.
+    """
+    try:
+        data = request.get_json()
+        frames = data.get('frames') if data else None
+        if not data or 'meeting_id' not in data or not isinstance(frames, list) or not frames:
+            return jsonify({"error": "meeting_id and a non-empty frames list required"}), 400
+        if len(frames) > MAX_BATCH_FRAMES:
+            return jsonify({"error": f"At most {MAX_BATCH_FRAMES} frames per batch"}), 413
+        if not all(isinstance(f, dict) and 'image' in f and 'participant_id' in f for f in frames):
+            return jsonify({"error": "Each frame requires image and participant_id"}), 400
+
+        def decode_or_none(image):
+            try:
+                return decode_image(image)
+            except Exception as e:
+                logger.warning(f"Could not decode batch frame: {e}")
+                return None
+
+        with capture_hints.track(len(frames)):
+            decoded = list(decode_pool.map(decode_or_none, [f['image'] for f in frames]))
+            valid = [i for i, frame in enumerate(decoded) if frame is not None]
+
+            analyzed = analyze_frames(
+                [decoded[i] for i in valid],
+                data['meeting_id'],
+                [frames[i]['participant_id'] for i in valid],
+                [frames[i].get('timestamp') for i in valid]
+            ) if valid else []
+
+            results = [{"error": "Invalid image"} for _ in frames]
+            for i, result in zip(valid, analyzed):
+                result["next_capture_ms"] = capture_hints.hint(data['meeting_id'], frames[i]['participant_id'], result)
+                results[i] = result
+        return jsonify({"results": results})
+
+    except Exception as e:
+        logger.error(f"Batch analysis error: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
+@app.route('/debug/profile')
+def profile_service():
+    """Sample all thread stacks for a while and return a collapsed-stack profile.
+
+    Query: seconds (default 10), hz (default 100), format=json|collapsed.
+    Requires the X-Profiler-Token header to match PROFILER_TOKEN.
+    """
+    token = request.headers.get('X-Profiler-Token', '')
+    if not PROFILER_TOKEN:
+        return jsonify({"error": "Not found"}), 404
+    if not hmac.compare_digest(token.encode(), PROFILER_TOKEN.encode()):
+        return jsonify({"error": "Unauthorized"}), 401
+
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        hz = int(request.args.get('hz', 100))
+    except ValueError:
+        return jsonify({"error": "seconds and hz must be numbers"}), 400
+    if not 0 < seconds <= PROFILER_MAX_SECONDS or not 0 < hz <= PROFILER_MAX_HZ:
+        return jsonify({"error": f"seconds must be in (0, {PROFILER_MAX_SECONDS}] and hz in (0, {PROFILER_MAX_HZ}]"}), 400
+
+    try:
+        profile = profiler.profile(seconds, hz)
+    except ProfilerBusy as e:
+        return jsonify({"error": str(e)}), 409
+
+    summary = profile.summary()
+    logger.info(f"Profiled {summary['duration_s']}s at {summary['achieved_hz']} Hz, "
+                f"sampler overhead {summary['overhead_pct']}%")
+    if request.args.get('format') == 'collapsed':
+        return Response(profile.collapsed(), mimetype='text/plain')
+    return jsonify({**summary, "collapsed": profile.collapsed()})
+
+
 @app.route('/health')
 def health_check():
     return jsonify({
         "status": "healthy",
         "models_loaded": all([fd_net, em_net, gaze_net, hp_net]),
+        "event_spool": event_spool.stats,
         "timestamp": datetime.now().isoformat()
     })
 
@@ -0,0 +1,418 @@
+"""Segmented on-disk write-ahead log that delivers analytics events to the backend.
+
+Run this module directly to post events while a stand-in backend is killed
+and restarted, and check that every idempotency key reaches it exactly once:
+
+    python event_spool.py
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+CURSOR_FILE = "cursor.json"
+LOCK_FILE = ".lock"
+
+# Returned by a deliver function when the backend refused the event itself, so retrying cannot help
+REJECTED = "rejected"
+
+
+def _try_lock(fh):
+    """Take a non-blocking exclusive lock on an open file, return False if held elsewhere"""
+    try:
+        if fcntl is not None:
+            fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+class EventSpool:
+    """Segmented write-ahead log for backend events.
+
+    Events are appended from request threads without touching the network. A
+    writer thread group-commits queued events to the active segment (one
+    write + fsync per batch) and a replay thread delivers committed events to
+    the backend in order, retrying with backoff while it is unavailable.
+    Delivery is at-least-once; every event carries an id for idempotency.
+    ``deliver(endpoint, data, event_id)`` returns True once the event is
+    stored, False to retry it later, or REJECTED to skip an event the
+    backend will never accept.
+
+    Each process claims its own slot directory under ``base_dir`` so several
+    workers can spool side by side, and a restarted worker picks up the
+    backlog its predecessor left in the same slot.
+    """
+
+    def __init__(self, base_dir, deliver, segment_bytes=4 * 1024 * 1024,
+                 max_bytes=256 * 1024 * 1024, commit_interval=0.05,
+                 max_batch=512, max_backoff=30.0):
+        self.base_dir = base_dir
+        self.deliver = deliver
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.commit_interval = commit_interval
+        self.max_batch = max_batch
+        self.max_backoff = max_backoff
+
+        self.directory = None
+        self._lock_fh = None
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._committed = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+
+        self._segments = []          # segment indices, oldest first
+        self._active = None          # open file handle of the newest segment
+        self._active_size = 0
+        self._cursor = (None, 0)     # (segment index, byte offset) of the next event to deliver
+        self._cursor_saved_at = 0.0
+
+        self.stats = {
+            "appended": 0,
+            "committed": 0,
+            "commits": 0,
+            "delivered": 0,
+            "retries": 0,
+            "rejected": 0,
+            "dropped": 0,
+            "backend_healthy": True,
+        }
+
+    # ------------------------------------------------------------------ setup
+
+    def start(self):
+        """Claim a spool slot, recover its segments and start the background threads"""
+        with self._start_lock:
+            if self._threads:
+                return
+            self._claim_slot()
+            self._recover()
+            for target, name in ((self._writer_loop, "spool-writer"), (self._replay_loop, "spool-replay")):
+                thread = threading.Thread(target=target, name=name, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            logger.info(f"Event spool started in {self.directory} with {len(self._segments)} segment(s)")
+
+    def _claim_slot(self):
+        os.makedirs(self.base_dir, exist_ok=True)
+        slot = 0
+        while True:
+            directory = os.path.join(self.base_dir, f"worker-{slot}")
+            os.makedirs(directory, exist_ok=True)
+            fh = open(os.path.join(directory, LOCK_FILE), "a+")
+            if _try_lock(fh):
+                self.directory, self._lock_fh = directory, fh
+                return
+            fh.close()
+            slot += 1
+
+    def _segment_path(self, index):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{index:08d}{SEGMENT_SUFFIX}")
+
+    def _recover(self):
+        for name in os.listdir(self.directory):
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX):
+                self._segments.append(int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]))
+        self._segments.sort()
+
+        cursor_path = os.path.join(self.directory, CURSOR_FILE)
+        try:
+            with open(cursor_path) as f:
+                saved = json.load(f)
+            self._cursor = (saved["segment"], saved["offset"])
+        except (OSError, ValueError, KeyError):
+            self._cursor = (None, 0)
+        if self._cursor[0] not in self._segments:
+            self._cursor = (self._segments[0] if self._segments else None, 0)
+
+        # Always write into a fresh segment; anything left from a previous run
+        # is sealed and replayed as-is (a torn trailing line is skipped on read).
+        self._open_segment((self._segments[-1] + 1) if self._segments else 0)
+        if self._cursor[0] is None:
+            self._cursor = (self._segments[0], 0)
+
+    def _open_segment(self, index):
+        if self._active is not None:
+            self._active.close()
+        self._active = open(self._segment_path(index), "ab")
+        self._active_size = self._active.tell()
+        self._segments.append(index)
+
+    # ----------------------------------------------------------------- append
+
+    def append(self, endpoint, data):
+        """Queue an event for durable delivery and return its idempotency key"""
+        return self.append_many([(endpoint, data)])[0]
+
+    def append_many(self, events):
+        """Queue (endpoint, data) events to be committed together, returning their idempotency keys"""
+        if not self._threads:
+            self.start()
+        records = [{"id": str(uuid.uuid4()), "endpoint": endpoint, "data": data} for endpoint, data in events]
+        self._queue.put(records)
+        with self._lock:
+            self.stats["appended"] += len(records)
+        return [record["id"] for record in records]
+
+    # ----------------------------------------------------------------- writer
+
+    def _writer_loop(self):
+        while not self._stopping.is_set() or not self._queue.empty():
+            try:
+                batch = list(self._queue.get(timeout=0.5))
+            except queue.Empty:
+                continue
+            # Group commit: give concurrent producers a moment to join the batch
+            deadline = time.monotonic() + self.commit_interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.extend(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._commit(batch)
+            except Exception as e:
+                logger.error(f"Event spool commit failed, {len(batch)} event(s) lost: {e}")
+
+    def _commit(self, batch):
+        payload = b"".join(
+            json.dumps(event, separators=(",", ":"), default=str).encode("utf-8") + b"\n"
+            for event in batch
+        )
+        with self._lock:
+            self._active.write(payload)
+            self._active.flush()
+            os.fsync(self._active.fileno())
+            self._active_size += len(payload)
+            if self._active_size >= self.segment_bytes:
+                self._open_segment(self._segments[-1] + 1)
+            self._enforce_budget()
+            self.stats["committed"] += len(batch)
+            self.stats["commits"] += 1
+        self._committed.set()
+
+    def _enforce_budget(self):
+        sizes = {index: os.path.getsize(self._segment_path(index)) for index in self._segments}
+        total = sum(sizes.values())
+        while total > self.max_bytes and len(self._segments) > 1:
+            oldest = self._segments.pop(0)
+            dropped = self._count_events(oldest, self._cursor[1] if self._cursor[0] == oldest else 0)
+            os.remove(self._segment_path(oldest))
+            total -= sizes[oldest]
+            if self._cursor[0] == oldest:
+                self._cursor = (self._segments[0], 0)
+            self.stats["dropped"] += dropped
+            logger.warning(f"Event spool over {self.max_bytes} bytes, dropped segment {oldest} ({dropped} undelivered event(s))")
+
+    def _count_events(self, index, offset):
+        with open(self._segment_path(index), "rb") as f:
+            f.seek(offset)
+            return sum(1 for _ in f)
+
+    # ----------------------------------------------------------------- replay
+
+    def _next_event(self):
+        """Return (event, next cursor) for the oldest undelivered committed event, or None"""
+        with self._lock:
+            index, offset = self._cursor
+            while True:
+                sealed = index != self._segments[-1]
+                limit = None if sealed else self._active_size
+                if limit is not None and offset >= limit:
+                    return None
+                with open(self._segment_path(index), "rb") as f:
+                    f.seek(offset)
+                    line = f.readline()
+                if line.endswith(b"\n") and (limit is None or offset + len(line) <= limit):
+                    try:
+                        return json.loads(line), (index, offset + len(line))
+                    except ValueError:
+                        logger.warning(f"Skipping corrupt spool record in segment {index} at offset {offset}")
+                        offset += len(line)
+                        self._cursor = (index, offset)
+                        continue
+                if not sealed:
+                    return None
+                # End of a sealed segment (possibly with a torn last line): everything
+                # in it has been delivered, so it can go.
+                self._segments.remove(index)
+                os.remove(self._segment_path(index))
+                index, offset = self._segments[0], 0
+                self._cursor = (index, offset)
+                self._save_cursor(force=True)
+
+    def _replay_loop(self):
+        backoff = 0.5
+        while not self._stopping.is_set():
+            item = self._next_event()
+            if item is None:
+                self._committed.wait(timeout=1.0)
+                self._committed.clear()
+                continue
+            event, next_cursor = item
+            try:
+                done = self.deliver(event["endpoint"], event["data"], event["id"])
+            except Exception as e:
+                logger.error(f"Error delivering spooled event {event['id']}: {e}")
+                done = False
+            if not done:
+                with self._lock:
+                    self.stats["retries"] += 1
+                    self.stats["backend_healthy"] = False
+                self._stopping.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+            backoff = 0.5
+            with self._lock:
+                self.stats["backend_healthy"] = True
+                self.stats["rejected" if done == REJECTED else "delivered"] += 1
+                # The segment may have been dropped by the disk budget meanwhile
+                if self._cursor[0] == next_cursor[0]:
+                    self._cursor = next_cursor
+                self._save_cursor()
+
+    def _save_cursor(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._cursor_saved_at < 0.5:
+            return
+        self._cursor_saved_at = now
+        path = os.path.join(self.directory, CURSOR_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump({"segment": self._cursor[0], "offset": self._cursor[1]}, f)
+        os.replace(path + ".tmp", path)
+
+    # -------------------------------------------------------------- lifecycle
+
+    def close(self, timeout=5.0):
+        """Flush queued events to disk and stop the background threads"""
+        if not self._threads:
+            return
+        self._stopping.set()
+        self._committed.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        with self._lock:
+            self._save_cursor(force=True)
+            self._active.close()
+        self._lock_fh.close()
+        self._threads = []
+
+
+def _stub_backend(port, received_path):
+    """Stand-in analytics backend that stores each Idempotency-Key once, as the service's upsert by id does"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    lock = threading.Lock()
+    seen = set()
+    if os.path.exists(received_path):
+        with open(received_path) as f:
+            seen.update(line.strip() for line in f if line.strip())
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            key = self.headers["Idempotency-Key"]
+            with lock:
+                # A redelivery of a stored key is acknowledged and logged, but not stored again
+                path = received_path if key not in seen else received_path + ".duplicates"
+                seen.add(key)
+                with open(path, "a") as f:
+                    f.write(key + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+            self.send_response(200)
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    ThreadingHTTPServer(("127.0.0.1", port), Handler).serve_forever()
+
+
+def self_check(events=2000, seconds=3.0):
+    """Post events while the stand-in backend is killed and restarted; every key must arrive exactly once"""
+    import multiprocessing
+    import socket
+    import tempfile
+    import urllib.error
+    import urllib.request
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    def deliver(endpoint, data, event_id):
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{port}/{endpoint}", data=json.dumps(data).encode("utf-8"),
+            headers={"Content-Type": "application/json", "Idempotency-Key": event_id}, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=1) as response:
+                return response.status == 200
+        except (urllib.error.URLError, OSError):
+            return False
+
+    with tempfile.TemporaryDirectory() as scratch:
+        received_path = os.path.join(scratch, "received.txt")
+        backend = multiprocessing.Process(target=_stub_backend, args=(port, received_path), daemon=True)
+        backend.start()
+        spool = EventSpool(os.path.join(scratch, "spool"), deliver, max_backoff=0.5)
+        keys = []
+        killed = restarted = False
+        start = time.monotonic()
+        for i in range(events):
+            keys.append(spool.append("emotion", {"seq": i}))
+            elapsed = time.monotonic() - start
+            if not killed and elapsed > seconds / 3:
+                backend.kill()
+                backend.join()
+                killed = True
+                print(f"Backend killed after {spool.stats['delivered']} of {len(keys)} deliveries")
+            if killed and not restarted and elapsed > 2 * seconds / 3:
+                backend = multiprocessing.Process(target=_stub_backend, args=(port, received_path), daemon=True)
+                backend.start()
+                restarted = True
+                print(f"Backend restarted with {len(keys) - spool.stats['delivered']} event(s) waiting")
+            time.sleep(seconds / events)
+
+        deadline = time.monotonic() + 30
+        while spool.stats["delivered"] < len(keys) and time.monotonic() < deadline:
+            time.sleep(0.1)
+        spool.close()
+        backend.kill()
+        backend.join()
+
+        with open(received_path) as f:
+            received = [line.strip() for line in f if line.strip()]
+        redelivered = 0
+        if os.path.exists(received_path + ".duplicates"):
+            with open(received_path + ".duplicates") as f:
+                redelivered = sum(1 for line in f if line.strip())
+    assert sorted(received) == sorted(keys), \
+        f"{len(set(keys) - set(received))} event(s) lost, {len(received) - len(set(received))} stored twice"
+    print(f"{len(keys)} events posted across a backend restart: all {len(received)} delivered exactly once "
+          f"({spool.stats['retries']} retries, {redelivered} redelivered and deduplicated by key)")
+
+
+if __name__ == "__main__":
+    self_check()
@@ -0,0 +1,190 @@
+"""Statistical profiler for a running service.
+
+A sampler walks every thread's Python stack via ``sys._current_frames()`` at a
+fixed rate for a limited time and counts identical stacks. The result is in
+the collapsed-stack format read by flamegraph.pl and speedscope
+(``root;caller;callee <count>`` per line), plus a summary of how many samples
+fell into named groups of functions.
+
+Sampling happens in the calling thread only while a profile is being taken,
+so there is no cost at all between profiles. The time spent sampling is
+measured and reported with every profile.
+
+Run this module directly to measure the slowdown of a CPU-bound workload
+while it is being sampled:
+
+    python sampling_profiler.py
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is running"""
+
+
+class SamplingProfiler:
+    """Samples all thread stacks and aggregates them into collapsed stacks.
+
+    ``groups`` maps a summary name to a set of frame labels
+    (``"module:function"``); a sample counts towards a group when any frame
+    on its stack carries one of those labels.
+    """
+
+    def __init__(self, groups=None, max_depth=128):
+        self.groups = groups or {}
+        self.max_depth = max_depth
+        self._labels = {}  # code object -> "module:function"
+        self._lock = threading.Lock()
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            module = os.path.splitext(os.path.basename(code.co_filename))[0]
+            label = f"{module}:{code.co_name}"
+            self._labels[code] = label
+        return label
+
+    def _stack(self, frame):
+        labels = []
+        while frame is not None and len(labels) < self.max_depth:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        labels.reverse()
+        return tuple(labels)
+
+    def profile(self, seconds, hz=100):
+        """Sample every other thread for `seconds` at `hz` and return the aggregated profile"""
+        if not self._lock.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        try:
+            return self._sample(seconds, hz)
+        finally:
+            self._lock.release()
+
+    def _sample(self, seconds, hz):
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        stacks = Counter()
+        interval = 1.0 / hz
+        samples = 0
+        sampling_time = 0.0
+
+        start = time.perf_counter()
+        deadline = start + seconds
+        next_tick = start
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            if now < next_tick:
+                time.sleep(next_tick - now)
+                continue
+            tick_start = time.perf_counter()
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if ident not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                thread = names.get(ident, f"thread-{ident}")
+                stacks[(thread,) + self._stack(frame)] += 1
+            del frame
+            sampling_time += time.perf_counter() - tick_start
+            samples += 1
+            # Skip ticks that were missed instead of bursting to catch up
+            next_tick = max(next_tick + interval, tick_start)
+        elapsed = time.perf_counter() - start
+
+        return Profile(stacks, self.groups, samples, elapsed, sampling_time, hz)
+
+
+class Profile:
+    """The outcome of one sampling run"""
+
+    def __init__(self, stacks, groups, samples, elapsed, sampling_time, hz):
+        self.stacks = stacks
+        self.groups = groups
+        self.samples = samples
+        self.elapsed = elapsed
+        self.sampling_time = sampling_time
+        self.hz = hz
+
+    def collapsed(self):
+        """Collapsed-stack text, one ``thread;frame;...;frame count`` line per distinct stack"""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self):
+        """Samples and estimated thread-seconds per group, over all sampled threads"""
+        counts = Counter()
+        for stack, count in self.stacks.items():
+            frames = set(stack[1:])
+            for name, labels in self.groups.items():
+                if frames & labels:
+                    counts[name] += count
+
+        seconds_per_sample = self.elapsed / self.samples if self.samples else 0.0
+        return {
+            "duration_s": round(self.elapsed, 3),
+            "hz": self.hz,
+            "samples": self.samples,
+            # Below the requested rate when busy threads hold the GIL past the sampling interval
+            "achieved_hz": round(self.samples / self.elapsed, 1) if self.elapsed else 0.0,
+            "stack_samples": sum(self.stacks.values()),
+            # Share of one core spent walking stacks, which also holds the GIL
+            "overhead_pct": round(100.0 * self.sampling_time / self.elapsed, 3) if self.elapsed else 0.0,
+            "groups": {
+                name: {"samples": counts[name], "thread_seconds": round(counts[name] * seconds_per_sample, 3)}
+                for name in self.groups
+            }
+        }
+
+
+def _busy_work(stop, done):
+    # Pure-Python loop so every sample competes with it for the GIL
+    total = 0
+    while not stop.is_set():
+        for i in range(10000):
+            total += i * i
+        done[0] += 1
+
+
+def benchmark(seconds=2.0, rates=(50, 100, 500), repeats=5):
+    """Measure workload throughput with and without sampling at several rates (median of interleaved runs)"""
+    def run(hz):
+        stop, done = threading.Event(), [0]
+        workers = [threading.Thread(target=_busy_work, args=(stop, done)) for _ in range(4)]
+        for w in workers:
+            w.start()
+        if hz:
+            profile = SamplingProfiler({"busy": {"sampling_profiler:_busy_work"}}).profile(seconds, hz)
+        else:
+            time.sleep(seconds)
+            profile = None
+        stop.set()
+        for w in workers:
+            w.join()
+        return done[0], profile
+
+    results = {hz: [] for hz in (0,) + tuple(rates)}
+    for _ in range(repeats):
+        for hz in results:
+            results[hz].append(run(hz))
+
+    def median(values):
+        return sorted(values)[len(values) // 2]
+
+    baseline = median([iterations for iterations, _ in results[0]])
+    print(f"no profiler: {baseline} iterations")
+    for hz in rates:
+        iterations = median([i for i, _ in results[hz]])
+        summaries = [profile.summary() for _, profile in results[hz]]
+        print(f"{hz:>4} Hz: {iterations} iterations ({100.0 * (1 - iterations / baseline):+.1f}% slowdown), "
+              f"{median([s['achieved_hz'] for s in summaries])} samples/s achieved, "
+              f"sampler overhead {median([s['overhead_pct'] for s in summaries])}% of a core")
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -44,12 +44,28 @@ interface Submission {
   studentName: string;
   files: { filename: string; path: string; originalName: string }[];
   submittedAt: string;
-  aiGrade: { finalScore: number; percentage: number };
+  // Missing until the grading job finishes
+  aiGrade?: { finalScore?: number; percentage?: number };
+  gradingStatus?: 'pending' | 'done' | 'failed';
+  gradingError?: string;
   teacherGrade?: number;
   teacherFeedback?: string;
   status: 'submitted' | 'graded';
 }
 
+// Submissions graded before grading jobs existed have an aiGrade but no gradingStatus
+const aiGradeLabel = (submission: Submission) => {
+  if (submission.aiGrade?.finalScore !== undefined) {
+    return `${submission.aiGrade.finalScore}/${submission.aiGrade.percentage}%`;
+  }
+  if (submission.gradingStatus === 'failed') {
+    return `Grading failed${submission.gradingError ? `: ${submission.gradingError}` : ''}`;
+  }
+  return 'Grading…';
+};
+
+const GRADING_POLL_MS = 5000;
+
 interface Stats {
   totalAssignments: number;
   submittedAssignments: number;
@@ -59,9 +75,10 @@ interface Stats {
     assignmentTitle: string;
     studentId: string;
     studentName: string;
-    aiGrade: number;
+    aiGrade: number | null;
     teacherGrade?: number;
-    percentage: number;
+    percentage: number | null;
+    gradingStatus: 'pending' | 'done' | 'failed';
   }[];
 }
 
@@ -96,6 +113,14 @@ const Assignments: React.FC = () => {
     fetchStats();
   }, [user, navigate]);
 
+  // Refresh while any AI grade is still being computed
+  const gradingPending = submissions.some(s => s.gradingStatus === 'pending');
+  useEffect(() => {
+    if (!gradingPending) return;
+    const timer = setInterval(() => fetchSubmissions(false), GRADING_POLL_MS);
+    return () => clearInterval(timer);
+  }, [gradingPending]);
+
   const fetchAssignments = async () => {
     try {
       setLoading(true);
@@ -115,9 +140,9 @@ const Assignments: React.FC = () => {
     }
   };
 
-  const fetchSubmissions = async () => {
+  const fetchSubmissions = async (showLoading = true) => {
     try {
-      setLoading(true);
+      if (showLoading) setLoading(true);
       const response = await axios.get(`${API_URL}/submissions`, {
         headers: {
           'x-user-id': user?.id,
@@ -130,7 +155,7 @@ const Assignments: React.FC = () => {
       setError(err.response?.data?.error || 'Failed to fetch submissions');
       toast({ variant: 'destructive', title: 'Error', description: err.response?.data?.error || 'Failed to fetch submissions' });
     } finally {
-      setLoading(false);
+      if (showLoading) setLoading(false);
     }
   };
 
@@ -251,7 +276,7 @@ const Assignments: React.FC = () => {
       setSubmissionFiles(prev => ({ ...prev, [assignmentId]: [] }));
       fetchSubmissions();
       fetchStats();
-      toast({ title: 'Success', description: 'Assignment submitted successfully' });
+      toast({ title: 'Success', description: 'Assignment submitted; AI grading is in progress' });
     } catch (err: any) {
       setError(err.response?.data?.error || 'Failed to submit assignment');
       toast({ variant: 'destructive', title: 'Error', description: err.response?.data?.error || 'Failed to submit assignment' });
@@ -469,7 +494,7 @@ const Assignments: React.FC = () => {
                           Submitted: {new Date(submission.submittedAt).toLocaleString()}
                         </p>
                         <p className="text-sm text-gray-600">
-                          AI Grade: {submission.aiGrade.finalScore}/{submission.aiGrade.percentage}%
+                          AI Grade: {aiGradeLabel(submission)}
                         </p>
                         {submission.status === 'graded' ? (
                           <p className="text-sm text-gray-600">
@@ -559,7 +584,8 @@ const Assignments: React.FC = () => {
                   Deadline: {new Date(assignment.deadline).toLocaleString()}
                 </p>
                 <p className="text-sm text-gray-500">Max Score: {assignment.maxScore}</p>
-                {submissions.some(s => s.assignmentId._id === assignment._id) ? (
+                {/* A submission whose AI grading failed may be submitted again */}
+                {submissions.some(s => s.assignmentId._id === assignment._id && s.gradingStatus !== 'failed') ? (
                   <div className="mt-4 p-4 bg-gray-50 rounded-lg">
                     <p className="text-sm text-gray-600">Status: Submitted</p>
                     {submissions
@@ -567,7 +593,7 @@ const Assignments: React.FC = () => {
                       .map(s => (
                         <div key={s._id}>
                           <p className="text-sm text-gray-600">
-                            AI Grade: {s.aiGrade.finalScore}/{s.aiGrade.percentage}%
+                            AI Grade: {aiGradeLabel(s)}
                           </p>
                           {s.status === 'graded' && (
                             <p className="text-sm text-gray-600">
@@ -579,6 +605,13 @@ const Assignments: React.FC = () => {
                   </div>
                 ) : (
                   <div className="mt-4 space-y-2">
+                    {submissions
+                      .filter(s => s.assignmentId._id === assignment._id)
+                      .map(s => (
+                        <p key={s._id} className="text-sm text-red-600">
+                          AI Grade: {aiGradeLabel(s)}. Please submit again.
+                        </p>
+                      ))}
                     <Label>Upload Submission</Label>
                     <Input
                       type="file"
@@ -31,9 +31,10 @@ interface Report {
   studentId: string;
   studentName: string;
   reportPath: string;
-  aiGrade: {
-    finalScore: number;
-    percentage: number;
+  // Missing until the grading job finishes
+  aiGrade?: {
+    finalScore?: number;
+    percentage?: number;
     scoreBreakdown: any;
     qualityMetrics: any;
     styleMetrics: any;
@@ -41,6 +42,8 @@ interface Report {
     sentimentAnalysis: any;
     comprehensiveFeedback: any;
   };
+  gradingStatus: 'pending' | 'done' | 'failed';
+  gradingError?: string;
   submittedAt: string;
 }
 
@@ -315,12 +318,18 @@ const chartOptions = {
                     Submitted: {new Date(report.submittedAt).toLocaleString()}
                   </p>
                   <p className="text-sm text-gray-500 mb-4">
-                    AI Grade: <span className="font-medium text-blue-600">{report.aiGrade.finalScore}</span>/{report.aiGrade.percentage}%
+                    {report.gradingStatus === 'done' && report.aiGrade?.finalScore !== undefined ? (
+                      <>AI Grade: <span className="font-medium text-blue-600">{report.aiGrade.finalScore}</span>/{report.aiGrade.percentage}%</>
+                    ) : report.gradingStatus === 'failed' ? (
+                      <span className="text-red-600">AI grading failed{report.gradingError ? `: ${report.gradingError}` : ''}</span>
+                    ) : (
+                      <>AI Grade: grading…</>
+                    )}
                   </p>
                   <Button
                     className="bg-blue-600 hover:bg-blue-700 text-white rounded-lg px-4 py-2 w-full transition-colors duration-200"
                     onClick={() => fetchReportDetails(report.submissionId)}
-                    disabled={loading}
+                    disabled={loading || report.gradingStatus !== 'done'}
                   >
                     View Full Report
                   </Button>